@@ -0,0 +1,156 @@
+"""Поток server-sent events /api/events/ для текущего пользователя.
+
+Клиент получает небольшие события об изменении избранного, корзины и
+подписок (recipes/sync.py) вместо периодического перезапроса списка
+рецептов:
+
+    id: 1042-123
+    event: favorite
+    data: {"id": "1042-123", "type": "favorite", "recipe_id": 5, "active": true}
+
+EventSource в браузере не передаёт заголовок Authorization, поэтому поток
+принимает и ?token= — короткоживущий токен из POST /api/events/token/.
+Он подписан (django.core.signing), годится только для потока и перестаёт
+действовать вместе с API-токеном пользователя; сам API-токен в URL (и в
+журнал nginx) не попадает.
+
+event: resync значит, что часть событий потеряна и состояние нужно
+перечитать. Раз в EVENTS_HEARTBEAT_SECONDS приходит комментарий ": ping",
+через EVENTS_MAX_STREAM_SECONDS поток закрывается и клиент переподключается
+с Last-Event-ID (Django 4.2 не прерывает потоковый ответ, когда клиент
+отключился, ограничение срока не даёт таким потокам копиться).
+
+Работает только под ASGI: под WSGI поток занял бы воркер gunicorn.
+"""
+import hashlib
+import time
+
+import orjson
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core import signing
+from django.core.handlers.asgi import ASGIRequest
+from django.db import connection
+from django.http import JsonResponse, StreamingHttpResponse
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from backend.pubsub import get_pubsub
+from recipes.sync import RESYNC, replay, user_channel
+
+STREAM_TOKEN_SALT = 'api.events.stream'
+
+
+def encode(message):
+    lines = [f"event: {message['type']}"]
+    if 'id' in message:
+        lines.insert(0, f"id: {message['id']}")
+    lines.append(f"data: {orjson.dumps(message).decode()}")
+    return ('\n'.join(lines) + '\n\n').encode()
+
+
+def last_event_id(request):
+    return request.headers.get('Last-Event-ID') or request.GET.get('last_event_id') or None
+
+
+def key_digest(key):
+    return hashlib.sha256(key.encode()).hexdigest()[:16]
+
+
+def stream_token(token):
+    """Токен потока для API-токена token (rest_framework.authtoken)."""
+    return signing.dumps([token.user_id, key_digest(token.key)], salt=STREAM_TOKEN_SALT)
+
+
+def stream_token_user(value):
+    """Пользователь токена потока или None, если токен неверен или истёк."""
+    try:
+        user_id, digest = signing.loads(
+            value, salt=STREAM_TOKEN_SALT, max_age=settings.EVENTS_STREAM_TOKEN_SECONDS
+        )
+    except (signing.BadSignature, ValueError, TypeError):
+        return None
+    token = Token.objects.select_related('user').filter(user_id=user_id).first()
+    if token is None or not token.user.is_active or key_digest(token.key) != digest:
+        return None
+    return token.user
+
+
+class StreamTokenView(APIView):
+    """POST /api/events/token/: токен для ?token= потока событий."""
+
+    def post(self, request):
+        return Response({
+            'token': stream_token(request.auth),
+            'expires_in': settings.EVENTS_STREAM_TOKEN_SECONDS,
+        })
+
+
+# Поток живёт долго, соединение с базой ему после этих запросов не нужно.
+@sync_to_async
+def authenticate(request):
+    try:
+        if request.GET.get('token'):
+            return stream_token_user(request.GET['token'])
+        result = TokenAuthentication().authenticate(request)
+    except AuthenticationFailed:
+        result = None
+    finally:
+        connection.close()
+    return result[0] if result else None
+
+
+@sync_to_async
+def missed_messages(user_id, last_event_id):
+    try:
+        return replay(user_id, last_event_id, settings.EVENTS_REPLAY_LIMIT)
+    finally:
+        connection.close()
+
+
+async def stream(user_id, last_event_id):
+    heartbeat = settings.EVENTS_HEARTBEAT_SECONDS
+    deadline = time.monotonic() + settings.EVENTS_MAX_STREAM_SECONDS
+    # Подписка до чтения пропущенного: событие между ними не потеряется,
+    # а повтор из канала отсекается по id.
+    subscription = get_pubsub().subscribe(user_channel(user_id))
+    try:
+        missed = (
+            await missed_messages(user_id, last_event_id)
+            if last_event_id is not None else []
+        )
+        seen = {message['id'] for message in missed if 'id' in message}
+        yield f'retry: {settings.EVENTS_RETRY_MILLISECONDS}\n\n'.encode()
+        for message in missed:
+            yield encode(message)
+        while (remaining := deadline - time.monotonic()) > 0:
+            message = await subscription.get(timeout=min(heartbeat, remaining))
+            if subscription.overflowed:
+                subscription.overflowed = False
+                yield encode(RESYNC)
+            if message is None:
+                yield b': ping\n\n'
+            elif message.get('id') not in seen:
+                yield encode(message)
+    finally:
+        subscription.close()
+
+
+async def events(request):
+    if not isinstance(request, ASGIRequest):
+        return JsonResponse(
+            {'detail': 'Поток событий доступен только через ASGI.'}, status=501
+        )
+    user = await authenticate(request)
+    if user is None:
+        return JsonResponse(
+            {'detail': 'Учетные данные не были предоставлены.'}, status=401
+        )
+    return StreamingHttpResponse(
+        stream(user.id, last_event_id(request)),
+        content_type='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
@@ -0,0 +1,249 @@
+"""Быстрое чтение для горячих эндпоинтов.
+
+Функции собирают ответ из .values() без создания моделей и полей DRF.
+Рецепты читаются из Recipe.document (см. recipes/documents.py), к которому
+добавляются флаги текущего пользователя. Формат совпадает с UserSerializer,
+RecipeSerializer, SmallRecipeSerializer и FollowSerializer для GET-запросов;
+при изменении сериализаторов эти функции нужно менять вместе с ними.
+"""
+from django.core.files.storage import default_storage
+from django.db.models import Count, Exists, F, OuterRef, Window
+from django.db.models.fields.json import KeyTransform
+from django.db.models.functions import RowNumber
+from django.utils.encoding import iri_to_uri
+
+from recipes.documents import DOCUMENT_VERSION, build_documents
+from recipes.models import (User,
+                            Recipe,
+                            ShoppingCart,
+                            Favorite)
+
+from .loaders import viewer_relations
+
+USER_VALUES = ("id", "email", "username", "first_name", "last_name", "avatar")
+USER_FIELDS = USER_VALUES + ("is_subscribed",)
+RECIPE_VALUES = ("id", "author_id", "name", "image", "text", "cooking_time")
+RECIPE_FIELDS = (
+    "id",
+    "tags",
+    "author",
+    "name",
+    "image",
+    "text",
+    "ingredients",
+    "cooking_time",
+    "is_favorited",
+    "is_in_shopping_cart",
+)
+SMALL_RECIPE_VALUES = ("id", "name", "image", "cooking_time")
+DOCUMENT_KEYS = ("tags", "author", "name", "image", "text", "ingredients", "cooking_time")
+
+
+def requested_fields(request, available):
+    """Поля ответа с учётом ?fields= и ?omit=, в порядке сериализатора."""
+    params = request.query_params
+    fields = available
+    if params.get("fields"):
+        wanted = set(params["fields"].split(","))
+        fields = tuple(name for name in fields if name in wanted)
+    if params.get("omit"):
+        omitted = set(params["omit"].split(","))
+        fields = tuple(name for name in fields if name not in omitted)
+    return fields
+
+
+def media_url_builder(request):
+    """Возвращает функцию имя файла -> URL, как ImageField в DRF."""
+    if request is None:
+        return lambda name: default_storage.url(name) if name else None
+    prefix = request.build_absolute_uri("/")[:-1]
+
+    def build(name):
+        if not name:
+            return None
+        url = default_storage.url(name)
+        if url.startswith("/") and not url.startswith("//") and "/." not in url:
+            return prefix + iri_to_uri(url)
+        return request.build_absolute_uri(url)
+
+    return build
+
+
+def viewer(request):
+    if request is not None and request.user.is_authenticated:
+        return request.user
+    return None
+
+
+def user_row(user):
+    row = {name: getattr(user, name) for name in USER_VALUES}
+    row["avatar"] = user.avatar.name
+    return row
+
+
+def subscribed_ids(request, author_ids):
+    return viewer_relations(request).select("following", author_ids)
+
+
+def serialize_users(rows, request, fields=USER_FIELDS):
+    media_url = media_url_builder(request)
+    following = set()
+    if "is_subscribed" in fields:
+        following = subscribed_ids(request, [row["id"] for row in rows])
+    computed = {
+        "avatar": lambda row: media_url(row["avatar"]),
+        "is_subscribed": lambda row: row["id"] in following,
+    }
+    return [
+        {
+            name: computed[name](row) if name in computed else row[name]
+            for name in fields
+        }
+        for row in rows
+    ]
+
+
+def recipe_rows(queryset, request, fields=RECIPE_FIELDS):
+    """values()-запрос рецептов: нужные ключи документа и флаги пользователя."""
+    keys = {
+        name: KeyTransform(name, "document")
+        for name in ("v",) + DOCUMENT_KEYS
+        if name == "v" or name in fields
+    }
+    queryset = queryset.annotate(**{f"doc_{name}": key for name, key in keys.items()})
+    values = ["id"] + [f"doc_{name}" for name in keys]
+    user = viewer(request)
+    if user is not None:
+        flags = {}
+        if "is_favorited" in fields:
+            flags["is_favorited"] = Exists(
+                Favorite.objects.filter(user=user, recipe=OuterRef("pk"))
+            )
+        if "is_in_shopping_cart" in fields:
+            flags["is_in_shopping_cart"] = Exists(
+                ShoppingCart.objects.filter(user=user, recipe=OuterRef("pk"))
+            )
+        queryset = queryset.annotate(**flags)
+        values += flags
+    return queryset.values(*values)
+
+
+def _fill_stale(rows):
+    """Собирает в памяти устаревшие или ещё не построенные документы.
+
+    В базу они не пишутся: чтение может идти с реплики, и запись с каждого
+    GET спорила бы за блокировки строк. Сохраняют документы сигналы и
+    rebuild_recipe_documents --stale.
+    """
+    stale = [row["id"] for row in rows if row["doc_v"] != DOCUMENT_VERSION]
+    if not stale:
+        return
+    documents = build_documents(stale)
+    for row in rows:
+        if row["id"] in documents:
+            document = documents[row["id"]]
+            for name in DOCUMENT_KEYS:
+                row[f"doc_{name}"] = document[name]
+
+
+def serialize_recipes(rows, request, fields=RECIPE_FIELDS):
+    if not rows:
+        return []
+    rows = [dict(row) for row in rows]
+    _fill_stale(rows)
+    media_url = media_url_builder(request)
+    following = set()
+    if "author" in fields:
+        following = subscribed_ids(
+            request, list({row["doc_author"]["id"] for row in rows})
+        )
+
+    def author(row):
+        document = row["doc_author"]
+        data = {name: document[name] for name in USER_VALUES}
+        data["avatar"] = media_url(data["avatar"])
+        data["is_subscribed"] = data["id"] in following
+        return data
+
+    computed = {
+        "id": lambda row: row["id"],
+        "author": author,
+        "image": lambda row: media_url(row["doc_image"]),
+        "tags": lambda row: [
+            {"id": tag_id, "name": name, "slug": slug}
+            for tag_id, name, slug in row["doc_tags"]
+        ],
+        "ingredients": lambda row: [
+            {"id": ingredient_id, "name": name,
+             "measurement_unit": unit, "amount": amount}
+            for ingredient_id, name, unit, amount in row["doc_ingredients"]
+        ],
+        "is_favorited": lambda row: row.get("is_favorited", False),
+        "is_in_shopping_cart": lambda row: row.get("is_in_shopping_cart", False),
+    }
+    return [
+        {
+            name: computed[name](row) if name in computed else row[f"doc_{name}"]
+            for name in fields
+        }
+        for row in rows
+    ]
+
+
+def serialize_small_recipes(rows, request):
+    media_url = media_url_builder(request)
+    return [
+        {
+            "id": row["id"],
+            "name": row["name"],
+            "image": media_url(row["image"]),
+            "cooking_time": row["cooking_time"],
+        }
+        for row in rows
+    ]
+
+
+def serialize_subscriptions(follow_rows, request, recipes_limit):
+    """Ответ /api/users/subscriptions/ для страницы подписок."""
+    author_ids = [row["following_id"] for row in follow_rows]
+    authors = {
+        author["id"]: author
+        for author in serialize_users(
+            list(User.objects.filter(id__in=author_ids).values(*USER_VALUES)),
+            request,
+        )
+    }
+    recipes = {author_id: [] for author_id in author_ids}
+    for row in (
+        Recipe.objects.filter(author_id__in=author_ids)
+        .annotate(
+            position=Window(
+                RowNumber(), partition_by=F("author_id"), order_by=F("id").desc()
+            )
+        )
+        .filter(position__lte=recipes_limit)
+        .order_by("-id")
+        .values("author_id", *SMALL_RECIPE_VALUES)
+    ):
+        recipes[row["author_id"]].append(row)
+    counts = dict(
+        Recipe.objects.filter(author_id__in=author_ids)
+        .values("author_id")
+        .annotate(count=Count("id"))
+        .values_list("author_id", "count")
+    )
+    result = []
+    for author_id in author_ids:
+        author = authors[author_id]
+        result.append({
+            "id": author["id"],
+            "email": author["email"],
+            "username": author["username"],
+            "first_name": author["first_name"],
+            "last_name": author["last_name"],
+            "is_subscribed": author["is_subscribed"],
+            "avatar": author["avatar"],
+            "recipes": serialize_small_recipes(recipes[author_id], request),
+            "recipes_count": counts.get(author_id, 0),
+        })
+    return result
@@ -1,15 +1,28 @@
-from django_filters.rest_framework import (AllValuesMultipleFilter,
-                                           BooleanFilter, CharFilter,
-                                           FilterSet)
+from django.db.models import Exists, OuterRef
+from django_filters.rest_framework import (CharFilter,
+                                           ChoiceFilter,
+                                           FilterSet,
+                                           NumberFilter)
 
-from recipes.models import Ingredient, Recipe
+from recipes.models import Ingredient, Recipe, ShoppingCart, Favorite, Tag
 
 
 class RecipeFilter(FilterSet):
+    """Фильтры списка рецептов.
 
-    tags = AllValuesMultipleFilter(field_name='tags__slug')
-    is_favorited = BooleanFilter(field_name='is_favorited', method='filter_is_favorited')
-    is_in_shopping_cart = BooleanFilter(field_name='is_in_shopping_cart', method='filter_is_in_shopping_cart')
+    ?tags=breakfast&tags=dinner (или через запятую) ищет рецепты с любым из
+    тегов, с ?tags_mode=all — со всеми. Поиск идёт по Recipe.tag_ids через
+    GIN-индекс, без JOIN с таблицей тегов и DISTINCT.
+    """
+
+    tags = CharFilter(method='filter_tags')
+    tags_mode = ChoiceFilter(
+        choices=(('any', 'any'), ('all', 'all')), method='filter_noop'
+    )
+    author = NumberFilter(field_name='author_id')
+    # Только «1» включает фильтр, остальные значения игнорируются, а не дают 400.
+    is_favorited = CharFilter(method='filter_is_favorited')
+    is_in_shopping_cart = CharFilter(method='filter_is_in_shopping_cart')
 
     class Meta:
         model = Recipe
@@ -20,22 +33,38 @@ class RecipeFilter(FilterSet):
             'is_in_shopping_cart',
         ]
 
-    def filter_queryset(self, queryset):
-        if not self.request.user.is_authenticated:
-            self.form.cleaned_data.pop('is_favorited', None)
-            self.form.cleaned_data.pop('is_in_shopping_cart', None)
+    def filter_noop(self, queryset, name, value):
+        return queryset
 
-        return super().filter_queryset(queryset)
+    def filter_tags(self, queryset, name, value):
+        slugs = {
+            slug
+            for param in self.data.getlist('tags')
+            for slug in param.split(',')
+            if slug
+        }
+        tag_ids = list(Tag.objects.filter(slug__in=slugs).values_list('id', flat=True))
+        if self.form.cleaned_data.get('tags_mode') == 'all':
+            if len(tag_ids) < len(slugs):
+                return queryset.none()
+            return queryset.filter(tag_ids__contains=tag_ids)
+        return queryset.filter(tag_ids__overlap=tag_ids)
 
     def filter_is_favorited(self, queryset, name, value):
-        if value:
-            return queryset.filter(favorite_recipes__user=self.request.user).distinct()
-        return queryset
+        return self.filter_user_relation(queryset, Favorite, value)
 
     def filter_is_in_shopping_cart(self, queryset, name, value):
-        if value:
-            return queryset.filter(shopping_cart__user=self.request.user).distinct()
-        return queryset
+        return self.filter_user_relation(queryset, ShoppingCart, value)
+
+    def filter_user_relation(self, queryset, model, value):
+        if value != '1':
+            return queryset
+        user = self.request.user
+        if not user.is_authenticated:
+            return queryset.none()
+        return queryset.filter(
+            Exists(model.objects.filter(user=user, recipe=OuterRef('pk')))
+        )
 
 
 class IngredientFilter(FilterSet):
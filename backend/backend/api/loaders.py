@@ -0,0 +1,83 @@
+"""Пакетная загрузка связей текущего пользователя с объектами ответа.
+
+Подписан ли пользователь на автора, в избранном ли рецепт, в корзине ли он —
+для каждого объекта ответа отдельный запрос. ViewerRelations собирает id,
+которые ответ собирается вывести (want), и при первом вопросе (has)
+загружает их все одним запросом на связь. Экземпляр хранится на запросе,
+поэтому сериализаторы и api/fast_serializers.py делят одни и те же данные.
+"""
+from django.db import models
+from rest_framework import serializers
+
+from recipes.models import Favorite, Follow, ShoppingCart
+
+RELATIONS = {
+    "following": (Follow, "follower", "following_id"),
+    "favorites": (Favorite, "user", "recipe_id"),
+    "shopping_cart": (ShoppingCart, "user", "recipe_id"),
+}
+
+
+class ViewerRelations:
+
+    def __init__(self, user):
+        self.user = user
+        self.pending = {name: set() for name in RELATIONS}
+        self.known = {name: set() for name in RELATIONS}
+        self.members = {name: set() for name in RELATIONS}
+
+    def want(self, relation, ids):
+        if self.user is not None:
+            self.pending[relation].update(ids)
+
+    def has(self, relation, object_id):
+        if self.user is None:
+            return False
+        if object_id not in self.known[relation]:
+            self.pending[relation].add(object_id)
+            self.load(relation)
+        return object_id in self.members[relation]
+
+    def select(self, relation, ids):
+        """Те из ids, с которыми пользователь связан."""
+        ids = set(ids)
+        self.want(relation, ids)
+        return {object_id for object_id in ids if self.has(relation, object_id)}
+
+    def load(self, relation):
+        ids = self.pending[relation] - self.known[relation]
+        self.pending[relation] = set()
+        if not ids:
+            return
+        model, owner, target = RELATIONS[relation]
+        self.members[relation].update(
+            model.objects.filter(**{owner: self.user, f"{target}__in": ids})
+            .values_list(target, flat=True)
+        )
+        self.known[relation] |= ids
+
+
+def viewer_relations(request):
+    """ViewerRelations текущего запроса (общий для всех сериализаторов)."""
+    if request is None:
+        return ViewerRelations(None)
+    http_request = getattr(request, "_request", request)
+    relations = getattr(http_request, "viewer_relations", None)
+    if relations is None:
+        user = request.user if request.user.is_authenticated else None
+        relations = http_request.viewer_relations = ViewerRelations(user)
+    return relations
+
+
+class ViewerListSerializer(serializers.ListSerializer):
+    """Перед выводом списка объявляет загрузчику id всех его элементов.
+
+    Дочерний сериализатор возвращает их из viewer_relation_ids(items).
+    """
+
+    def to_representation(self, data):
+        items = list(data.all() if isinstance(data, models.manager.BaseManager) else data)
+        relations = viewer_relations(self.context.get("request"))
+        for relation, ids in self.child.viewer_relation_ids(items).items():
+            relations.want(relation, ids)
+        return super().to_representation(items)
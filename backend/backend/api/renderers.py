@@ -0,0 +1,17 @@
+import orjson
+from rest_framework.renderers import BaseRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+
+class ORJSONRenderer(BaseRenderer):
+    """JSON-рендерер на orjson; типы, которых orjson не знает, кодирует DRF."""
+
+    media_type = 'application/json'
+    format = 'json'
+    charset = None
+    options = orjson.OPT_NON_STR_KEYS | orjson.OPT_UTC_Z
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return orjson.dumps(data, default=JSONEncoder().default, option=self.options)
@@ -1,8 +1,12 @@
 from rest_framework import serializers
-from django.db import IntegrityError
-from django.core.files.base import ContentFile
+from django.db import IntegrityError, transaction
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from django.http import QueryDict
 import base64
+import binascii
+import json
 from recipes.models import (User,
+                            Tag,
                             Ingredient,
                             Recipe,
                             RecipeIngredient,
@@ -10,18 +14,61 @@ from recipes.models import (User,
                             Favorite,
                             Follow)
 from djoser.serializers import UserSerializer as StartUserSerializer
+from recipes.documents import rebuild_documents
+from recipes.duplicates import duplicate_index, signature
+from .loaders import ViewerListSerializer, viewer_relations
 from recipes.constants import (RECIPE_COOKING_TIME_MIN,
                                RECIPE_COOKING_TIME_MAX,
                                INGREDIENT_AMOUNT_MIN,
 )
 import re
 
+# Кратно 4: каждый кусок декодируется отдельно.
+BASE64_CHUNK_SIZE = 64 * 1024
+
+
+class DecodedImageFile(TemporaryUploadedFile):
+    """Временный файл декодированной картинки.
+
+    Файлы из multipart закрывает Django по окончании запроса, этот файл
+    закрывается при сборке мусора (после переноса в хранилище его уже нет).
+    """
+
+    def __del__(self):
+        self.close()
+
+
+def decode_base64_file(data, name):
+    """Декодирует data:-URI во временный файл по кускам.
+
+    Строка не копируется целиком (как при split и b64decode всей строки),
+    в памяти одновременно только один кусок декодированных данных.
+    """
+    start = data.index(';base64,')
+    ext = data[:start].split('/')[-1]
+    upload = DecodedImageFile(f'{name}.{ext}', f'image/{ext}', 0, None)
+    pending = ''
+    for offset in range(start + len(';base64,'), len(data), BASE64_CHUNK_SIZE):
+        chunk = pending + ''.join(data[offset:offset + BASE64_CHUNK_SIZE].split())
+        cut = len(chunk) - len(chunk) % 4
+        upload.write(base64.b64decode(chunk[:cut]))
+        pending = chunk[cut:]
+    if pending:
+        upload.write(base64.b64decode(pending))
+    upload.size = upload.tell()
+    upload.seek(0)
+    return upload
+
+
 class Base64ImageField(serializers.ImageField):
+    """Картинка файлом из multipart/form-data или base64 (data:image/...)."""
+
     def to_internal_value(self, data):
         if isinstance(data, str) and data.startswith('data:image'):
-            format, imgstr = data.split(';base64,')
-            ext = format.split('/')[-1]
-            data = ContentFile(base64.b64decode(imgstr), name='temp.' + ext)
+            try:
+                data = decode_base64_file(data, 'temp')
+            except (ValueError, binascii.Error):
+                self.fail('invalid_image')
 
         return super().to_internal_value(data)
 
@@ -30,6 +77,7 @@ class UserSerializer(StartUserSerializer):
 
     class Meta(StartUserSerializer.Meta):
         model = User
+        list_serializer_class = ViewerListSerializer
         fields = (
             "id",
             "email",
@@ -164,13 +212,12 @@ class UserSerializer(StartUserSerializer):
             "first_name": instance.first_name,
             "last_name": instance.last_name,
             "avatar": avatar_url,
-            "is_subscribed": (
-                request.user.following.filter(following=instance).exists()
-                if request and request.user.is_authenticated
-                else False
-            ),
+            "is_subscribed": viewer_relations(request).has("following", instance.id),
         }
 
+    def viewer_relation_ids(self, users):
+        return {"following": [user.id for user in users]}
+
 
 class AvatarSerializer(serializers.ModelSerializer):
     avatar = Base64ImageField(required=True)
@@ -195,6 +242,13 @@ class IngredientSerializer(serializers.ModelSerializer):
         fields = ('id', 'name', 'measurement_unit')
 
 
+class TagSerializer(serializers.ModelSerializer):
+
+    class Meta:
+        model = Tag
+        fields = ('id', 'name', 'slug')
+
+
 class IngredientAmountSerializer(serializers.Serializer):
     id = serializers.IntegerField()
     amount = serializers.IntegerField(min_value=INGREDIENT_AMOUNT_MIN)
@@ -227,6 +281,9 @@ class RecipeIngredientSerializer(serializers.ModelSerializer):
 
 class RecipeSerializer(serializers.ModelSerializer):
     author = UserSerializer(read_only=True)
+    tags = serializers.PrimaryKeyRelatedField(
+        queryset=Tag.objects.all(), many=True, required=False
+    )
     ingredients = RecipeIngredientSerializer(
         many=True, read_only=True, source="recipeingredient_set"
     )
@@ -244,8 +301,10 @@ class RecipeSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Recipe
+        list_serializer_class = ViewerListSerializer
         fields = (
             "id",
+            "tags",
             "author",
             "name",
             "image",
@@ -257,7 +316,29 @@ class RecipeSerializer(serializers.ModelSerializer):
             "is_in_shopping_cart",
         )
 
+    # В multipart/form-data списки передаются JSON-строкой:
+    # ingredients='[{"id": 1, "amount": 10}]', tags='[1, 2]' (или tags=1&tags=2).
+    FORM_JSON_FIELDS = ("ingredients", "ingredients_input", "tags")
+
+    def form_to_dict(self, data):
+        result = {}
+        for key, values in data.lists():
+            value = values if len(values) > 1 else values[-1]
+            if key in self.FORM_JSON_FIELDS and isinstance(value, str):
+                try:
+                    value = json.loads(value)
+                except ValueError:
+                    raise serializers.ValidationError(
+                        {key: "Ожидается список в формате JSON."}
+                    )
+                if not isinstance(value, list):
+                    value = [value]
+            result[key] = value
+        return result
+
     def to_internal_value(self, data):
+        if isinstance(data, QueryDict):
+            data = self.form_to_dict(data)
         if "ingredients" in data and "ingredients_input" not in data:
             data = data.copy()
             data["ingredients_input"] = data.pop("ingredients")
@@ -285,14 +366,20 @@ class RecipeSerializer(serializers.ModelSerializer):
                 )
             RecipeIngredient.objects.bulk_create(recipe_ingredients)
 
+    @transaction.atomic
     def create(self, validated_data):
         ingredients_data = validated_data.pop("ingredients_input")
+        tags = validated_data.pop("tags", [])
         recipe = Recipe.objects.create(**validated_data)
+        recipe.tags.set(tags)
         self._update_ingredients(recipe, ingredients_data)
+        rebuild_documents([recipe.id])
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
         ingredients_data = validated_data.pop("ingredients_input", None)
+        tags = validated_data.pop("tags", None)
         instance.name = validated_data.get("name", instance.name)
         instance.image = validated_data.get("image", instance.image)
         instance.text = validated_data.get("text", instance.text)
@@ -300,30 +387,34 @@ class RecipeSerializer(serializers.ModelSerializer):
             "cooking_time", instance.cooking_time
         )
         instance.save()
+        if tags is not None:
+            instance.tags.set(tags)
         if ingredients_data is not None:
             self._update_ingredients(instance, ingredients_data)
+        rebuild_documents([instance.id])
         return instance
 
     def get_is_favorited(self, obj):
-        request = self.context["request"]
-        if request and request.user.is_authenticated:
-            return request.user.favorites.filter(recipe=obj).exists()
-        return False
+        return viewer_relations(self.context["request"]).has("favorites", obj.id)
 
     def get_is_in_shopping_cart(self, obj):
-        request = self.context["request"]
-        if request and request.user.is_authenticated:
-            return request.user.shopping_carts.filter(recipe=obj).exists()
-        return False
+        return viewer_relations(self.context["request"]).has("shopping_cart", obj.id)
+
+    def viewer_relation_ids(self, recipes):
+        recipe_ids = [recipe.id for recipe in recipes]
+        return {
+            "favorites": recipe_ids,
+            "shopping_cart": recipe_ids,
+            "following": [recipe.author_id for recipe in recipes],
+        }
 
     def to_representation(self, instance):
-        data = super().to_representation(instance)
         request = self.context.get("request")
+        viewer_relations(request).want("following", [instance.author_id])
+        data = super().to_representation(instance)
         author_data = data["author"]
-        author_data["is_subscribed"] = (
-            request.user.following.filter(following=instance.author).exists()
-            if request and request.user.is_authenticated
-            else False
+        author_data["is_subscribed"] = viewer_relations(request).has(
+            "following", instance.author_id
         )
         avatar_url = None
         if (
@@ -333,6 +424,7 @@ class RecipeSerializer(serializers.ModelSerializer):
         ):
             avatar_url = request.build_absolute_uri(instance.author.avatar.url)
         author_data["avatar"] = avatar_url
+        data["tags"] = TagSerializer(instance.tags.all(), many=True).data
         ingredients = RecipeIngredient.objects.filter(recipe=instance)
         data["ingredients"] = RecipeIngredientSerializer(ingredients, many=True).data
         return data
@@ -367,9 +459,35 @@ class RecipeSerializer(serializers.ModelSerializer):
                             "name": "Рецепт с таким названием уже существует у этого автора."
                         }
                     )
+            self._check_near_duplicate(data, ingredient_ids, request.user)
 
         return data
 
+    def _check_near_duplicate(self, data, ingredient_ids, author):
+        minhash = signature(
+            data.get("name", getattr(self.instance, "name", "")),
+            data.get("text", getattr(self.instance, "text", "")),
+            ingredient_ids,
+        )
+        recipe_ids = [
+            recipe_id
+            for recipe_id, author_id, _ in duplicate_index.similar(minhash)
+            if author_id == author.id
+            and (self.instance is None or recipe_id != self.instance.id)
+        ]
+        # Индекс может отставать от базы: удалённые рецепты отсеиваются здесь.
+        names = dict(
+            Recipe.objects.filter(id__in=recipe_ids[:10]).values_list("id", "name")
+        )
+        for recipe_id in recipe_ids:
+            if recipe_id in names:
+                raise serializers.ValidationError(
+                    {
+                        "name": "У этого автора уже есть почти такой же рецепт: "
+                        f"«{names[recipe_id]}»."
+                    }
+                )
+
 
 class FavoriteSerializer(serializers.ModelSerializer):
     class Meta:
@@ -390,8 +508,12 @@ class FollowSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Follow
+        list_serializer_class = ViewerListSerializer
         fields = ("following", "recipes", "recipes_count")
 
+    def viewer_relation_ids(self, follows):
+        return {"following": [follow.following_id for follow in follows]}
+
     def get_recipes(self, obj):
         request = self.context.get("request")
         recipes_limit = request.query_params.get("recipes_limit", 3)
@@ -0,0 +1,100 @@
+import threading
+
+from django.db import connections, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from api.events import stream_token_user
+from recipes.models import OutboxEvent, User
+from recipes.outbox import emit
+from recipes.sync import RESYNC, message, replay
+
+USER_ID = 1
+LIMIT = 100
+
+
+def favorite(recipe_id):
+    emit(OutboxEvent.Type.FAVORITE_ADDED, USER_ID, recipe_id)
+    return OutboxEvent.objects.filter(recipe_id=recipe_id).latest('id')
+
+
+class ReplayTests(TransactionTestCase):
+    """Пропущенные события /api/events/ читаются в порядке коммитов."""
+
+    def test_event_committed_after_last_seen(self):
+        # Долгая транзакция получает id раньше, а коммитится позже события,
+        # которое клиент успел получить до обрыва.
+        inserted, release = threading.Event(), threading.Event()
+
+        def slow():
+            try:
+                with transaction.atomic():
+                    favorite(1)
+                    inserted.set()
+                    release.wait(10)
+            finally:
+                connections.close_all()
+
+        thread = threading.Thread(target=slow)
+        thread.start()
+        self.assertTrue(inserted.wait(10))
+        seen = message(favorite(2))
+        release.set()
+        thread.join()
+
+        missed = replay(USER_ID, seen['id'], LIMIT)
+        self.assertEqual([item['recipe_id'] for item in missed], [1])
+        self.assertNotEqual(missed[0]['id'], seen['id'])
+
+    def test_nothing_missed(self):
+        favorite(1)
+        seen = message(favorite(2))
+        self.assertEqual(replay(USER_ID, seen['id'], LIMIT), [])
+
+    def test_resync(self):
+        seen = message(favorite(1))
+        for _ in range(3):
+            favorite(2)
+        self.assertEqual(replay(USER_ID, seen['id'], 2), [RESYNC])
+        # Старый формат id и удалённые события не восстановить.
+        self.assertEqual(replay(USER_ID, '123', LIMIT), [RESYNC])
+        OutboxEvent.objects.all().delete()
+        self.assertEqual(replay(USER_ID, seen['id'], LIMIT), [RESYNC])
+
+
+class StreamTokenTests(TestCase):
+    """Токен ?token= для EventSource вместо заголовка Authorization."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='reader@example.com', username='reader',
+            first_name='reader', last_name='reader',
+        )
+        self.api_token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.api_token.key}')
+
+    def issue(self):
+        response = self.client.post('/api/events/token/')
+        self.assertEqual(response.status_code, 200)
+        return response.json()['token']
+
+    def test_token_authenticates_stream(self):
+        self.assertEqual(stream_token_user(self.issue()), self.user)
+
+    def test_requires_api_token(self):
+        self.assertEqual(APIClient().post('/api/events/token/').status_code, 401)
+
+    def test_api_token_is_not_a_stream_token(self):
+        self.assertIsNone(stream_token_user(self.api_token.key))
+
+    @override_settings(EVENTS_STREAM_TOKEN_SECONDS=-1)
+    def test_expired(self):
+        self.assertIsNone(stream_token_user(self.issue()))
+
+    def test_revoked_with_api_token(self):
+        token = self.issue()
+        self.api_token.delete()
+        Token.objects.create(user=self.user)
+        self.assertIsNone(stream_token_user(token))
@@ -0,0 +1,53 @@
+import gzip
+
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from recipes.models import Ingredient
+
+URL = '/api/ingredients/'
+
+
+class IngredientSnapshotTests(TestCase):
+    """Справочник без фильтров: ETag и gzip по заголовкам запроса."""
+
+    def setUp(self):
+        Ingredient.objects.create(name='соль', measurement_unit='г')
+        self.client = APIClient()
+        self.etag = self.client.get(URL)['ETag']
+
+    def get(self, **headers):
+        return self.client.get(URL, **headers)
+
+    def test_gzip_only_when_accepted(self):
+        cases = {
+            'gzip': True,
+            'br, gzip;q=0.5': True,
+            '*': True,
+            'gzip;q=0': False,
+            'gzip; q=0.0, deflate': False,
+            '*;q=0': False,
+            'identity': False,
+            'x-gzip-not': False,
+        }
+        for header, compressed in cases.items():
+            with self.subTest(header=header):
+                response = self.get(HTTP_ACCEPT_ENCODING=header)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.get('Content-Encoding') == 'gzip', compressed)
+                body = gzip.decompress(response.content) if compressed else response.content
+                self.assertIn('соль', body.decode())
+
+    def test_if_none_match(self):
+        cases = {
+            self.etag: 304,
+            f'W/{self.etag}': 304,
+            f'"other", {self.etag}': 304,
+            '*': 304,
+            '"other"': 200,
+            f'"x{self.etag[1:]}': 200,
+            f'"{self.etag}"': 200,
+        }
+        for header, code in cases.items():
+            with self.subTest(header=header):
+                self.assertEqual(self.get(HTTP_IF_NONE_MATCH=header).status_code, code)
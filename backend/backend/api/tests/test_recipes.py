@@ -0,0 +1,70 @@
+import base64
+import io
+import tempfile
+
+from django.test import TestCase, override_settings
+from PIL import Image
+from rest_framework.test import APIClient
+
+from recipes.models import Ingredient, Tag, User
+
+
+def png_data_uri():
+    buffer = io.BytesIO()
+    Image.new('RGB', (2, 2)).save(buffer, format='PNG')
+    return 'data:image/png;base64,' + base64.b64encode(buffer.getvalue()).decode()
+
+
+def shape(value):
+    """Ключи ответа без значений: словари и списки сравниваются по структуре."""
+    if isinstance(value, dict):
+        return {key: shape(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [shape(item) for item in value[:1]]
+    return None
+
+
+class RecipeCreateResponseTests(TestCase):
+    """Ответ POST /api/recipes/ совпадает с GET /api/recipes/{id}/."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.media_root = tempfile.TemporaryDirectory()
+        cls.media_settings = override_settings(MEDIA_ROOT=cls.media_root.name)
+        cls.media_settings.enable()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.media_settings.disable()
+        cls.media_root.cleanup()
+        super().tearDownClass()
+
+    def setUp(self):
+        self.author = User.objects.create_user(
+            email='author@example.com', username='author',
+            first_name='author', last_name='author',
+        )
+        self.tag = Tag.objects.create(name='Завтрак', slug='breakfast')
+        self.ingredient = Ingredient.objects.create(name='соль', measurement_unit='г')
+        self.client = APIClient()
+        self.client.force_authenticate(self.author)
+
+    def create(self):
+        response = self.client.post('/api/recipes/', {
+            'name': 'Каша',
+            'text': 'Сварить.',
+            'cooking_time': 10,
+            'image': png_data_uri(),
+            'tags': [self.tag.id],
+            'ingredients': [{'id': self.ingredient.id, 'amount': 5}],
+        }, format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+        return response.json()
+
+    def test_create_matches_retrieve(self):
+        created = self.create()
+        retrieved = self.client.get(f"/api/recipes/{created['id']}/").json()
+        self.assertEqual(shape(created), shape(retrieved))
+        self.assertIs(created['author']['is_subscribed'], False)
+        self.assertEqual(created['author'], retrieved['author'])
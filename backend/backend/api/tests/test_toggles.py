@@ -0,0 +1,145 @@
+import random
+import threading
+from collections import Counter
+
+from django.db import connections
+from django.test import TransactionTestCase
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from api.views import CustomUserViewSet, RecipeViewSet
+from recipes.models import Favorite, Follow, OutboxEvent, Recipe, ShoppingCart, User
+
+THREADS = 8
+REQUESTS_PER_THREAD = 50
+
+ENDPOINTS = {
+    'favorite': RecipeViewSet.as_view({'post': 'favorite', 'delete': 'favorite'}),
+    'shopping_cart': RecipeViewSet.as_view(
+        {'post': 'shopping_cart', 'delete': 'shopping_cart'}
+    ),
+    'subscribe': CustomUserViewSet.as_view(
+        {'post': 'subscribe', 'delete': 'unsubscribe'}
+    ),
+}
+EVENTS = {
+    'favorite': (OutboxEvent.Type.FAVORITE_ADDED, OutboxEvent.Type.FAVORITE_REMOVED),
+    'shopping_cart': (
+        OutboxEvent.Type.SHOPPING_CART_ADDED, OutboxEvent.Type.SHOPPING_CART_REMOVED
+    ),
+    'subscribe': (OutboxEvent.Type.FOLLOW_ADDED, OutboxEvent.Type.FOLLOW_REMOVED),
+}
+
+
+def run_threads(target, count):
+    """Запускает target(номер) в count потоках одновременно, ловит исключения."""
+    barrier = threading.Barrier(count)
+    errors = []
+
+    def run(number):
+        try:
+            barrier.wait()
+            target(number)
+        except Exception as error:  # noqa: BLE001 — 500 тоже результат
+            errors.append(repr(error))
+        finally:
+            connections.close_all()
+
+    threads = [threading.Thread(target=run, args=(number,)) for number in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return errors
+
+
+class ConcurrentToggleTests(TransactionTestCase):
+    """Одновременные POST/DELETE избранного, корзины и подписки.
+
+    Запросы из разных потоков идут в разных соединениях и транзакциях,
+    поэтому нужен TransactionTestCase.
+    """
+
+    def setUp(self):
+        self.author = User.objects.create_user(
+            email='author@example.com', username='author',
+            first_name='author', last_name='author',
+        )
+        self.users = [
+            User.objects.create_user(
+                email=f'user-{number}@example.com', username=f'user-{number}',
+                first_name='user', last_name=str(number),
+            )
+            for number in range(3)
+        ]
+        self.recipe = Recipe.objects.create(
+            author=self.author, name='recipe', text='recipe', cooking_time=1,
+            image='recipe.png',
+        )
+        self.factory = APIRequestFactory()
+        self.first_event = (
+            OutboxEvent.objects.order_by('-id').values_list('id', flat=True).first() or 0
+        )
+
+    def request(self, name, method, user):
+        target = self.author.id if name == 'subscribe' else self.recipe.id
+        path = (f'/api/users/{target}/subscribe/' if name == 'subscribe'
+                else f'/api/recipes/{target}/{name}/')
+        request = getattr(self.factory, method)(path)
+        force_authenticate(request, user)
+        return ENDPOINTS[name](request, pk=str(target)).status_code
+
+    def rows(self):
+        return {
+            'favorite': Favorite.objects.filter(recipe=self.recipe).count(),
+            'shopping_cart': ShoppingCart.objects.filter(recipe=self.recipe).count(),
+            'subscribe': Follow.objects.filter(following=self.author).count(),
+        }
+
+    def events(self):
+        return Counter(
+            OutboxEvent.objects.filter(id__gt=self.first_event)
+            .values_list('type', flat=True)
+        )
+
+    def test_same_post_succeeds_once(self):
+        user = self.users[0]
+        for name in ENDPOINTS:
+            with self.subTest(name=name):
+                statuses = []
+
+                def post(number):
+                    statuses.append(self.request(name, 'post', user))
+
+                self.assertEqual(run_threads(post, THREADS), [])
+                self.assertEqual(Counter(statuses), {201: 1, 400: THREADS - 1})
+                self.assertEqual(self.rows()[name], 1)
+                self.assertEqual(self.events()[EVENTS[name][0]], 1)
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.favorites_count, 1)
+
+    def test_mixed_requests_match_rows_and_events(self):
+        results = []
+
+        def hammer(number):
+            rng = random.Random(number)
+            for _ in range(REQUESTS_PER_THREAD):
+                name = rng.choice(list(ENDPOINTS))
+                method = rng.choice(('post', 'delete'))
+                code = self.request(name, method, rng.choice(self.users))
+                results.append((name, method, code))
+
+        self.assertEqual(run_threads(hammer, THREADS), [])
+        statuses = Counter(results)
+        self.assertEqual(sum(statuses.values()), THREADS * REQUESTS_PER_THREAD)
+        self.assertEqual(
+            {code for _, _, code in statuses} - {201, 204, 400}, set()
+        )
+        rows, events = self.rows(), self.events()
+        for name, (added, removed) in EVENTS.items():
+            with self.subTest(name=name):
+                created = statuses[(name, 'post', 201)]
+                deleted = statuses[(name, 'delete', 204)]
+                self.assertEqual(rows[name], created - deleted)
+                self.assertEqual((events[added], events[removed]), (created, deleted))
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.favorites_count, rows['favorite'])
@@ -0,0 +1,66 @@
+import base64
+import tempfile
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from api.serializers import decode_base64_file
+from api.views import CustomUserViewSet
+from recipes.management.commands.bench_uploads import MIB, measure, noise_png
+from recipes.models import User
+
+IMAGE_SIZE = 5 * MIB
+# Без потоковой обработки пик больше размера картинки (b64decode всей строки
+# держит в памяти и строку, и результат).
+MAX_PEAK = 2 * MIB
+
+
+class UploadMemoryTests(TestCase):
+    """Пиковая память при загрузке картинки не зависит от её размера."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.image = noise_png(IMAGE_SIZE)
+        cls.media_root = tempfile.TemporaryDirectory()
+        cls.media_settings = override_settings(MEDIA_ROOT=cls.media_root.name)
+        cls.media_settings.enable()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.media_settings.disable()
+        cls.media_root.cleanup()
+        super().tearDownClass()
+
+    def test_base64_decoded_in_chunks(self):
+        data_uri = 'data:image/png;base64,' + base64.b64encode(self.image).decode()
+
+        def decode():
+            upload = decode_base64_file(data_uri, 'temp')
+            size = upload.size
+            upload.close()
+            return size
+
+        peak, _, size = measure(decode)
+        self.assertEqual(size, len(self.image))
+        self.assertLess(peak, MAX_PEAK)
+
+    def test_multipart_avatar_upload(self):
+        user = User.objects.create_user(
+            email='uploads@example.com', username='uploads',
+            first_name='uploads', last_name='uploads',
+        )
+        request = APIRequestFactory().put(
+            '/api/users/me/avatar/',
+            {'avatar': SimpleUploadedFile('avatar.png', self.image, 'image/png')},
+            format='multipart',
+        )
+        # Временный файл закрывает обработчик запроса, здесь его нет.
+        self.addCleanup(request.close)
+        force_authenticate(request, user)
+        view = CustomUserViewSet.as_view({'put': 'update_avatar'})
+
+        peak, _, response = measure(lambda: view(request))
+        self.assertEqual(response.status_code, 200)
+        self.assertLess(peak, MAX_PEAK)
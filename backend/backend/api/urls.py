@@ -2,14 +2,18 @@ from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from api.views import (
     CustomUserViewSet,
+    TagViewSet,
     RecipeViewSet,
     IngredientViewSet,
     ShoppingCartIngredientsView,
+    MetricsView,
     redirect_short_link,
 )
+from api.events import StreamTokenView, events
 
 router = DefaultRouter()
 router.register("users", CustomUserViewSet, basename="users")
+router.register("tags", TagViewSet, basename="tags")
 router.register("ingredients", IngredientViewSet, basename="ingredients")
 router.register("recipes", RecipeViewSet, basename="recipes")
 
@@ -24,5 +28,8 @@ urlpatterns = [
         ShoppingCartIngredientsView.as_view(),
         name="shopping_cart_ingredients",
     ),
+    path("metrics/", MetricsView.as_view(), name="metrics"),
+    path("events/", events, name="events"),
+    path("events/token/", StreamTokenView.as_view(), name="events-token"),
     path("s/<str:slug>/", redirect_short_link, name="short-link"),
 ]
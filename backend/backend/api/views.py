@@ -1,33 +1,92 @@
 from django.contrib.auth import update_session_auth_hash
+from django.db import transaction
 from django.db.models import Sum
-from django.http import HttpResponse
+from django.http import Http404, HttpResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404, redirect
 from django.urls import reverse
+from django.utils.http import parse_etags
 from django_filters.rest_framework import DjangoFilterBackend
 
 from rest_framework import status, viewsets, filters
 from rest_framework.decorators import action
-from rest_framework.permissions import IsAuthenticated, AllowAny, IsAuthenticatedOrReadOnly
+from rest_framework.permissions import (IsAuthenticated, AllowAny, IsAuthenticatedOrReadOnly,
+                                        IsAdminUser)
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
+from backend import metrics
 from recipes.models import (User,
+                            Tag,
                             Ingredient,
                             Recipe,
                             RecipeIngredient,
                             ShoppingCart,
                             Favorite,
                             Follow)
-from .filters import IngredientFilter
+from recipes.pantry import pantry_index
+from recipes.toggles import link, unlink
+from recipes.trending import WINDOWS as TRENDING_WINDOWS, leaderboard
+from .fast_serializers import (requested_fields,
+                               recipe_rows,
+                               serialize_recipes,
+                               serialize_small_recipes,
+                               serialize_subscriptions,
+                               serialize_users,
+                               user_row,
+                               RECIPE_FIELDS,
+                               SMALL_RECIPE_VALUES,
+                               USER_FIELDS,
+                               USER_VALUES)
+from .export import export_archive
+from .filters import IngredientFilter, RecipeFilter
 from .pagination import Pagination
 from .permissions import IsAuthorOrReadOnly
 from .serializers import (UserSerializer,
                           AvatarSerializer,
+                          TagSerializer,
                           IngredientSerializer,
-                          SmallRecipeSerializer,
                           RecipeIngredientSerializer,
-                          RecipeSerializer,
-                          FollowSerializer)
+                          RecipeSerializer)
+
+
+def not_found(model):
+    # То же сообщение, что у get_object_or_404.
+    return Http404(f"No {model._meta.object_name} matches the given query.")
+
+
+def object_id(pk, model):
+    try:
+        return int(pk)
+    except (TypeError, ValueError):
+        raise not_found(model)
+
+
+def etag_matches(if_none_match, etag):
+    """Совпадает ли etag с одним из If-None-Match (слабое сравнение, *)."""
+    return any(
+        tag == "*" or tag.removeprefix("W/") == etag
+        for tag in parse_etags(if_none_match)
+    )
+
+
+def accepts_gzip(accept_encoding):
+    """Принимает ли клиент gzip: gzip или * с q > 0 в Accept-Encoding."""
+    wildcard = False
+    for item in accept_encoding.split(","):
+        coding, *params = (part.strip() for part in item.split(";"))
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if coding.lower() == "gzip":
+            return quality > 0
+        if coding == "*":
+            wildcard = quality > 0
+    return wildcard
 
 
 class CustomUserViewSet(viewsets.ModelViewSet):
@@ -40,38 +99,57 @@ class CustomUserViewSet(viewsets.ModelViewSet):
         detail=False, methods=["get"], permission_classes=[IsAuthenticated]
     )
     def me(self, request):
-        serializer = self.get_serializer(request.user)
-        return Response(serializer.data)
+        fields = requested_fields(request, USER_FIELDS)
+        return Response(serialize_users([user_row(request.user)], request, fields)[0])
+
+    def list(self, request, *args, **kwargs):
+        fields = requested_fields(request, USER_FIELDS)
+        rows = self.filter_queryset(self.get_queryset()).values(*USER_VALUES)
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(serialize_users(page, request, fields))
+        return Response(serialize_users(list(rows), request, fields))
+
+    def retrieve(self, request, *args, **kwargs):
+        fields = requested_fields(request, USER_FIELDS)
+        return Response(
+            serialize_users([user_row(self.get_object())], request, fields)[0]
+        )
 
     @action(
         detail=True, methods=["post"], permission_classes=[IsAuthenticated]
     )
+    @transaction.atomic
     def subscribe(self, request, pk=None):
-        user = request.user
-        author = get_object_or_404(User, pk=pk)
-        if user == author:
+        author_id = object_id(pk, User)
+        if author_id == request.user.id:
             return Response(
                 {"detail": "Нельзя подписаться на себя"},
                 status=status.HTTP_400_BAD_REQUEST,
             )
-        if user.following.filter(following=author).exists():
+        author, created = link(Follow, request.user.id, author_id)
+        if author is None:
+            raise not_found(User)
+        if not created:
             return Response(
                 {"detail": "Уже подписан"}, status=status.HTTP_400_BAD_REQUEST
             )
-        follow = Follow.objects.create(follower=user, following=author)
-        serializer = FollowSerializer(follow, context={"request": request})
-        return Response(serializer.data, status=status.HTTP_201_CREATED)
+        recipes_limit = int(request.query_params.get("recipes_limit", 3))
+        return Response(
+            serialize_subscriptions([{"following_id": author_id}], request, recipes_limit)[0],
+            status=status.HTTP_201_CREATED,
+        )
 
     @subscribe.mapping.delete
+    @transaction.atomic
     def unsubscribe(self, request, pk=None):
-        user = request.user
-        author = get_object_or_404(User, pk=pk)
-        follow = user.following.filter(following=author).first()
-        if not follow:
+        exists, deleted = unlink(Follow, request.user.id, object_id(pk, User))
+        if not exists:
+            raise not_found(User)
+        if not deleted:
             return Response(
                 {"detail": "Вы не подписаны"}, status=status.HTTP_400_BAD_REQUEST
             )
-        follow.delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
 
     @action(
@@ -79,13 +157,13 @@ class CustomUserViewSet(viewsets.ModelViewSet):
     )
     def subscriptions(self, request):
         user = request.user
-        follows = user.following.all()
+        follows = user.following.values("following_id")
+        recipes_limit = int(request.query_params.get("recipes_limit", 3))
         paginator = Pagination()
         result_page = paginator.paginate_queryset(follows, request)
-        serializer = FollowSerializer(
-            result_page, many=True, context={"request": request}
+        return paginator.get_paginated_response(
+            serialize_subscriptions(result_page, request, recipes_limit)
         )
-        return paginator.get_paginated_response(serializer.data)
 
     @action(
         detail=False,
@@ -106,11 +184,26 @@ class CustomUserViewSet(viewsets.ModelViewSet):
                     {"detail": "Аватар не установлен"},
                     status=status.HTTP_400_BAD_REQUEST,
                 )
-            user.avatar.delete()
+            # Файл может использоваться другими записями, его удалит gc_media.
             user.avatar = None
-            user.save()
+            user.save(update_fields=["avatar"])
             return Response(status=status.HTTP_204_NO_CONTENT)
 
+    @action(
+        detail=False,
+        methods=["get"],
+        url_path="me/export",
+        permission_classes=[IsAuthenticated],
+    )
+    def export(self, request):
+        return StreamingHttpResponse(
+            export_archive(request.user),
+            content_type="application/zip",
+            headers={
+                "Content-Disposition": 'attachment; filename="foodgram-export.zip"'
+            },
+        )
+
     @action(
         detail=False, methods=["post"], permission_classes=[IsAuthenticated]
     )
@@ -148,6 +241,13 @@ class CustomUserViewSet(viewsets.ModelViewSet):
         return Response(serializer.data, status=status.HTTP_201_CREATED, headers=headers)
 
 
+class TagViewSet(viewsets.ReadOnlyModelViewSet):
+    queryset = Tag.objects.all()
+    serializer_class = TagSerializer
+    pagination_class = None
+    permission_classes = [AllowAny]
+
+
 class IngredientViewSet(viewsets.ModelViewSet):
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
@@ -156,6 +256,25 @@ class IngredientViewSet(viewsets.ModelViewSet):
     filter_backends = [DjangoFilterBackend]
     filterset_class = IngredientFilter
 
+    def list(self, request, *args, **kwargs):
+        if request.query_params:
+            return super().list(request, *args, **kwargs)
+        from recipes.catalog import get_snapshot
+
+        snapshot = get_snapshot()
+        etag = f'"{snapshot.version}"'
+        if etag_matches(request.headers.get("If-None-Match", ""), etag):
+            return HttpResponse(status=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+        use_gzip = accepts_gzip(request.headers.get("Accept-Encoding", ""))
+        response = HttpResponse(
+            snapshot.gzipped if use_gzip else snapshot.raw,
+            content_type="application/json",
+            headers={"ETag": etag, "Vary": "Accept-Encoding"},
+        )
+        if use_gzip:
+            response["Content-Encoding"] = "gzip"
+        return response
+
     def create(self, request, *args, **kwargs):
         return Response({"detail": "Метод не разрешен."}, status=status.HTTP_405_METHOD_NOT_ALLOWED)
 
@@ -173,90 +292,133 @@ class RecipeViewSet(viewsets.ModelViewSet):
     queryset = Recipe.objects.all()
     serializer_class = RecipeSerializer
     permission_classes = [IsAuthenticatedOrReadOnly, IsAuthorOrReadOnly]
-    filter_backends = [filters.SearchFilter]
+    filter_backends = [DjangoFilterBackend, filters.SearchFilter]
+    filterset_class = RecipeFilter
     search_fields = ["name", "author__username"]
     pagination_class = Pagination
 
     def get_queryset(self):
         queryset = self.queryset.all()
-        user = self.request.user
-        author_id = self.request.query_params.get("author", None)
-        is_favorited = self.request.query_params.get("is_favorited", None)
-        is_in_shopping_cart = self.request.query_params.get("is_in_shopping_cart", None)
-
-        if author_id:
-            queryset = queryset.filter(author_id=author_id)
-
-        if not user.is_authenticated and (
-            is_favorited == "1" or is_in_shopping_cart == "1"
-        ):
-            return queryset.none()
-
-        if user.is_authenticated:
-            if is_favorited == "1":
-                favorite_ids = user.favorites.values_list('recipe_id', flat=True)
-                queryset = queryset.filter(id__in=favorite_ids)
-            if is_in_shopping_cart == "1":
-                cart_ids = user.shopping_carts.values_list('recipe_id', flat=True)
-                queryset = queryset.filter(id__in=cart_ids)
-
+        if self.request.query_params.get("ordering") == "popular":
+            queryset = queryset.order_by("-popularity_score", "-id")
         return queryset
 
+    def list(self, request, *args, **kwargs):
+        fields = requested_fields(request, RECIPE_FIELDS)
+        rows = recipe_rows(self.filter_queryset(self.get_queryset()), request, fields)
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(serialize_recipes(page, request, fields))
+        return Response(serialize_recipes(list(rows), request, fields))
+
+    def retrieve(self, request, *args, **kwargs):
+        fields = requested_fields(request, RECIPE_FIELDS)
+        instance = self.get_object()
+        rows = recipe_rows(Recipe.objects.filter(pk=instance.pk), request, fields)
+        return Response(serialize_recipes(list(rows), request, fields)[0])
+
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
 
+    @action(detail=False, methods=["get"])
+    def pantry(self, request):
+        """Рецепты из имеющихся ингредиентов: ?ingredients=1,2,3."""
+        try:
+            ingredient_ids = {
+                int(value)
+                for param in request.query_params.getlist("ingredients")
+                for value in param.split(",")
+                if value
+            }
+        except ValueError:
+            return Response(
+                {"ingredients": "Укажите id ингредиентов через запятую."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if not ingredient_ids:
+            return Response(
+                {"ingredients": "Список ингредиентов не может быть пустым."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        page = self.paginate_queryset(pantry_index.search(ingredient_ids))
+        missing = {recipe_id: count for recipe_id, count, _ in page}
+        fields = requested_fields(request, RECIPE_FIELDS)
+        rows = {
+            row["id"]: row
+            for row in recipe_rows(Recipe.objects.filter(id__in=missing), request, fields)
+        }
+        rows = [rows[recipe_id] for recipe_id in missing if recipe_id in rows]
+        results = serialize_recipes(rows, request, fields)
+        for row, result in zip(rows, results):
+            result["missing_ingredients"] = missing[row["id"]]
+        return self.get_paginated_response(results)
+
+    @action(detail=False, methods=["get"])
+    def trending(self, request):
+        """Популярные рецепты за окно: ?window=1h|24h|7d (по умолчанию 24h)."""
+        window = request.query_params.get("window", "24h")
+        if window not in TRENDING_WINDOWS:
+            return Response(
+                {"window": f"Допустимые значения: {', '.join(TRENDING_WINDOWS)}."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        page = self.paginate_queryset(leaderboard(window))
+        scores = dict(page)
+        fields = requested_fields(request, RECIPE_FIELDS)
+        rows = {
+            row["id"]: row
+            for row in recipe_rows(Recipe.objects.filter(id__in=scores), request, fields)
+        }
+        rows = [rows[recipe_id] for recipe_id in scores if recipe_id in rows]
+        return self.get_paginated_response(serialize_recipes(rows, request, fields))
+
     @action(
         detail=True,
         methods=["post", "delete"],
         permission_classes=[IsAuthenticated],
     )
+    @transaction.atomic
     def favorite(self, request, pk=None):
-        recipe = self.get_object()
-        user = request.user
-        if request.method == "POST":
-            if user.favorites.filter(recipe=recipe).exists():
-                return Response(
-                    {"detail": "Уже в избранном"}, status=status.HTTP_400_BAD_REQUEST
-                )
-            Favorite.objects.create(user=user, recipe=recipe)
-            serializer = SmallRecipeSerializer(recipe, context={"request": request})
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
-        elif request.method == "DELETE":
-            favorite = user.favorites.filter(recipe=recipe).first()
-            if favorite:
-                favorite.delete()
-                return Response(status=status.HTTP_204_NO_CONTENT)
-            return Response(
-                {"detail": "Не в избранном"}, status=status.HTTP_400_BAD_REQUEST
-            )
+        return self.toggle(
+            request, pk, Favorite, "Уже в избранном", "Не в избранном"
+        )
 
     @action(
         detail=True,
         methods=["post", "delete"],
         permission_classes=[IsAuthenticated],
     )
+    @transaction.atomic
     def shopping_cart(self, request, pk=None):
-        recipe = self.get_object()
-        user = request.user
+        return self.toggle(
+            request, pk, ShoppingCart, "Рецепт уже в корзине", "Рецепт не в корзине"
+        )
 
+    def toggle(self, request, pk, model, already_added, not_added):
+        """POST добавляет рецепт в избранное или корзину, DELETE убирает."""
+        recipe_id = object_id(pk, Recipe)
         if request.method == "POST":
-            if user.shopping_carts.filter(recipe=recipe).exists():
+            recipe, created = link(
+                model, request.user.id, recipe_id, SMALL_RECIPE_VALUES
+            )
+            if recipe is None:
+                raise not_found(Recipe)
+            if not created:
                 return Response(
-                    {"detail": "Рецепт уже в корзине"},
-                    status=status.HTTP_400_BAD_REQUEST,
+                    {"detail": already_added}, status=status.HTTP_400_BAD_REQUEST
                 )
-            ShoppingCart.objects.create(user=user, recipe=recipe)
-            serializer = SmallRecipeSerializer(recipe, context={"request": request})
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
-
-        elif request.method == "DELETE":
-            shopping_cart = user.shopping_carts.filter(recipe=recipe).first()
-            if shopping_cart:
-                shopping_cart.delete()
-                return Response(status=status.HTTP_204_NO_CONTENT)
             return Response(
-                {"detail": "Рецепт не в корзине"}, status=status.HTTP_400_BAD_REQUEST
+                serialize_small_recipes([recipe], request)[0],
+                status=status.HTTP_201_CREATED,
             )
+        exists, deleted = unlink(model, request.user.id, recipe_id)
+        if not exists:
+            raise not_found(Recipe)
+        if not deleted:
+            return Response(
+                {"detail": not_added}, status=status.HTTP_400_BAD_REQUEST
+            )
+        return Response(status=status.HTTP_204_NO_CONTENT)
 
     @action(
         detail=False, methods=["get"], permission_classes=[IsAuthenticated]
@@ -301,6 +463,13 @@ class ShoppingCartIngredientsView(APIView):
         return Response(serializer.data)
 
 
+class MetricsView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(metrics.snapshot())
+
+
 def redirect_short_link(request, slug):
     recipe = get_object_or_404(Recipe, short_code=slug)
     url = reverse("recipes-detail", args=[recipe.id])
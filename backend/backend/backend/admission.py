@@ -0,0 +1,136 @@
+"""Ограничение числа одновременных запросов по классам маршрутов.
+
+Слот класса — файл блокировки в ADMISSION_CONTROL['LOCK_DIR']; flock на
+файле держит слот, пока запрос выполняется. Так лимит общий для всех
+воркеров gunicorn на машине, а блокировки снимаются сами, если воркер упал.
+Потоки одного процесса делят дескриптор, поэтому у каждого слота есть ещё
+threading.Lock.
+
+Лимит адаптивный: процесс ведёт экспоненциальное среднее времени ответа
+класса, и если оно превышает TARGET_LATENCY, доступных слотов становится
+пропорционально меньше (но не меньше MIN_CONCURRENCY).
+"""
+import fcntl
+import os
+import threading
+import time
+
+from . import metrics
+
+
+class Slot:
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.fd = None
+        self.pid = None
+
+    def _descriptor(self):
+        # Дескриптор, открытый до fork, разделял бы блокировку с мастером.
+        if self.pid != os.getpid():
+            self.fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+            self.pid = os.getpid()
+        return self.fd
+
+    def try_acquire(self):
+        if not self.lock.acquire(blocking=False):
+            return False
+        try:
+            fcntl.flock(self._descriptor(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            self.lock.release()
+            return False
+        except BaseException:
+            self.lock.release()
+            raise
+        return True
+
+    def release(self):
+        try:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+        finally:
+            self.lock.release()
+
+
+class RouteClass:
+    def __init__(self, name, config, lock_dir):
+        self.name = name
+        self.views = frozenset(config['VIEWS'])
+        self.query_params = tuple(config.get('QUERY_PARAMS', ()))
+        self.max_concurrency = config['MAX_CONCURRENCY']
+        self.min_concurrency = config.get('MIN_CONCURRENCY', 1)
+        self.queue_timeout = config.get('QUEUE_TIMEOUT', 0.5)
+        self.target_latency = config.get('TARGET_LATENCY', 1.0)
+        self.smoothing = config.get('LATENCY_SMOOTHING', 0.2)
+        self.retry_after = config.get('RETRY_AFTER', 1)
+        self.latency = None
+        self.in_flight = 0
+        self._state_lock = threading.Lock()
+        os.makedirs(lock_dir, exist_ok=True)
+        self.slots = [
+            Slot(os.path.join(lock_dir, f'{name}.{index}.lock'))
+            for index in range(self.max_concurrency)
+        ]
+
+    def matches(self, request):
+        match = request.resolver_match
+        if match is None or match.view_name not in self.views:
+            return False
+        if self.query_params:
+            return any(request.GET.get(param) for param in self.query_params)
+        return True
+
+    @property
+    def limit(self):
+        latency = self.latency
+        if latency is None or latency <= self.target_latency:
+            return self.max_concurrency
+        scaled = int(self.max_concurrency * self.target_latency / latency)
+        return max(self.min_concurrency, min(self.max_concurrency, scaled))
+
+    def acquire(self):
+        """Занимает слот, ожидая не дольше queue_timeout; None, если не вышло."""
+        started = time.monotonic()
+        delay = 0.005
+        while True:
+            for slot in self.slots[:self.limit]:
+                if slot.try_acquire():
+                    waited = time.monotonic() - started
+                    metrics.increment(f'admission.{self.name}.admitted')
+                    if waited > 0.001:
+                        metrics.increment(f'admission.{self.name}.queued')
+                    metrics.increment(
+                        f'admission.{self.name}.wait_seconds_total', waited
+                    )
+                    with self._state_lock:
+                        self.in_flight += 1
+                        metrics.set_gauge(
+                            f'admission.{self.name}.in_flight', self.in_flight
+                        )
+                    return slot
+            remaining = self.queue_timeout - (time.monotonic() - started)
+            if remaining <= 0:
+                metrics.increment(f'admission.{self.name}.rejected')
+                return None
+            time.sleep(min(delay, remaining))
+            delay = min(delay * 2, 0.05)
+
+    def release(self, slot, elapsed):
+        slot.release()
+        with self._state_lock:
+            self.in_flight -= 1
+            if self.latency is None:
+                self.latency = elapsed
+            else:
+                self.latency += self.smoothing * (elapsed - self.latency)
+            metrics.set_gauge(f'admission.{self.name}.in_flight', self.in_flight)
+            metrics.set_gauge(f'admission.{self.name}.latency_ewma', self.latency)
+            metrics.set_gauge(f'admission.{self.name}.limit', self.limit)
+
+
+def load_route_classes(config):
+    lock_dir = config['LOCK_DIR']
+    return [
+        RouteClass(name, route_config, lock_dir)
+        for name, route_config in config['ROUTE_CLASSES'].items()
+    ]
@@ -0,0 +1,80 @@
+import random
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DatabaseError, DEFAULT_DB_ALIAS, connections
+
+# Выставляется ReplicaRoutingMiddleware: читать с реплик можно только
+# в безопасных запросах пользователя, который недавно ничего не изменял.
+replica_reads_allowed = ContextVar('replica_reads_allowed', default=False)
+
+REPLICA_LAG_SQL = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(
+            EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0
+        )
+    END
+"""
+
+
+class ReplicaHealth:
+    """Кэширует отставание реплики, чтобы не проверять его на каждый запрос."""
+
+    def __init__(self, alias):
+        self.alias = alias
+        self.checked_at = 0.0
+        self.lag = None
+
+    def is_usable(self):
+        now = time.monotonic()
+        if now - self.checked_at >= settings.DB_REPLICA_LAG_CHECK_INTERVAL:
+            self.checked_at = now
+            self.lag = self.measure_lag()
+        return self.lag is not None and self.lag <= settings.DB_REPLICA_MAX_LAG
+
+    def measure_lag(self):
+        try:
+            with connections[self.alias].cursor() as cursor:
+                cursor.execute(REPLICA_LAG_SQL)
+                return float(cursor.fetchone()[0])
+        except DatabaseError:
+            connections[self.alias].close()
+            return None
+
+
+class PrimaryReplicaRouter:
+    """Отправляет чтение на реплики, а запись и миграции — на основную базу.
+
+    Если все реплики недоступны или отстают больше DB_REPLICA_MAX_LAG секунд,
+    чтение возвращается на основную базу.
+    """
+
+    def __init__(self):
+        self.replicas = [
+            ReplicaHealth(alias) for alias in settings.DATABASES
+            if alias != DEFAULT_DB_ALIAS
+        ]
+
+    def db_for_read(self, model, **hints):
+        if (
+            not self.replicas
+            or not replica_reads_allowed.get()
+            or connections[DEFAULT_DB_ALIAS].in_atomic_block
+        ):
+            return DEFAULT_DB_ALIAS
+        healthy = [replica for replica in self.replicas if replica.is_usable()]
+        if not healthy:
+            return DEFAULT_DB_ALIAS
+        return random.choice(healthy).alias
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
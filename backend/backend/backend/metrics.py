@@ -0,0 +1,44 @@
+"""Простые счётчики процесса для мониторинга.
+
+Значения живут в памяти воркера; снимок отдаёт /api/metrics/.
+"""
+import os
+import threading
+from collections import defaultdict
+
+_lock = threading.Lock()
+_counters = defaultdict(float)
+_gauges = {}
+_collectors = []
+
+
+def increment(name, value=1):
+    with _lock:
+        _counters[name] += value
+
+
+def set_gauge(name, value):
+    with _lock:
+        _gauges[name] = value
+
+
+def observe_max(name, value):
+    with _lock:
+        if value > _gauges.get(name, 0):
+            _gauges[name] = value
+
+
+def register_collector(collector):
+    """Регистрирует функцию, которая возвращает словарь метрик на момент снимка."""
+    with _lock:
+        if collector not in _collectors:
+            _collectors.append(collector)
+
+
+def snapshot():
+    with _lock:
+        data = {**_counters, **_gauges}
+        collectors = list(_collectors)
+    for collector in collectors:
+        data.update(collector())
+    return {'pid': os.getpid(), 'metrics': dict(sorted(data.items()))}
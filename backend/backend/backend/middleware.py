@@ -0,0 +1,84 @@
+import time
+
+from django.conf import settings
+from django.http import JsonResponse
+from rest_framework.permissions import SAFE_METHODS
+
+from .admission import load_route_classes
+from .db_routers import replica_reads_allowed
+
+
+class ReplicaRoutingMiddleware:
+    """Закрепляет пользователя за основной базой после изменений.
+
+    После небезопасного запроса клиент получает cookie (и заголовок с тем же
+    именем) на DB_REPLICA_PIN_SECONDS секунд; пока они передаются, чтение
+    идёт с основной базы, и пользователь сразу видит свои изменения.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.cookie_name = settings.DB_PRIMARY_PIN_COOKIE
+        self.header_name = 'X-' + self.cookie_name.replace('_', '-')
+
+    def __call__(self, request):
+        pinned = (
+            self.cookie_name in request.COOKIES
+            or self.header_name in request.headers
+        )
+        token = replica_reads_allowed.set(
+            request.method in SAFE_METHODS and not pinned
+        )
+        try:
+            response = self.get_response(request)
+        finally:
+            replica_reads_allowed.reset(token)
+
+        if request.method not in SAFE_METHODS:
+            pin_seconds = settings.DB_REPLICA_PIN_SECONDS
+            response.set_cookie(
+                self.cookie_name, '1', max_age=pin_seconds, samesite='Lax'
+            )
+            response[self.header_name] = str(pin_seconds)
+        return response
+
+
+class AdmissionControlMiddleware:
+    """Ограничивает одновременные запросы к дорогим эндпоинтам.
+
+    Классы маршрутов и их лимиты задаются в ADMISSION_CONTROL. Запрос ждёт
+    свободного слота не дольше QUEUE_TIMEOUT, иначе получает 503 с
+    Retry-After. Счётчики доступны в /api/metrics/ с префиксом admission.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        config = settings.ADMISSION_CONTROL
+        self.route_classes = (
+            load_route_classes(config) if config['ENABLED'] else []
+        )
+
+    def __call__(self, request):
+        request.admission_slot = None
+        try:
+            return self.get_response(request)
+        finally:
+            if request.admission_slot is not None:
+                route_class, slot, started = request.admission_slot
+                route_class.release(slot, time.monotonic() - started)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        for route_class in self.route_classes:
+            if not route_class.matches(request):
+                continue
+            slot = route_class.acquire()
+            if slot is None:
+                response = JsonResponse(
+                    {'detail': 'Сервер перегружен, повторите запрос позже.'},
+                    status=503,
+                )
+                response['Retry-After'] = str(route_class.retry_after)
+                return response
+            request.admission_slot = (route_class, slot, time.monotonic())
+            return None
+        return None
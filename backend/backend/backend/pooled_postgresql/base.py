@@ -0,0 +1,205 @@
+"""PostgreSQL-бэкенд с пулом соединений внутри процесса.
+
+Django по-прежнему «закрывает» соединение в конце запроса (CONN_MAX_AGE=0),
+но вместо разрыва оно возвращается в пул и выдаётся следующему запросу.
+Настройки пула задаются ключом POOL в описании базы:
+MAX_SIZE, TIMEOUT и HEALTH_CHECK_INTERVAL (в секундах).
+"""
+import os
+import threading
+import time
+from queue import Empty, LifoQueue
+
+from django.db.backends.postgresql import base
+
+from backend import metrics
+
+TRANSACTION_STATUS_IDLE = 0
+TRANSACTION_STATUS_UNKNOWN = 4
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+class ConnectionPool:
+
+    def __init__(self, alias, max_size=10, timeout=5, health_check_interval=30):
+        self.alias = alias
+        self.max_size = max_size
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+        self.isolation_level = None
+        self.idle = LifoQueue()
+        self.lock = threading.Lock()
+        self.size = 0
+        self.stats = {
+            'checkouts': 0,
+            'created': 0,
+            'discarded': 0,
+            'timeouts': 0,
+            'wait_seconds_total': 0.0,
+            'wait_seconds_max': 0.0,
+        }
+
+    def checkout(self, connect):
+        started = time.monotonic()
+        while True:
+            connection = self._take_idle(started)
+            if connection is None:
+                try:
+                    connection = connect()
+                except Exception:
+                    with self.lock:
+                        self.size -= 1
+                    raise
+                break
+            if self._is_healthy(*connection):
+                connection = connection[0]
+                break
+            self._discard(connection[0])
+
+        waited = time.monotonic() - started
+        with self.lock:
+            self.stats['checkouts'] += 1
+            self.stats['wait_seconds_total'] += waited
+            self.stats['wait_seconds_max'] = max(self.stats['wait_seconds_max'], waited)
+        return connection
+
+    def checkin(self, connection):
+        if connection.closed:
+            self._discard(connection)
+            return
+        status = connection.info.transaction_status
+        if status == TRANSACTION_STATUS_UNKNOWN:
+            self._discard(connection)
+            return
+        if status != TRANSACTION_STATUS_IDLE:
+            try:
+                connection.rollback()
+            except base.Database.Error:
+                self._discard(connection)
+                return
+        self.idle.put((connection, time.monotonic()))
+
+    def _take_idle(self, started):
+        """Возвращает свободное соединение или None, если можно открыть новое."""
+        while True:
+            try:
+                return self.idle.get_nowait()
+            except Empty:
+                pass
+            with self.lock:
+                if self.size < self.max_size:
+                    self.size += 1
+                    self.stats['created'] += 1
+                    return None
+            remaining = self.timeout - (time.monotonic() - started)
+            if remaining <= 0:
+                with self.lock:
+                    self.stats['timeouts'] += 1
+                raise base.Database.OperationalError(
+                    f"Пул соединений '{self.alias}' исчерпан ({self.max_size})."
+                )
+            try:
+                return self.idle.get(timeout=remaining)
+            except Empty:
+                continue
+
+    def _is_healthy(self, connection, returned_at):
+        if connection.closed:
+            return False
+        if time.monotonic() - returned_at < self.health_check_interval:
+            return True
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            if connection.info.transaction_status != TRANSACTION_STATUS_IDLE:
+                connection.rollback()
+        except base.Database.Error:
+            return False
+        return True
+
+    def _discard(self, connection):
+        try:
+            connection.close()
+        except base.Database.Error:
+            pass
+        with self.lock:
+            self.size -= 1
+            self.stats['discarded'] += 1
+
+    def close_idle(self):
+        while True:
+            try:
+                connection, _ = self.idle.get_nowait()
+            except Empty:
+                return
+            self._discard(connection)
+
+    def collect_metrics(self):
+        prefix = f'db_pool.{self.alias}.'
+        with self.lock:
+            data = {prefix + name: value for name, value in self.stats.items()}
+            data[prefix + 'size'] = self.size
+        data[prefix + 'idle'] = self.idle.qsize()
+        data[prefix + 'max_size'] = self.max_size
+        return data
+
+
+def get_pool(alias, settings_dict):
+    # После fork (gunicorn --preload) соединения родителя использовать нельзя.
+    key = (os.getpid(), alias)
+    pool = _pools.get(key)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(key)
+            if pool is None:
+                options = settings_dict.get('POOL', {})
+                pool = ConnectionPool(
+                    alias,
+                    max_size=options.get('MAX_SIZE', 10),
+                    timeout=options.get('TIMEOUT', 5),
+                    health_check_interval=options.get('HEALTH_CHECK_INTERVAL', 30),
+                )
+                _pools[key] = pool
+    return pool
+
+
+def close_pools():
+    """Закрывает свободные соединения пулов процесса (например, перед fork)."""
+    pid = os.getpid()
+    for (owner_pid, _), pool in list(_pools.items()):
+        if owner_pid == pid:
+            pool.close_idle()
+
+
+def collect_metrics():
+    data = {}
+    pid = os.getpid()
+    for (owner_pid, _), pool in list(_pools.items()):
+        if owner_pid == pid:
+            data.update(pool.collect_metrics())
+    return data
+
+
+metrics.register_collector(collect_metrics)
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+
+    def get_new_connection(self, conn_params):
+        pool = get_pool(self.alias, self.settings_dict)
+
+        def connect():
+            connection = super(DatabaseWrapper, self).get_new_connection(conn_params)
+            pool.isolation_level = self.isolation_level
+            return connection
+
+        connection = pool.checkout(connect)
+        self.isolation_level = pool.isolation_level
+        return connection
+
+    def _close(self):
+        if self.connection is not None:
+            with self.wrap_database_errors:
+                get_pool(self.alias, self.settings_dict).checkin(self.connection)
@@ -0,0 +1,185 @@
+"""Pub/sub для событий, которые SSE (/api/events/) отправляет клиентам.
+
+Бэкенд выбирается настройкой PUBSUB_BACKEND:
+
+- LocalPubSub — подписчики в памяти процесса. Годится, когда изменения и
+  SSE обслуживает один процесс ASGI.
+- PostgresPubSub — публикация через NOTIFY, каждый процесс с подписчиками
+  слушает канал LISTEN в отдельном потоке. Нужен, когда изменения делают
+  воркеры gunicorn, а SSE — отдельный процесс ASGI.
+
+publish() можно вызывать из любого потока. Подписка живёт в цикле asyncio
+подписчика: сообщения кладутся в её очередь через call_soon_threadsafe.
+Если клиент не успевает читать и очередь переполнена, подписка помечается
+overflowed, и поток SSE просит клиента перечитать состояние.
+"""
+import asyncio
+import logging
+import select
+import threading
+import time
+from collections import defaultdict
+
+import orjson
+from django.conf import settings
+from django.db import connection, connections
+from django.utils.module_loading import import_string
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+SUBSCRIPTION_QUEUE_SIZE = 100
+
+_pubsub = None
+_pubsub_lock = threading.Lock()
+
+
+class Subscription:
+
+    def __init__(self, pubsub, channel):
+        self.pubsub = pubsub
+        self.channel = channel
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=SUBSCRIPTION_QUEUE_SIZE)
+        self.overflowed = False
+
+    def deliver(self, message):
+        try:
+            self.loop.call_soon_threadsafe(self._put, message)
+        except RuntimeError:
+            # Цикл подписчика уже закрыт.
+            self.close()
+
+    def _put(self, message):
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            self.overflowed = True
+            metrics.increment('pubsub.overflows')
+
+    async def get(self, timeout=None):
+        """Следующее сообщение или None, если за timeout секунд его не было."""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def close(self):
+        self.pubsub.unsubscribe(self)
+
+
+class LocalPubSub:
+    """Подписчики в памяти процесса."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscriptions = defaultdict(set)
+
+    def publish(self, channel, message):
+        self.deliver(channel, message)
+
+    def deliver(self, channel, message):
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(channel, ()))
+        for subscription in subscriptions:
+            subscription.deliver(message)
+        metrics.increment('pubsub.delivered', len(subscriptions))
+
+    def deliver_all(self, message):
+        with self._lock:
+            subscriptions = [
+                subscription
+                for channel in self._subscriptions.values()
+                for subscription in channel
+            ]
+        for subscription in subscriptions:
+            subscription.deliver(message)
+
+    def subscribe(self, channel):
+        """Подписка на channel; вызывать из цикла asyncio."""
+        subscription = Subscription(self, channel)
+        with self._lock:
+            self._subscriptions[channel].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            channel = self._subscriptions.get(subscription.channel)
+            if channel is not None:
+                channel.discard(subscription)
+                if not channel:
+                    del self._subscriptions[subscription.channel]
+
+
+class PostgresPubSub(LocalPubSub):
+    """Публикация через NOTIFY, доставка из потока LISTEN этого процесса.
+
+    NOTIFY внутри транзакции отправляется при её коммите. Если соединение
+    LISTEN обрывается, поток переподключается, а подписчики получают
+    RESYNC: уведомления за время обрыва потеряны.
+    """
+
+    CHANNEL = 'foodgram_events'
+    RESYNC = {'type': 'resync'}
+    POLL_SECONDS = 5
+    RECONNECT_SECONDS = 1
+
+    def __init__(self):
+        super().__init__()
+        self._listener = None
+
+    def publish(self, channel, message):
+        payload = orjson.dumps({'channel': channel, 'message': message}).decode()
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_notify(%s, %s)', [self.CHANNEL, payload])
+
+    def subscribe(self, channel):
+        with self._lock:
+            if self._listener is None or not self._listener.is_alive():
+                self._listener = threading.Thread(
+                    target=self._listen, name='pubsub-listen', daemon=True
+                )
+                self._listener.start()
+        return super().subscribe(channel)
+
+    def _listen(self):
+        import psycopg2
+
+        params = connections['default'].get_connection_params()
+        reconnect = False
+        while True:
+            listener = None
+            try:
+                listener = psycopg2.connect(**params)
+                listener.autocommit = True
+                with listener.cursor() as cursor:
+                    cursor.execute(f'LISTEN {self.CHANNEL}')
+                if reconnect:
+                    self.deliver_all(self.RESYNC)
+                reconnect = True
+                while True:
+                    if select.select([listener], [], [], self.POLL_SECONDS) == ([], [], []):
+                        continue
+                    listener.poll()
+                    while listener.notifies:
+                        notify = listener.notifies.pop(0)
+                        data = orjson.loads(notify.payload)
+                        self.deliver(data['channel'], data['message'])
+            except (psycopg2.Error, OSError):
+                logger.exception('Соединение LISTEN %s потеряно', self.CHANNEL)
+                metrics.increment('pubsub.reconnects')
+                time.sleep(self.RECONNECT_SECONDS)
+            finally:
+                if listener is not None:
+                    listener.close()
+
+
+def get_pubsub():
+    """Экземпляр бэкенда из PUBSUB_BACKEND, один на процесс."""
+    global _pubsub
+    if _pubsub is None:
+        with _pubsub_lock:
+            if _pubsub is None:
+                _pubsub = import_string(settings.PUBSUB_BACKEND)()
+    return _pubsub
@@ -0,0 +1,242 @@
+"""Журнал медленных запросов к базе с местом в коде, откуда они пришли.
+
+QueryLogMiddleware на время запроса ставит QueryRecorder через
+connection.execute_wrapper на все соединения. Для каждого SQL известны
+время, отпечаток (SQL без литералов, списки %s свёрнуты) и первые кадры
+стека из кода приложений: api/views.py, api/serializers.py и т. п.
+
+В конце запроса в логгер querylog пишется одна строка NDJSON, если были
+запросы дольше SLOW_MS или один отпечаток выполнялся DUPLICATE_THRESHOLD
+и более раз (N+1). Для доли EXPLAIN_SAMPLE_RATE медленных SELECT, собранных
+ORM, выполняется EXPLAIN (ANALYZE, BUFFERS) и план попадает в запись.
+Параметры запросов в журнал не пишутся.
+
+Обёртка снимается, когда view вернула ответ, поэтому запросы потоковых
+ответов (экспорт /api/users/me/export/, события /api/events/), которые
+выполняются при отдаче тела, в журнал не попадают.
+"""
+import logging
+import os
+import random
+import re
+import sys
+import time
+from collections import defaultdict
+from contextlib import ExitStack
+from functools import lru_cache
+
+import orjson
+from django.conf import settings
+from django.db import DatabaseError, connections, transaction
+
+from . import metrics
+
+logger = logging.getLogger('querylog')
+
+LOCATION_DEPTH = 3
+SQL_MAX_LENGTH = 2000
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_PLACEHOLDER_LISTS = re.compile(r'%s(?:, %s)+')
+# Блокировки строк и функции с побочными эффектами: EXPLAIN ANALYZE
+# выполнил бы их ещё раз.
+_SIDE_EFFECTS = re.compile(
+    r'\b(?:nextval|setval|pg_notify|pg_(?:try_)?advisory\w*|pg_sleep\w*|set_config'
+    r'|pg_cancel_backend|pg_terminate_backend|lo_\w+|dblink\w*)\s*\('
+    r'|\bFOR\s+(?:NO\s+KEY\s+UPDATE|KEY\s+SHARE|UPDATE|SHARE)\b',
+    re.IGNORECASE,
+)
+_BACKENDS = os.path.join('django', 'db', 'backends', '')
+_COMPILER = os.path.join('django', 'db', 'models', 'sql', 'compiler.py')
+
+
+@lru_cache(maxsize=2048)
+def fingerprint(sql):
+    """SQL без литералов и со свёрнутыми списками параметров."""
+    sql = _LITERALS.sub('?', sql)
+    return _PLACEHOLDER_LISTS.sub('%s, ...', sql)[:SQL_MAX_LENGTH]
+
+
+@lru_cache(maxsize=512)
+def _project_path(filename):
+    """Путь относительно BASE_DIR для кода приложений, иначе None.
+
+    Пакет настроек backend (middleware, роутер) в место запроса не входит.
+    """
+    root = str(settings.BASE_DIR) + os.sep
+    if not filename.startswith(root):
+        return None
+    path = filename[len(root):]
+    parts = path.split(os.sep)
+    if parts[0] == 'backend' or 'site-packages' in parts:
+        return None
+    return path
+
+
+def code_location(frame):
+    """Кадры проекта, ближайшие к запросу: ['api/loaders.py:54 load', ...]."""
+    location = []
+    while frame is not None and len(location) < LOCATION_DEPTH:
+        path = _project_path(frame.f_code.co_filename)
+        if path is not None:
+            location.append(f'{path}:{frame.f_lineno} {frame.f_code.co_name}')
+        frame = frame.f_back
+    return location
+
+
+def explainable(sql, frame):
+    """Можно ли повторить запрос под EXPLAIN ANALYZE.
+
+    Только SELECT, собранные ORM: сырой SQL (SELECT pg_notify(...) из
+    backend/pubsub.py и т. п.) может менять состояние. Функции с побочными
+    эффектами могут попасть и в запрос ORM (Func, RawSQL), поэтому SQL ещё
+    проверяется на _SIDE_EFFECTS.
+    """
+    if sql.lstrip()[:6].upper() != 'SELECT' or _SIDE_EFFECTS.search(sql):
+        return False
+    # Первый кадр над обёртками курсора — тот, кто выполнил запрос.
+    while frame is not None and _BACKENDS in frame.f_code.co_filename:
+        frame = frame.f_back
+    return frame is not None and frame.f_code.co_filename.endswith(_COMPILER)
+
+
+def plan_summary(plan):
+    """Главное из плана EXPLAIN (FORMAT JSON)."""
+    root = plan['Plan']
+    return {
+        'node': root['Node Type'],
+        'total_cost': root['Total Cost'],
+        'actual_ms': root.get('Actual Total Time'),
+        'rows': root.get('Actual Rows'),
+        'shared_hit': root.get('Shared Hit Blocks'),
+        'shared_read': root.get('Shared Read Blocks'),
+        'plan': root,
+    }
+
+
+class QueryRecorder:
+    """Обёртка execute_wrapper: собирает запросы одного HTTP-запроса."""
+
+    def __init__(self, config):
+        self.slow_seconds = config['SLOW_MS'] / 1000
+        self.explain_rate = config['EXPLAIN_SAMPLE_RATE']
+        self.duplicate_threshold = config['DUPLICATE_THRESHOLD']
+        self.count = 0
+        self.duration = 0.0
+        self.slow = []
+        # отпечаток -> [количество, время, разных параметров, место]
+        self.groups = defaultdict(lambda: [0, 0.0, set(), None])
+        self.explaining = False
+
+    def __call__(self, execute, sql, params, many, context):
+        if self.explaining:
+            return execute(sql, params, many, context)
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.record(sql, params, many, context, elapsed)
+
+    def record(self, sql, params, many, context, elapsed):
+        self.count += 1
+        self.duration += elapsed
+        key = fingerprint(sql)
+        group = self.groups[key]
+        group[0] += 1
+        group[1] += elapsed
+        try:
+            group[2].add(hash((sql, params if many else tuple(params or ()))))
+        except TypeError:
+            group[2].add(group[0])
+        if group[3] is None:
+            group[3] = code_location(sys._getframe(2))
+        if elapsed < self.slow_seconds:
+            return
+        entry = {
+            'sql': key,
+            'ms': round(elapsed * 1000, 2),
+            'location': group[3] if group[0] == 1 else code_location(sys._getframe(2)),
+            'alias': context['connection'].alias,
+        }
+        if (
+            not many
+            and self.explain_rate
+            and random.random() < self.explain_rate
+            and explainable(sql, sys._getframe(2))
+        ):
+            entry['explain'] = self.explain(context['connection'], sql, params)
+        self.slow.append(entry)
+
+    def explain(self, connection, sql, params):
+        """EXPLAIN ANALYZE повторяет запрос, поэтому только для explainable()."""
+        self.explaining = True
+        try:
+            # Ошибка EXPLAIN не должна прерывать транзакцию запроса.
+            with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+                cursor.execute(f'EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {sql}', params)
+                plan = cursor.fetchone()[0]
+        except DatabaseError as error:
+            return {'error': str(error).strip()}
+        finally:
+            self.explaining = False
+        metrics.increment('querylog.explains')
+        return plan_summary(plan[0] if isinstance(plan, list) else orjson.loads(plan)[0])
+
+    def duplicates(self):
+        return [
+            {
+                'sql': key,
+                'count': count,
+                'identical': count - len(distinct),
+                'ms': round(duration * 1000, 2),
+                'location': location,
+            }
+            for key, (count, duration, distinct, location) in sorted(
+                self.groups.items(), key=lambda item: -item[1][0]
+            )
+            if count >= self.duplicate_threshold
+        ]
+
+
+class QueryLogMiddleware:
+    """Пишет в логгер querylog запросы с медленным SQL или N+1.
+
+    Настройки — QUERY_LOG в settings. Счётчики доступны в /api/metrics/
+    с префиксом querylog.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.config = settings.QUERY_LOG
+
+    def __call__(self, request):
+        if not self.config['ENABLED']:
+            return self.get_response(request)
+        recorder = QueryRecorder(self.config)
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for alias in settings.DATABASES:
+                stack.enter_context(connections[alias].execute_wrapper(recorder))
+            response = self.get_response(request)
+        duplicates = recorder.duplicates()
+        if recorder.slow or duplicates:
+            self.write(request, response, recorder, duplicates, started)
+        return response
+
+    def write(self, request, response, recorder, duplicates, started):
+        metrics.increment('querylog.slow_queries', len(recorder.slow))
+        if duplicates:
+            metrics.increment('querylog.duplicate_requests')
+        match = getattr(request, 'resolver_match', None)
+        logger.info(orjson.dumps({
+            'ts': time.time(),
+            'method': request.method,
+            'path': request.path,
+            'view': match.view_name if match else None,
+            'status': response.status_code,
+            'ms': round((time.perf_counter() - started) * 1000, 2),
+            'queries': recorder.count,
+            'db_ms': round(recorder.duration * 1000, 2),
+            'slow': recorder.slow,
+            'duplicates': duplicates,
+        }, default=str).decode())
@@ -1,5 +1,6 @@
 from pathlib import Path
 import os
+import tempfile
 from django.core.management.utils import get_random_secret_key
 from dotenv import load_dotenv
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -30,6 +31,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework',
     'rest_framework.authtoken',
     'djoser',
@@ -39,6 +41,8 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'backend.querylog.QueryLogMiddleware',
+    'backend.middleware.ReplicaRoutingMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.locale.LocaleMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -46,6 +50,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'backend.middleware.AdmissionControlMiddleware',
 ]
 
 ROOT_URLCONF = 'backend.urls'
@@ -83,6 +88,71 @@ DATABASES = {
     }
 }
 
+# Переиспользование соединений: none — новое соединение на каждый запрос,
+# persistent — постоянные соединения Django с проверкой перед запросом,
+# pool — пул соединений внутри процесса (backend.pooled_postgresql).
+DB_CONNECTION_MODE = os.getenv('DB_CONNECTION_MODE', 'persistent')
+if DB_CONNECTION_MODE == 'persistent':
+    DATABASES['default']['CONN_MAX_AGE'] = int(os.getenv('DB_CONN_MAX_AGE', 600))
+    DATABASES['default']['CONN_HEALTH_CHECKS'] = True
+elif DB_CONNECTION_MODE == 'pool':
+    DATABASES['default']['ENGINE'] = 'backend.pooled_postgresql'
+    DATABASES['default']['POOL'] = {
+        'MAX_SIZE': int(os.getenv('DB_POOL_MAX_SIZE', 10)),
+        'TIMEOUT': float(os.getenv('DB_POOL_TIMEOUT', 5)),
+        'HEALTH_CHECK_INTERVAL': float(os.getenv('DB_POOL_HEALTH_CHECK_INTERVAL', 30)),
+    }
+
+# Реплики для чтения: DB_REPLICA_HOSTS=replica1:5432,replica2
+# Локально в качестве реплики можно указать тот же сервер, что и DB_HOST.
+for index, replica in enumerate(filter(None, os.getenv('DB_REPLICA_HOSTS', '').split(','))):
+    replica_host, _, replica_port = replica.partition(':')
+    DATABASES[f'replica_{index}'] = {
+        **DATABASES['default'],
+        'HOST': replica_host,
+        'PORT': replica_port or DATABASES['default']['PORT'],
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['backend.db_routers.PrimaryReplicaRouter']
+DB_REPLICA_MAX_LAG = float(os.getenv('DB_REPLICA_MAX_LAG', 2))
+DB_REPLICA_LAG_CHECK_INTERVAL = float(os.getenv('DB_REPLICA_LAG_CHECK_INTERVAL', 5))
+DB_REPLICA_PIN_SECONDS = int(os.getenv('DB_REPLICA_PIN_SECONDS', 10))
+DB_PRIMARY_PIN_COOKIE = 'db_primary_pin'
+
+# Лимиты одновременных запросов к дорогим эндпоинтам (общие для всех воркеров).
+ADMISSION_CONTROL = {
+    'ENABLED': os.getenv('ADMISSION_CONTROL_ENABLED', 'True').lower() in ('true', '1'),
+    'LOCK_DIR': os.getenv(
+        'ADMISSION_LOCK_DIR', os.path.join(tempfile.gettempdir(), 'foodgram-admission')
+    ),
+    'ROUTE_CLASSES': {
+        'shopping_list': {
+            'VIEWS': ['recipes-download-shopping-cart', 'shopping_cart_ingredients'],
+            'MAX_CONCURRENCY': int(os.getenv('ADMISSION_SHOPPING_LIST_LIMIT', 2)),
+            'QUEUE_TIMEOUT': 1.0,
+            'TARGET_LATENCY': 1.0,
+        },
+        'subscriptions': {
+            'VIEWS': ['users-subscriptions'],
+            'MAX_CONCURRENCY': int(os.getenv('ADMISSION_SUBSCRIPTIONS_LIMIT', 4)),
+            'QUEUE_TIMEOUT': 0.5,
+            'TARGET_LATENCY': 0.5,
+        },
+        # Только дорогие параметры: ?search= (icontains по названию и автору)
+        # и подбор по продуктам. Фильтры ленты (author, tags, is_favorited,
+        # is_in_shopping_cart) и автодополнение ингредиентов идут по индексам
+        # и не ограничиваются.
+        'search': {
+            'VIEWS': ['recipes-list', 'recipes-pantry'],
+            'QUERY_PARAMS': ['search', 'ingredients'],
+            'MAX_CONCURRENCY': int(os.getenv('ADMISSION_SEARCH_LIMIT', 4)),
+            'QUEUE_TIMEOUT': 0.3,
+            'TARGET_LATENCY': 0.3,
+        },
+    },
+}
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -126,6 +196,109 @@ STATICFILES_DIRS = [BASE_DIR / 'frontend' / 'build' / 'static',]
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, "media")
 
+# Медиа хранятся по хешу содержимого (backend/storage.py): одинаковые файлы
+# пишутся один раз, неиспользуемые удаляет manage.py gc_media.
+STORAGES = {
+    'default': {
+        'BACKEND': 'backend.storage.ContentAddressedStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage',
+    },
+}
+# Файлы моложе этого срока gc_media не трогает: запись о них может быть ещё
+# не закоммичена.
+MEDIA_GC_GRACE_SECONDS = int(os.getenv('MEDIA_GC_GRACE_SECONDS', 3600))
+# Файлы из multipart/form-data больше этого размера пишутся во временный
+# файл по мере чтения запроса, а не собираются в памяти воркера.
+FILE_UPLOAD_MAX_MEMORY_SIZE = int(os.getenv('FILE_UPLOAD_MAX_MEMORY_SIZE', 64 * 1024))
+
+# Каталог для готового JSON справочника ингредиентов (его может отдавать nginx).
+INGREDIENT_SNAPSHOT_DIR = os.getenv('INGREDIENT_SNAPSHOT_DIR', '')
+INGREDIENT_SNAPSHOT_TTL = int(os.getenv('INGREDIENT_SNAPSHOT_TTL', 300))
+
+# Индекс поиска рецептов по имеющимся ингредиентам (recipes/pantry.py).
+PANTRY_INDEX_REFRESH_INTERVAL = float(os.getenv('PANTRY_INDEX_REFRESH_INTERVAL', 2))
+PANTRY_INDEX_TTL = int(os.getenv('PANTRY_INDEX_TTL', 600))
+
+# Почти одинаковые рецепты (recipes/duplicates.py): порог оценки сходства,
+# выше которого новый рецепт автора считается повтором его же рецепта, и
+# обновление индекса в памяти процесса.
+RECIPE_DUPLICATE_THRESHOLD = float(os.getenv('RECIPE_DUPLICATE_THRESHOLD', 0.7))
+DUPLICATE_INDEX_REFRESH_INTERVAL = float(os.getenv('DUPLICATE_INDEX_REFRESH_INTERVAL', 2))
+DUPLICATE_INDEX_TTL = int(os.getenv('DUPLICATE_INDEX_TTL', 600))
+
+# Популярность рецептов (recipes/popularity.py): период полураспада, веса
+# событий и порог, ниже которого значение обнуляется.
+POPULARITY_HALF_LIFE_HOURS = float(os.getenv('POPULARITY_HALF_LIFE_HOURS', 72))
+POPULARITY_WEIGHTS = {
+    'favorite': 1.0,
+    'shopping_cart': 0.5,
+}
+POPULARITY_MIN_SCORE = 0.01
+
+# Потребители outbox событий (recipes/outbox.py): имя -> обработчик пачки.
+OUTBOX_CONSUMERS = {
+    'trending': 'recipes.trending.consume',
+}
+OUTBOX_BATCH_SIZE = int(os.getenv('OUTBOX_BATCH_SIZE', 500))
+OUTBOX_POLL_INTERVAL = float(os.getenv('OUTBOX_POLL_INTERVAL', 1))
+OUTBOX_RETENTION_HOURS = int(os.getenv('OUTBOX_RETENTION_HOURS', 168))
+
+# Рейтинг популярных за окно (recipes/trending.py): размер рейтинга и сколько
+# секунд процесс держит его в памяти.
+TRENDING_TOP_K = int(os.getenv('TRENDING_TOP_K', 100))
+TRENDING_CACHE_SECONDS = float(os.getenv('TRENDING_CACHE_SECONDS', 30))
+
+# Поток событий /api/events/ (api/events.py) и pub/sub для него
+# (backend/pubsub.py): LocalPubSub — в пределах процесса, PostgresPubSub —
+# через LISTEN/NOTIFY, когда изменения и SSE обслуживают разные процессы.
+PUBSUB_BACKEND = os.getenv('PUBSUB_BACKEND', 'backend.pubsub.LocalPubSub')
+EVENTS_HEARTBEAT_SECONDS = float(os.getenv('EVENTS_HEARTBEAT_SECONDS', 15))
+EVENTS_MAX_STREAM_SECONDS = float(os.getenv('EVENTS_MAX_STREAM_SECONDS', 300))
+EVENTS_RETRY_MILLISECONDS = int(os.getenv('EVENTS_RETRY_MILLISECONDS', 3000))
+EVENTS_REPLAY_LIMIT = int(os.getenv('EVENTS_REPLAY_LIMIT', 500))
+# Срок токена ?token= для EventSource, с; проверяется только при подключении.
+EVENTS_STREAM_TOKEN_SECONDS = int(os.getenv('EVENTS_STREAM_TOKEN_SECONDS', 60))
+
+# Журнал медленных запросов и N+1 (backend/querylog.py): запрос дольше
+# SLOW_MS или отпечаток SQL, выполненный DUPLICATE_THRESHOLD раз за запрос,
+# пишутся строкой NDJSON в логгер querylog; для доли EXPLAIN_SAMPLE_RATE
+# медленных SELECT добавляется EXPLAIN (ANALYZE, BUFFERS).
+QUERY_LOG = {
+    'ENABLED': os.getenv('QUERY_LOG_ENABLED', 'True').lower() in ('true', '1'),
+    'SLOW_MS': float(os.getenv('QUERY_LOG_SLOW_MS', 100)),
+    'EXPLAIN_SAMPLE_RATE': float(os.getenv('QUERY_LOG_EXPLAIN_SAMPLE_RATE', 0.01)),
+    'DUPLICATE_THRESHOLD': int(os.getenv('QUERY_LOG_DUPLICATE_THRESHOLD', 10)),
+}
+QUERY_LOG_FILE = os.getenv('QUERY_LOG_FILE', '')
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'ndjson': {'format': '%(message)s'},
+    },
+    'handlers': {
+        'querylog': (
+            {
+                'class': 'logging.handlers.WatchedFileHandler',
+                'filename': QUERY_LOG_FILE,
+                'formatter': 'ndjson',
+            }
+            if QUERY_LOG_FILE else
+            {
+                'class': 'logging.StreamHandler',
+                'stream': 'ext://sys.stdout',
+                'formatter': 'ndjson',
+            }
+        ),
+    },
+    'loggers': {
+        'querylog': {'handlers': ['querylog'], 'level': 'INFO', 'propagate': False},
+    },
+}
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 AUTH_USER_MODEL = 'recipes.User'
@@ -137,6 +310,10 @@ REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
         'rest_framework.authentication.TokenAuthentication',
     ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'api.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
     'DEFAULT_PAGINATION_CLASS': 'api.pagination.Pagination',
     'DEFAULT_FILTER_BACKENDS': ['django_filters.rest_framework.DjangoFilterBackend'],
 }
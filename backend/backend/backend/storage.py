@@ -0,0 +1,48 @@
+"""Хранилище медиафайлов с адресацией по содержимому.
+
+Файл сохраняется под именем blobs/<первые 2 символа>/<sha256>.<расширение>:
+одинаковые картинки записываются один раз, а имя меняется вместе с
+содержимым, поэтому nginx отдаёт blobs/ с бессрочным кешированием.
+Один файл может использоваться несколькими записями, поэтому delete()
+ничего не удаляет; неиспользуемые файлы убирает команда gc_media. Она не
+трогает файлы моложе MEDIA_GC_GRACE_SECONDS, поэтому повторная загрузка уже
+существующего файла обновляет его время изменения.
+"""
+import hashlib
+import os
+
+from django.core.files.storage import FileSystemStorage
+
+from . import metrics
+
+BLOB_DIR = 'blobs'
+
+
+class ContentAddressedStorage(FileSystemStorage):
+
+    def _save(self, name, content):
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        if hasattr(content, 'seek'):
+            content.seek(0)
+        extension = os.path.splitext(name)[1].lower()
+        blob_hash = digest.hexdigest()
+        name = f'{BLOB_DIR}/{blob_hash[:2]}/{blob_hash}{extension}'
+        if self.exists(name):
+            try:
+                os.utime(self.path(name))
+            except FileNotFoundError:
+                # gc_media удалил файл после exists(): записываем заново.
+                pass
+            else:
+                metrics.increment('media.blobs_deduplicated')
+                return name
+        metrics.increment('media.blobs_written')
+        return super()._save(name, content)
+
+    def delete(self, name):
+        """Файл может быть нужен другим записям: удаляет только gc_media."""
+
+    def purge(self, name):
+        super().delete(name)
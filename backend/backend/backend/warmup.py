@@ -0,0 +1,83 @@
+"""Прогрев приложения в мастер-процессе gunicorn перед fork.
+
+С preload_app мастер один раз импортирует код, строит URL-резолвер,
+загружает справочник ингредиентов, индексы поиска по продуктам и похожих
+рецептов и прогоняет по запросу на каждый горячий маршрут. Воркеры
+получают всё это готовым через copy-on-write. Соединения с базой перед
+fork закрываются: делить сокет между процессами нельзя.
+"""
+import gc
+import importlib
+import logging
+import time
+
+from django.conf import settings
+from django.db import connections
+from django.test import RequestFactory
+from django.urls import get_resolver
+
+logger = logging.getLogger(__name__)
+
+WARMUP_MODULES = (
+    'api.serializers',
+    'api.fast_serializers',
+    'api.renderers',
+    'api.views',
+    'recipes.admin',
+)
+WARMUP_PATHS = (
+    '/api/recipes/?limit=6',
+    '/api/recipes/?limit=6&fields=id,name,image,cooking_time',
+    '/api/users/?limit=6',
+    '/api/ingredients/',
+    '/api/ingredients/?name=а',
+    '/api/recipes/pantry/?ingredients=1,2,3',
+    '/api/recipes/trending/?window=24h',
+)
+
+
+def warmup_host():
+    for host in settings.ALLOWED_HOSTS:
+        if host and host != '*' and not host.startswith('.'):
+            return host
+    return 'localhost'
+
+
+def warm_up(application):
+    """Прогревает приложение и возвращает затраченное время в секундах."""
+    started = time.monotonic()
+    for module in WARMUP_MODULES:
+        importlib.import_module(module)
+    get_resolver().url_patterns
+
+    from recipes.catalog import get_snapshot
+    from recipes.duplicates import duplicate_index
+    from recipes.pantry import pantry_index
+
+    try:
+        get_snapshot()
+        pantry_index.reload()
+        duplicate_index.reload()
+        factory = RequestFactory(HTTP_HOST=warmup_host())
+        for path in WARMUP_PATHS:
+            response = application.get_response(factory.get(path))
+            if response.status_code >= 400:
+                logger.warning('Прогрев %s: статус %s', path, response.status_code)
+    except Exception:
+        # Без базы воркеры всё равно должны запуститься.
+        logger.exception('Прогрев не завершён')
+    finally:
+        close_database_connections()
+
+    gc.collect()
+    # Объекты мастера больше не попадают в сборку мусора воркеров, и их
+    # страницы памяти не копируются из-за обхода сборщиком.
+    gc.freeze()
+    return time.monotonic() - started
+
+
+def close_database_connections():
+    from backend.pooled_postgresql.base import close_pools
+
+    connections.close_all()
+    close_pools()
@@ -0,0 +1,24 @@
+"""Настройки gunicorn для контейнера backend.
+
+Приложение загружается в мастере (preload_app) и прогревается до fork,
+см. backend/warmup.py.
+"""
+import multiprocessing
+import os
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:8000')
+workers = int(os.getenv('GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 30))
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', 1000))
+max_requests_jitter = max_requests // 10
+preload_app = True
+accesslog = '-'
+
+
+def when_ready(server):
+    if os.getenv('GUNICORN_WARMUP', 'True').lower() not in ('true', '1'):
+        return
+    from backend.warmup import warm_up
+
+    elapsed = warm_up(server.app.wsgi())
+    server.log.info('Прогрев приложения занял %.2f с', elapsed)
@@ -1,21 +1,65 @@
 from django.contrib import admin
-from django.db.models import Count
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+
+from .constants import ADMIN_EXACT_COUNT_LIMIT
+from .documents import rebuild_documents
+from .outbox import emit
 from .models import (User,
+                     Tag,
                      Ingredient,
                      Recipe,
                      RecipeIngredient,
                      ShoppingCart,
                      Favorite,
-                     Follow)
+                     Follow,
+                     OutboxEvent,
+                     OutboxCheckpoint)
+
+
+class EstimatedCountPaginator(Paginator):
+    """Для больших таблиц без фильтров берёт оценку числа строк из pg_class."""
+
+    @cached_property
+    def count(self):
+        query = getattr(self.object_list, 'query', None)
+        if query is not None and not query.where and not query.distinct:
+            connection = connections[self.object_list.db]
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    'SELECT reltuples FROM pg_class WHERE oid = %s::regclass',
+                    [query.model._meta.db_table],
+                )
+                row = cursor.fetchone()
+            if row and row[0] > ADMIN_EXACT_COUNT_LIMIT:
+                return int(row[0])
+        return super().count
+
+
+class LargeTableAdminMixin:
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_search_fields(self, request):
+        search_fields = super().get_search_fields(request)
+        match = request.resolver_match
+        if match is not None and match.url_name == 'autocomplete':
+            # Поиск по началу строки использует индексы UPPER(...) text_pattern_ops.
+            return [
+                field if field[0] in '^=@$' else f'^{field}'
+                for field in search_fields
+            ]
+        return search_fields
 
 
 @admin.register(User)
-class UserAdmin(admin.ModelAdmin):
+class UserAdmin(LargeTableAdminMixin, admin.ModelAdmin):
     list_display = ('username', 'email', 'first_name', 'last_name')
     search_fields = ('username', 'email')
     list_filter = ('is_staff', 'is_superuser', 'is_active')
     fields = (
-        'username', 'email', 'first_name', 'last_name', 
+        'username', 'email', 'first_name', 'last_name',
         'avatar', 'is_active', 'is_staff', 'is_superuser',
         'groups', 'user_permissions', 'last_login', 'date_joined'
     )
@@ -23,12 +67,19 @@ class UserAdmin(admin.ModelAdmin):
 
 
 @admin.register(Ingredient)
-class IngredientAdmin(admin.ModelAdmin):
+class IngredientAdmin(LargeTableAdminMixin, admin.ModelAdmin):
     list_display = ('name', 'measurement_unit')
     search_fields = ('name',)
     list_filter = ('measurement_unit',)
 
 
+@admin.register(Tag)
+class TagAdmin(admin.ModelAdmin):
+    list_display = ('name', 'slug')
+    search_fields = ('name', 'slug')
+    prepopulated_fields = {'slug': ('name',)}
+
+
 class RecipeIngredientInline(admin.TabularInline):
     model = RecipeIngredient
     extra = 1
@@ -37,40 +88,73 @@ class RecipeIngredientInline(admin.TabularInline):
 
 
 @admin.register(Recipe)
-class RecipeAdmin(admin.ModelAdmin):
-    list_display = ('name', 'author', 'favorite_count')
+class RecipeAdmin(LargeTableAdminMixin, admin.ModelAdmin):
+    list_display = ('name', 'author', 'favorites_count')
+    list_select_related = ('author',)
     search_fields = ('name', 'author__username')
     list_filter = ('cooking_time',)
-    autocomplete_fields = ('author', 'ingredients')
-    readonly_fields = ('favorite_count', 'short_code')
+    autocomplete_fields = ('author', 'ingredients', 'tags')
+    readonly_fields = ('favorites_count', 'short_code')
     inlines = (RecipeIngredientInline,)
 
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        rebuild_documents([form.instance.id])
 
-    def get_queryset(self, request):
-        return super().get_queryset(request).annotate(_favorite_count=Count('favorites'))
-
-
-    def favorite_count(self, obj):
-        return obj._favorite_count
-    favorite_count.short_description = 'Добавлений в избранное'
-    favorite_count.admin_order_field = '_favorite_count'
 
 @admin.register(RecipeIngredient)
-class RecipeIngredientAdmin(admin.ModelAdmin):
+class RecipeIngredientAdmin(LargeTableAdminMixin, admin.ModelAdmin):
     list_display = ('recipe', 'ingredient', 'amount')
+    list_select_related = ('recipe', 'ingredient')
     autocomplete_fields = ('recipe', 'ingredient')
 
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        self.recipe_changed(obj.recipe)
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        self.recipe_changed(obj.recipe)
+
+    def recipe_changed(self, recipe):
+        rebuild_documents([recipe.id])
+        # Рецепт не сохранялся, событие нужно индексам в памяти процессов.
+        emit(OutboxEvent.Type.RECIPE_UPDATED, recipe.author_id, recipe.id, recipe.author_id)
+
+
 @admin.register(ShoppingCart)
-class ShoppingCartAdmin(admin.ModelAdmin):
+class ShoppingCartAdmin(LargeTableAdminMixin, admin.ModelAdmin):
     list_display = ('user', 'recipe')
+    list_select_related = ('user', 'recipe')
     autocomplete_fields = ('user', 'recipe')
 
+
 @admin.register(Favorite)
-class FavoriteAdmin(admin.ModelAdmin):
+class FavoriteAdmin(LargeTableAdminMixin, admin.ModelAdmin):
     list_display = ('user', 'recipe')
+    list_select_related = ('user', 'recipe')
     autocomplete_fields = ('user', 'recipe')
 
+
 @admin.register(Follow)
-class FollowAdmin(admin.ModelAdmin):
+class FollowAdmin(LargeTableAdminMixin, admin.ModelAdmin):
     list_display = ('follower', 'following')
+    list_select_related = ('follower', 'following')
     autocomplete_fields = ('follower', 'following')
+
+
+@admin.register(OutboxEvent)
+class OutboxEventAdmin(LargeTableAdminMixin, admin.ModelAdmin):
+    list_display = ('id', 'type', 'user_id', 'recipe_id', 'author_id', 'created_at')
+    list_filter = ('type',)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(OutboxCheckpoint)
+class OutboxCheckpointAdmin(admin.ModelAdmin):
+    list_display = ('consumer', 'txid', 'event_id', 'updated_at')
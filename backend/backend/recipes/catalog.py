@@ -0,0 +1,127 @@
+"""Готовый JSON со всем справочником ингредиентов.
+
+Снимок собирается один раз и отдаётся как байты (обычные и gzip). Если
+задан INGREDIENT_SNAPSHOT_DIR, снимок пишется туда файлами ingredients.json
+и ingredients.json.gz: их может отдавать nginx (gzip_static), а воркеры по
+mtime файла узнают, что снимок пересобрал другой процесс. Без каталога
+снимок живёт в памяти процесса не дольше INGREDIENT_SNAPSHOT_TTL секунд.
+"""
+import gzip
+import hashlib
+import os
+import threading
+import time
+from dataclasses import dataclass, replace
+
+import orjson
+from django.conf import settings
+
+from .models import Ingredient
+
+SNAPSHOT_NAME = 'ingredients.json'
+
+
+@dataclass(frozen=True)
+class CatalogSnapshot:
+    version: str
+    raw: bytes
+    gzipped: bytes
+    built_at: float
+    mtime_ns: int = 0
+
+
+_lock = threading.Lock()
+_snapshot = None
+
+
+def _paths():
+    directory = settings.INGREDIENT_SNAPSHOT_DIR
+    if not directory:
+        return None, None
+    path = os.path.join(directory, SNAPSHOT_NAME)
+    return path, path + '.gz'
+
+
+def _make_snapshot(raw, gzipped=None, mtime_ns=0):
+    return CatalogSnapshot(
+        version=hashlib.sha1(raw).hexdigest()[:16],
+        raw=raw,
+        gzipped=gzipped or gzip.compress(raw, compresslevel=9, mtime=0),
+        built_at=time.monotonic(),
+        mtime_ns=mtime_ns,
+    )
+
+
+def _write(path, data):
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as file:
+        file.write(data)
+    os.replace(tmp_path, path)
+
+
+def rebuild_snapshot():
+    global _snapshot
+    rows = list(
+        Ingredient.objects.order_by('name', 'id').values('id', 'name', 'measurement_unit')
+    )
+    snapshot = _make_snapshot(orjson.dumps(rows))
+    path, gz_path = _paths()
+    if path:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Сначала .gz: читатели ориентируются на mtime основного файла.
+        _write(gz_path, snapshot.gzipped)
+        _write(path, snapshot.raw)
+        snapshot = replace(snapshot, mtime_ns=os.stat(path).st_mtime_ns)
+    with _lock:
+        _snapshot = snapshot
+    return snapshot
+
+
+def _load_from_files(path, gz_path):
+    try:
+        mtime_ns = os.stat(path).st_mtime_ns
+        with open(path, 'rb') as file:
+            raw = file.read()
+        with open(gz_path, 'rb') as file:
+            gzipped = file.read()
+    except FileNotFoundError:
+        return None
+    return _make_snapshot(raw, gzipped, mtime_ns)
+
+
+def get_snapshot():
+    global _snapshot
+    snapshot = _snapshot
+    path, gz_path = _paths()
+    if path:
+        try:
+            mtime_ns = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            return rebuild_snapshot()
+        if snapshot is not None and snapshot.mtime_ns == mtime_ns:
+            return snapshot
+        snapshot = _load_from_files(path, gz_path)
+        if snapshot is None:
+            return rebuild_snapshot()
+        with _lock:
+            _snapshot = snapshot
+        return snapshot
+
+    if (
+        snapshot is None
+        or time.monotonic() - snapshot.built_at > settings.INGREDIENT_SNAPSHOT_TTL
+    ):
+        return rebuild_snapshot()
+    return snapshot
+
+
+def invalidate_snapshot():
+    global _snapshot
+    with _lock:
+        _snapshot = None
+    for path in _paths():
+        if path:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
@@ -8,8 +8,13 @@ RECIPE_COOKING_TIME_MIN = 1
 RECIPE_COOKING_TIME_MAX = 480
 INGREDIENT_AMOUNT_MIN = 1
 INGREDIENT_AMOUNT_MAX = 1000
+TAG_NAME_MAX_LENGTH = 32
+TAG_SLUG_MAX_LENGTH = 32
+OUTBOX_EVENT_TYPE_MAX_LENGTH = 32
+OUTBOX_CONSUMER_MAX_LENGTH = 64
 FIRST_NAME_MAX_LENGTH=150
 LAST_NAME_MAX_LENGTH=150
 USERNAME_NAME_MAX_LENGTH=150
 
 BASIC_PAGE_SIZE = 6
+ADMIN_EXACT_COUNT_LIMIT = 100000
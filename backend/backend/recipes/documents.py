@@ -0,0 +1,109 @@
+"""Денормализованный документ рецепта для чтения.
+
+В Recipe.document хранится всё, что нужно для ответа API и не зависит от
+пользователя: поля рецепта, теги, автор и ингредиенты. Картинки хранятся
+именами файлов, URL строится при чтении. jsonb не сохраняет порядок ключей,
+поэтому теги и ингредиенты лежат списками [id, name, slug] и
+[id, name, measurement_unit, amount]. Флаги
+is_favorited, is_in_shopping_cart и is_subscribed добавляются к документу
+в api/fast_serializers.py.
+
+Документ пересобирается в той же транзакции, что и изменение рецепта;
+изменения автора, тегов и ингредиентов обновляют документы через сигналы.
+"""
+import json
+
+from django.db import connection
+
+from .duplicates import signature
+from .models import User, Recipe, RecipeIngredient
+
+DOCUMENT_VERSION = 2
+AUTHOR_VALUES = ('id', 'email', 'username', 'first_name', 'last_name', 'avatar')
+
+
+def author_document(author):
+    document = {name: getattr(author, name) for name in AUTHOR_VALUES}
+    document['avatar'] = author.avatar.name or None
+    return document
+
+
+def build_documents(recipe_ids):
+    """Собирает документы рецептов тремя запросами; возвращает {id: документ}."""
+    recipes = list(
+        Recipe.objects.filter(id__in=recipe_ids)
+        .values('id', 'author_id', 'name', 'image', 'text', 'cooking_time')
+    )
+    authors = {
+        author['id']: {**author, 'avatar': author['avatar'] or None}
+        for author in User.objects.filter(
+            id__in={recipe['author_id'] for recipe in recipes}
+        ).values(*AUTHOR_VALUES)
+    }
+    tags = {recipe['id']: [] for recipe in recipes}
+    for recipe_id, *tag in (
+        Recipe.tags.through.objects.filter(recipe_id__in=tags)
+        .order_by('tag__name')
+        .values_list('recipe_id', 'tag_id', 'tag__name', 'tag__slug')
+    ):
+        tags[recipe_id].append(tag)
+    ingredients = {recipe['id']: [] for recipe in recipes}
+    for recipe_id, *ingredient in (
+        RecipeIngredient.objects.filter(recipe_id__in=ingredients)
+        .order_by('id')
+        .values_list(
+            'recipe_id',
+            'ingredient_id',
+            'ingredient__name',
+            'ingredient__measurement_unit',
+            'amount',
+        )
+    ):
+        ingredients[recipe_id].append(ingredient)
+    return {
+        recipe['id']: {
+            'v': DOCUMENT_VERSION,
+            'tags': tags[recipe['id']],
+            'author': authors[recipe['author_id']],
+            'name': recipe['name'],
+            'image': recipe['image'] or None,
+            'text': recipe['text'],
+            'ingredients': ingredients[recipe['id']],
+            'cooking_time': recipe['cooking_time'],
+        }
+        for recipe in recipes
+    }
+
+
+def document_signature(document):
+    return signature(
+        document['name'],
+        document['text'],
+        [ingredient[0] for ingredient in document['ingredients']],
+    )
+
+
+def rebuild_documents(recipe_ids, batch_size=500):
+    """Пересобирает и сохраняет документы и MinHash; возвращает {id: документ}."""
+    recipe_ids = list(recipe_ids)
+    documents = {}
+    for start in range(0, len(recipe_ids), batch_size):
+        batch = build_documents(recipe_ids[start:start + batch_size])
+        Recipe.objects.bulk_update(
+            [Recipe(id=recipe_id, document=document, minhash=document_signature(document))
+             for recipe_id, document in batch.items()],
+            ['document', 'minhash'],
+        )
+        documents.update(batch)
+    return documents
+
+
+def refresh_author(author):
+    """Обновляет автора во всех его документах одним запросом."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"UPDATE {Recipe._meta.db_table} "
+            "SET document = jsonb_set(document, '{author}', %s::jsonb) "
+            "WHERE author_id = %s AND document ? 'author'",
+            [json.dumps(author_document(author)), author.pk],
+        )
@@ -0,0 +1,184 @@
+"""Поиск почти одинаковых рецептов: MinHash и LSH.
+
+Признаки рецепта — шинглы из SHINGLE_SIZE подряд идущих слов названия и
+описания (нижний регистр, ё → е, без пунктуации) и id ингредиентов.
+Сигнатура — NUM_PERM минимумов хешей признаков, по одному на
+хеш-функцию; доля совпавших позиций двух сигнатур оценивает коэффициент
+Жаккара их множеств признаков. NUM_PERM независимых 32-битных хешей
+признака — куски одного дайджеста SHAKE-128, минимумы по позициям
+считаются в C (map(min, zip(...))), без цикла Python по хеш-функциям.
+Сигнатура хранится в Recipe.minhash и пересчитывается вместе с документом
+(recipes/documents.py).
+
+LSH делит сигнатуру на BANDS полос по ROWS значений: рецепты с хотя бы
+одной совпавшей полосой становятся кандидатами, и только для них
+считается оценка сходства. При BANDS=16, ROWS=4 пара со сходством 0.7
+попадает в кандидаты с вероятностью ~0.99, со сходством 0.3 — ~0.12.
+
+Индекс живёт в памяти процесса и обновляется как индекс продуктов
+(recipes/pantry.py): по событиям рецептов из outbox в порядке (txid, id),
+полная перезагрузка — раз в DUPLICATE_INDEX_TTL секунд.
+"""
+import hashlib
+import re
+import sys
+import threading
+import time
+from array import array
+
+from django.conf import settings
+from django.db import router
+
+from .models import Recipe
+from .outbox import changed_recipes, snapshot_position
+
+NUM_PERM = 64
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+SHINGLE_SIZE = 3
+_WORDS = re.compile(r'\w+')
+
+
+def features(name, text, ingredient_ids):
+    """Множество признаков рецепта: шинглы слов и id ингредиентов."""
+    words = _WORDS.findall(f'{name} {text}'.lower().replace('ё', 'е'))
+    result = {
+        ' '.join(words[start:start + SHINGLE_SIZE])
+        for start in range(max(len(words) - SHINGLE_SIZE + 1, 1))
+    }
+    result.discard('')
+    result.update(f'#{ingredient_id}' for ingredient_id in ingredient_ids)
+    return result
+
+
+def feature_hashes(feature):
+    hashes = array('I', hashlib.shake_128(feature.encode()).digest(NUM_PERM * 4))
+    # Сохранённые сигнатуры не должны зависеть от порядка байтов машины.
+    if sys.byteorder != 'little':
+        hashes.byteswap()
+    return hashes
+
+
+def signature(name, text, ingredient_ids):
+    """MinHash рецепта: список из NUM_PERM чисел или [], если признаков нет."""
+    hashes = list(map(feature_hashes, features(name, text, ingredient_ids)))
+    if not hashes:
+        return []
+    return list(map(min, zip(*hashes)))
+
+
+def similarity(first, second):
+    """Оценка коэффициента Жаккара по двум сигнатурам."""
+    return sum(x == y for x, y in zip(first, second)) / NUM_PERM
+
+
+def band_keys(signature):
+    return [
+        signature[start:start + ROWS].tobytes()
+        for start in range(0, NUM_PERM, ROWS)
+    ]
+
+
+class DuplicateIndex:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.signatures = {}
+        self.authors = {}
+        # По словарю на полосу: байты полосы -> кортеж id рецептов.
+        self.buckets = [{} for _ in range(BANDS)]
+        self.position = (0, 0)
+        self.loaded_at = None
+        self.checked_at = 0.0
+
+    def _add(self, recipe_id, author_id, minhash):
+        if len(minhash) != NUM_PERM:
+            return
+        minhash = array('I', minhash)
+        self.signatures[recipe_id] = minhash
+        self.authors[recipe_id] = author_id
+        for bucket, key in zip(self.buckets, band_keys(minhash)):
+            bucket[key] = bucket.get(key, ()) + (recipe_id,)
+
+    def _remove_recipe(self, recipe_id):
+        minhash = self.signatures.pop(recipe_id, None)
+        self.authors.pop(recipe_id, None)
+        if minhash is None:
+            return
+        for bucket, key in zip(self.buckets, band_keys(minhash)):
+            rest = tuple(other for other in bucket.get(key, ()) if other != recipe_id)
+            if rest:
+                bucket[key] = rest
+            else:
+                bucket.pop(key, None)
+
+    def reload(self):
+        using = router.db_for_read(Recipe)
+        position = snapshot_position(using)
+        rows = (
+            Recipe.objects.using(using).order_by()
+            .values_list('id', 'author_id', 'minhash')
+            .iterator(chunk_size=2000)
+        )
+        with self.lock:
+            self.signatures, self.authors = {}, {}
+            self.buckets = [{} for _ in range(BANDS)]
+            for recipe_id, author_id, minhash in rows:
+                self._add(recipe_id, author_id, minhash)
+            self.position = position
+            self.loaded_at = self.checked_at = time.monotonic()
+
+    def refresh(self):
+        """Перечитывает рецепты, изменённые после позиции индекса."""
+        now = time.monotonic()
+        if self.loaded_at is None or now - self.loaded_at > settings.DUPLICATE_INDEX_TTL:
+            self.reload()
+            return
+        if now - self.checked_at < settings.DUPLICATE_INDEX_REFRESH_INTERVAL:
+            return
+        self.checked_at = now
+        using = router.db_for_read(Recipe)
+        touched, position = changed_recipes(self.position, using)
+        rows = list(
+            Recipe.objects.using(using).filter(id__in=touched)
+            .values_list('id', 'author_id', 'minhash')
+        )
+        with self.lock:
+            for recipe_id in touched:
+                self._remove_recipe(recipe_id)
+            for recipe_id, author_id, minhash in rows:
+                self._add(recipe_id, author_id, minhash)
+            self.position = position
+
+    def discard(self, recipe_id):
+        with self.lock:
+            self._remove_recipe(recipe_id)
+
+    def matches(self, minhash, threshold):
+        """Рецепты со сходством не ниже threshold: [(recipe_id, автор, сходство)].
+
+        Без обновления индекса; похожие сначала.
+        """
+        if len(minhash) != NUM_PERM:
+            return []
+        minhash = array('I', minhash)
+        with self.lock:
+            candidates = set()
+            for bucket, key in zip(self.buckets, band_keys(minhash)):
+                candidates.update(bucket.get(key, ()))
+            results = []
+            for recipe_id in candidates:
+                score = similarity(minhash, self.signatures[recipe_id])
+                if score >= threshold:
+                    results.append((recipe_id, self.authors[recipe_id], score))
+        results.sort(key=lambda item: (-item[2], item[0]))
+        return results
+
+    def similar(self, minhash, threshold=None):
+        self.refresh()
+        if threshold is None:
+            threshold = settings.RECIPE_DUPLICATE_THRESHOLD
+        return self.matches(minhash, threshold)
+
+
+duplicate_index = DuplicateIndex()
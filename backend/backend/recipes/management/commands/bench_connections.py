@@ -0,0 +1,75 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.core.signals import request_finished, request_started
+from django.db import connection
+from django.db.backends.postgresql.base import DatabaseWrapper
+
+from backend import metrics
+
+
+class Command(BaseCommand):
+    help = (
+        "Сравнивает задержку запроса с новым соединением к базе и с текущим "
+        "режимом DB_CONNECTION_MODE."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--requests",
+            type=int,
+            default=200,
+            help="Количество имитируемых запросов (по умолчанию: 200)",
+        )
+
+    def handle(self, *args, **options):
+        count = options["requests"]
+        params = connection.get_connection_params()
+
+        def fresh_connection():
+            raw = DatabaseWrapper.get_new_connection(connection, params)
+            with raw.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            raw.close()
+
+        def configured_connection():
+            request_started.send(sender=self.__class__)
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            request_finished.send(sender=self.__class__)
+
+        fresh = self.measure(fresh_connection, count)
+        configured = self.measure(configured_connection, count)
+        connection.close()
+
+        self.report("новое соединение", fresh)
+        self.report(f"режим {connection.settings_dict['ENGINE']}"
+                    f" (CONN_MAX_AGE={connection.settings_dict['CONN_MAX_AGE']})",
+                    configured)
+        saved = statistics.mean(fresh) - statistics.mean(configured)
+        self.stdout.write(self.style.SUCCESS(
+            f"Экономия на запрос: {saved * 1000:.2f} мс"
+        ))
+        pool_metrics = {
+            name: value for name, value in metrics.snapshot()["metrics"].items()
+            if name.startswith("db_pool.")
+        }
+        for name, value in pool_metrics.items():
+            self.stdout.write(f"  {name} = {value}")
+
+    def measure(self, func, count):
+        timings = []
+        for _ in range(count):
+            started = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - started)
+        return timings
+
+    def report(self, title, timings):
+        timings = sorted(timings)
+        self.stdout.write(
+            f"{title}: среднее {statistics.mean(timings) * 1000:.2f} мс, "
+            f"p50 {timings[len(timings) // 2] * 1000:.2f} мс, "
+            f"p95 {timings[int(len(timings) * 0.95)] * 1000:.2f} мс"
+        )
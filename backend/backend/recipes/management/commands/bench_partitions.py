@@ -0,0 +1,173 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from recipes.models import Favorite
+from recipes.partitioning import PARTITIONS, rebuild
+
+PLAIN = "bench_relation_plain"
+HASHED = "bench_relation_hash"
+QUERIES = {
+    "список пользователя": (
+        "SELECT recipe_id FROM {table} WHERE user_id = %s ORDER BY id DESC LIMIT 20"
+    ),
+    "есть ли связь": (
+        "SELECT 1 FROM {table} WHERE user_id = %s AND recipe_id = %s LIMIT 1"
+    ),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Сравнивает обычную и hash-секционированную по пользователю таблицу "
+        "связей: задержку поиска по пользователю и стоимость VACUUM после "
+        "изменений. Строится по образцу избранного из recipes/seed.py во "
+        "временных таблицах, которые удаляются в конце."
+    )
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--users",
+            type=int,
+            default=50000,
+            help="Количество пользователей (по умолчанию: 50000)",
+        )
+        parser.add_argument(
+            "--per-user",
+            type=int,
+            default=20,
+            help="Связей на пользователя, как в recipes/seed.py (по умолчанию: 20)",
+        )
+        parser.add_argument(
+            "--partitions",
+            type=int,
+            default=PARTITIONS,
+            help=f"Количество секций (по умолчанию: {PARTITIONS})",
+        )
+        parser.add_argument(
+            "--lookups",
+            type=int,
+            default=2000,
+            help="Запросов каждого вида (по умолчанию: 2000)",
+        )
+        parser.add_argument(
+            "--churn",
+            type=float,
+            default=0.05,
+            help="Доля строк, удаляемых и добавляемых заново перед VACUUM "
+                 "(по умолчанию: 0.05)",
+        )
+
+    def handle(self, *args, **options):
+        users, per_user = options["users"], options["per_user"]
+        recipes = users * per_user // 2
+        try:
+            self.stdout.write(f"Создание {users * per_user} связей...")
+            self.create(PLAIN, users, per_user, recipes)
+            self.create(HASHED, users, per_user, recipes)
+            rebuild(HASHED, "user_id", options["partitions"])
+            layouts = {
+                "обычная": (PLAIN, [PLAIN]),
+                f"{options['partitions']} секций": (
+                    HASHED,
+                    [f"{HASHED}_p{number}" for number in range(options["partitions"])],
+                ),
+            }
+            with connection.cursor() as cursor:
+                for _, relations in layouts.values():
+                    for relation in relations:
+                        cursor.execute(
+                            f"ALTER TABLE {relation} SET (autovacuum_enabled = false)"
+                        )
+
+            rnd = random.Random(0)
+            samples = [
+                (rnd.randint(1, users), rnd.randint(1, recipes))
+                for _ in range(options["lookups"])
+            ]
+            for name, (table, relations) in layouts.items():
+                self.stdout.write(f"\n{name}:")
+                self.lookups(table, samples)
+                self.vacuum(table, relations, users, options["churn"], recipes)
+        finally:
+            with connection.cursor() as cursor:
+                cursor.execute(f"DROP TABLE IF EXISTS {PLAIN}, {HASHED}")
+
+    def create(self, table, users, per_user, recipes):
+        source = Favorite._meta.db_table
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"CREATE TABLE {table} "
+                f"(LIKE {source} INCLUDING DEFAULTS INCLUDING IDENTITY)"
+            )
+            cursor.execute(
+                f"INSERT INTO {table} (user_id, recipe_id) "
+                f"SELECT user_id, (user_id * 7919 + n * 104729) % {recipes} + 1 "
+                f"FROM generate_series(1, {users}) user_id, "
+                f"generate_series(1, {per_user}) n ORDER BY random()"
+            )
+            cursor.execute(f"ALTER TABLE {table} ADD PRIMARY KEY (id)")
+            cursor.execute(
+                f"ALTER TABLE {table} ADD CONSTRAINT {table}_unique "
+                "UNIQUE (user_id, recipe_id)"
+            )
+            cursor.execute(
+                f"CREATE INDEX {table}_user_id_idx ON {table} "
+                "(user_id, id DESC) INCLUDE (recipe_id)"
+            )
+            cursor.execute(f"ANALYZE {table}")
+
+    def lookups(self, table, samples):
+        with connection.cursor() as cursor:
+            for name, query in QUERIES.items():
+                sql = query.format(table=table)
+                timings = []
+                for user_id, recipe_id in samples:
+                    params = [user_id] if sql.count("%s") == 1 else [user_id, recipe_id]
+                    started = time.perf_counter()
+                    cursor.execute(sql, params)
+                    cursor.fetchall()
+                    timings.append(time.perf_counter() - started)
+                cursor.execute(
+                    f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {sql}",
+                    [samples[0][0]] if sql.count("%s") == 1 else list(samples[0]),
+                )
+                plan = cursor.fetchone()[0][0]["Plan"]
+                buffers = plan["Shared Hit Blocks"] + plan["Shared Read Blocks"]
+                timings.sort()
+                self.stdout.write(
+                    f"  {name:<20} p50 {statistics.median(timings) * 1e6:7.0f} мкс, "
+                    f"p95 {timings[int(len(timings) * 0.95)] * 1e6:7.0f} мкс, "
+                    f"страниц на запрос: {buffers}"
+                )
+
+    def vacuum(self, table, relations, users, churn, recipes):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"WITH deleted AS (DELETE FROM {table} WHERE random() < %s "
+                "RETURNING user_id, recipe_id) "
+                f"INSERT INTO {table} (user_id, recipe_id) "
+                "SELECT user_id, recipe_id FROM deleted",
+                [churn],
+            )
+            changed = cursor.rowcount
+            timings = []
+            for relation in relations:
+                started = time.perf_counter()
+                cursor.execute(f"VACUUM {relation}")
+                timings.append(time.perf_counter() - started)
+            cursor.execute(
+                "SELECT sum(pg_total_relation_size(relation)) FROM unnest(%s::regclass[]) "
+                "relation",
+                [relations],
+            )
+            size = cursor.fetchone()[0]
+        self.stdout.write(
+            f"  VACUUM после {changed} изменений: всего {sum(timings) * 1000:.0f} мс, "
+            f"самая долгая единица {max(timings) * 1000:.0f} мс "
+            f"({len(relations)} шт.), размер {size / 2 ** 20:.1f} МиБ"
+        )
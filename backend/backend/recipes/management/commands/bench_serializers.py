@@ -0,0 +1,98 @@
+import json
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from api.fast_serializers import recipe_rows, serialize_recipes
+from api.renderers import ORJSONRenderer
+from api.serializers import RecipeSerializer
+from recipes.models import Recipe, User
+from recipes.seed import seed_database
+
+
+class Command(BaseCommand):
+    help = (
+        "Сравнивает стоимость сериализации рецептов через RecipeSerializer "
+        "и через быстрый путь api.fast_serializers."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--count",
+            type=int,
+            default=1000,
+            help="Количество рецептов в выборке (по умолчанию: 1000)",
+        )
+        parser.add_argument(
+            "--repeat",
+            type=int,
+            default=3,
+            help="Количество повторов, берётся лучший (по умолчанию: 3)",
+        )
+        parser.add_argument(
+            "--seed",
+            action="store_true",
+            help="Заполнить базу синтетическими данными (изменения откатываются)",
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            if options["seed"]:
+                seed_database(1, self.stdout)
+            self.run(options["count"], options["repeat"])
+            transaction.set_rollback(True)
+
+    def run(self, count, repeat):
+        user = User.objects.filter(favorites__isnull=False).first()
+        if user is None or not Recipe.objects.exists():
+            raise CommandError("Нет данных для сравнения, запустите команду с --seed.")
+        host = next(
+            (host for host in settings.ALLOWED_HOSTS if host not in ("*", "")
+             and not host.startswith(".")),
+            "localhost",
+        )
+        request = Request(APIRequestFactory().get("/api/recipes/", HTTP_HOST=host))
+        request.user = user
+
+        def drf():
+            data = RecipeSerializer(
+                list(Recipe.objects.all()[:count]), many=True,
+                context={"request": request},
+            ).data
+            return JSONRenderer().render(data)
+
+        def fast():
+            rows = list(recipe_rows(Recipe.objects.all()[:count], request))
+            return ORJSONRenderer().render(serialize_recipes(rows, request))
+
+        def count_queries(execute, sql, params, many, context):
+            executed.append(sql)
+            return execute(sql, params, many, context)
+
+        results = {}
+        for name, func in (("RecipeSerializer + JSONRenderer", drf),
+                           ("fast_serializers + ORJSONRenderer", fast)):
+            best = None
+            for _ in range(repeat):
+                executed = []
+                with connection.execute_wrapper(count_queries):
+                    started = time.perf_counter()
+                    body = func()
+                    elapsed = time.perf_counter() - started
+                best = elapsed if best is None else min(best, elapsed)
+            results[name] = body
+            rows = len(json.loads(body))
+            self.stdout.write(
+                f"{name}: {best * 1000 / rows * 1000:.1f} мс на 1000 рецептов, "
+                f"запросов: {len(executed)}"
+            )
+
+        drf_body, fast_body = results.values()
+        if json.loads(drf_body) != json.loads(fast_body):
+            raise CommandError("Результаты сериализации различаются.")
+        self.stdout.write(self.style.SUCCESS("Результаты совпадают."))
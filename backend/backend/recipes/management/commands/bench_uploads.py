@@ -0,0 +1,123 @@
+import base64
+import io
+import os
+import tempfile
+import time
+import tracemalloc
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test import override_settings
+from PIL import Image
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from api.serializers import decode_base64_file
+from api.views import CustomUserViewSet
+from recipes.models import User
+
+MIB = 1024 * 1024
+
+
+def noise_png(size):
+    """PNG из случайных пикселей: почти не сжимается, весит около size байт."""
+    side = int((size / 3) ** 0.5)
+    image = Image.frombytes("RGB", (side, side), os.urandom(side * side * 3))
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG", compress_level=0)
+    return buffer.getvalue()
+
+
+def measure(func):
+    """Пиковый прирост памяти (по tracemalloc) и время выполнения func."""
+    tracemalloc.start()
+    started = time.perf_counter()
+    try:
+        result = func()
+        elapsed = time.perf_counter() - started
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return peak, elapsed, result
+
+
+class Command(BaseCommand):
+    help = (
+        "Измеряет пиковую память воркера при загрузке аватара: base64 в JSON "
+        "и multipart/form-data."
+    )
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--size-mb",
+            type=float,
+            default=5,
+            help="Размер картинки, МиБ (по умолчанию: 5)",
+        )
+        parser.add_argument(
+            "--max-peak-mb",
+            type=float,
+            help="Завершиться ошибкой, если пик при multipart-загрузке больше, МиБ",
+        )
+
+    def handle(self, *args, **options):
+        image = noise_png(int(options["size_mb"] * MIB))
+        data_uri = "data:image/png;base64," + base64.b64encode(image).decode()
+        factory = APIRequestFactory()
+        view = CustomUserViewSet.as_view({"put": "update_avatar"})
+
+        # Тела запросов собираются до замера: в воркере их держит сокет/nginx.
+        json_request = factory.put(
+            "/api/users/me/avatar/", {"avatar": data_uri}, format="json"
+        )
+        multipart_request = factory.put(
+            "/api/users/me/avatar/",
+            {"avatar": SimpleUploadedFile("avatar.png", image, "image/png")},
+            format="multipart",
+        )
+
+        def legacy_decode():
+            return base64.b64decode(data_uri.split(";base64,")[1])
+
+        def chunked_decode():
+            upload = decode_base64_file(data_uri, "temp")
+            upload.close()
+
+        results = [
+            ("декодирование: b64decode целиком", measure(legacy_decode)),
+            ("декодирование: по кускам в файл", measure(chunked_decode)),
+        ]
+        with tempfile.TemporaryDirectory() as media_root, \
+                override_settings(MEDIA_ROOT=media_root), transaction.atomic():
+            user = User.objects.create_user(
+                email="bench-uploads@example.com",
+                username="bench-uploads",
+                first_name="bench",
+                last_name="uploads",
+            )
+            for name, request in (("PUT me/avatar: JSON + base64", json_request),
+                                  ("PUT me/avatar: multipart", multipart_request)):
+                force_authenticate(request, user)
+                peak, elapsed, response = measure(lambda: view(request))
+                if response.status_code != 200:
+                    raise CommandError(f"{name}: статус {response.status_code}")
+                results.append((name, (peak, elapsed, response)))
+            transaction.set_rollback(True)
+
+        self.stdout.write(
+            f"Картинка: {len(image) / MIB:.1f} МиБ, "
+            f"в base64: {len(data_uri) / MIB:.1f} МиБ"
+        )
+        for name, (peak, elapsed, _) in results:
+            self.stdout.write(
+                f"  {name:<36} пик {peak / MIB:7.2f} МиБ  {elapsed * 1000:8.1f} мс"
+            )
+
+        limit = options["max_peak_mb"]
+        multipart_peak = results[-1][1][0]
+        if limit is not None and multipart_peak > limit * MIB:
+            raise CommandError(
+                f"Пик памяти при multipart-загрузке {multipart_peak / MIB:.2f} МиБ "
+                f"больше {limit} МиБ."
+            )
@@ -0,0 +1,139 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Sum
+from django.test import RequestFactory
+
+from api.fast_serializers import recipe_rows
+from recipes.models import (User,
+                            Tag,
+                            Ingredient,
+                            Recipe,
+                            RecipeIngredient,
+                            ShoppingCart,
+                            OutboxCheckpoint,
+                            TrendingEntry)
+from recipes.outbox import Consumer
+from recipes.seed import seed_database
+
+
+def viewer_request(user):
+    request = RequestFactory().get("/api/recipes/")
+    request.user = user
+    return request
+
+
+class Command(BaseCommand):
+    help = (
+        "Выполняет EXPLAIN для горячих запросов из api/views.py и "
+        "завершается ошибкой, если план содержит Seq Scan по большой таблице."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--max-seq-scan-rows",
+            type=int,
+            default=10000,
+            help="Допустимый размер таблицы для Seq Scan (по умолчанию: 10000)",
+        )
+        parser.add_argument(
+            "--seed",
+            action="store_true",
+            help="Заполнить базу синтетическими данными на время проверки "
+                 "(изменения откатываются)",
+        )
+        parser.add_argument(
+            "--scale",
+            type=int,
+            default=1,
+            help="Множитель объёма синтетических данных (по умолчанию: 1)",
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor != "postgresql":
+            raise CommandError("Проверка планов поддерживается только для PostgreSQL.")
+
+        with transaction.atomic():
+            if options["seed"]:
+                seed_database(options["scale"], self.stdout)
+            with connection.cursor() as cursor:
+                cursor.execute("ANALYZE")
+            failures = self.check_plans(options["max_seq_scan_rows"])
+            transaction.set_rollback(True)
+
+        if failures:
+            raise CommandError(
+                "Найдены последовательные сканирования:\n" + "\n".join(failures)
+            )
+        self.stdout.write(self.style.SUCCESS("Все горячие запросы используют индексы."))
+
+    def hot_queries(self):
+        user = User.objects.filter(favorites__isnull=False).first() or User.objects.first()
+        recipe = Recipe.objects.first()
+        if user is None or recipe is None:
+            raise CommandError("Нет данных для проверки, запустите команду с --seed.")
+        cart_recipes = ShoppingCart.objects.filter(user=user).values("recipe_id")
+        tag_ids = list(Tag.objects.values_list("id", flat=True)[:2])
+        return {
+            "recipes:list": Recipe.objects.all()[:6],
+            "recipes:popular": Recipe.objects.order_by("-popularity_score", "-id")[:6],
+            "recipes:author": Recipe.objects.filter(author_id=recipe.author_id)[:6],
+            "recipes:tags_any": Recipe.objects.filter(tag_ids__overlap=tag_ids)[:6],
+            "recipes:tags_all": Recipe.objects.filter(tag_ids__contains=tag_ids)[:6],
+            "recipes:short_code": Recipe.objects.filter(short_code=recipe.short_code),
+            "recipes:is_favorited": Recipe.objects.filter(
+                id__in=user.favorites.values_list("recipe_id", flat=True)
+            )[:6],
+            "recipes:is_in_shopping_cart": Recipe.objects.filter(
+                id__in=user.shopping_carts.values_list("recipe_id", flat=True)
+            )[:6],
+            "recipes:viewer_flags": recipe_rows(
+                Recipe.objects.all(), viewer_request(user)
+            )[:6],
+            "recipes:ingredients_batch": RecipeIngredient.objects.filter(
+                recipe_id__in=[recipe.id]
+            ).order_by("id").values("ingredient__name", "amount"),
+            "favorite:exists": user.favorites.filter(recipe=recipe)[:1],
+            "shopping_cart:exists": user.shopping_carts.filter(recipe=recipe)[:1],
+            "follow:exists": user.following.filter(following=recipe.author)[:1],
+            "subscriptions": user.following.all()[:6],
+            "ingredients:search": Ingredient.objects.filter(name__istartswith="сол"),
+            "recipe:ingredients": RecipeIngredient.objects.filter(recipe=recipe)
+            .values("ingredient_id", "amount"),
+            "trending:leaderboard": TrendingEntry.objects.filter(window="24h")
+            .order_by("rank"),
+            "outbox:pending": Consumer("plan", None).pending(
+                OutboxCheckpoint(consumer="plan")
+            ),
+            "download_shopping_cart": RecipeIngredient.objects.filter(
+                recipe__in=cart_recipes
+            )
+            .values("ingredient__name", "ingredient__measurement_unit")
+            .annotate(total_amount=Sum("amount")),
+        }
+
+    def check_plans(self, max_rows):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT relname, reltuples FROM pg_class WHERE relkind IN ('r', 'p')"
+            )
+            table_sizes = dict(cursor.fetchall())
+
+        failures = []
+        for name, queryset in self.hot_queries().items():
+            plan = json.loads(queryset.explain(format="json"))[0]["Plan"]
+            for node in self.walk(plan):
+                if node["Node Type"] != "Seq Scan":
+                    continue
+                relation = node["Relation Name"]
+                rows = table_sizes.get(relation, 0)
+                if rows > max_rows:
+                    failures.append(f"  {name}: Seq Scan по {relation} (~{int(rows)} строк)")
+            self.stdout.write(f"{name}: {plan['Node Type']} (cost={plan['Total Cost']})")
+        return failures
+
+    def walk(self, node):
+        yield node
+        for child in node.get("Plans", []):
+            yield from self.walk(child)
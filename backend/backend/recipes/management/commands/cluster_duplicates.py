@@ -0,0 +1,104 @@
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes.documents import rebuild_documents
+from recipes.duplicates import DuplicateIndex
+from recipes.models import Recipe
+
+
+def find(parents, item):
+    while parents.get(item, item) != item:
+        parents[item] = parents.get(parents[item], parents[item])
+        item = parents[item]
+    return item
+
+
+class Command(BaseCommand):
+    help = (
+        "Группирует почти одинаковые рецепты всего каталога по MinHash "
+        "(recipes/duplicates.py) и выводит группы, крупные сначала."
+    )
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--threshold",
+            type=float,
+            default=settings.RECIPE_DUPLICATE_THRESHOLD,
+            help="Минимальная оценка сходства пары "
+                 f"(по умолчанию: {settings.RECIPE_DUPLICATE_THRESHOLD})",
+        )
+        parser.add_argument(
+            "--same-author",
+            action="store_true",
+            help="Только повторы у одного автора",
+        )
+        parser.add_argument(
+            "--backfill",
+            action="store_true",
+            help="Сначала посчитать MinHash рецептов, у которых его ещё нет",
+        )
+        parser.add_argument(
+            "--limit",
+            type=int,
+            default=50,
+            help="Сколько групп вывести (по умолчанию: 50)",
+        )
+
+    def handle(self, *args, **options):
+        threshold = options["threshold"]
+        if not 0 < threshold <= 1:
+            raise CommandError("--threshold должен быть в (0, 1].")
+        if options["backfill"]:
+            recipe_ids = list(
+                Recipe.objects.filter(minhash=[]).order_by("id").values_list("id", flat=True)
+            )
+            rebuild_documents(recipe_ids)
+            self.stdout.write(f"Посчитано MinHash: {len(recipe_ids)}")
+
+        index = DuplicateIndex()
+        index.reload()
+        parents = {}
+        scores = defaultdict(float)
+        for recipe_id, minhash in index.signatures.items():
+            for other_id, author_id, score in index.matches(minhash, threshold):
+                if other_id == recipe_id or (
+                    options["same_author"] and author_id != index.authors[recipe_id]
+                ):
+                    continue
+                first, second = find(parents, recipe_id), find(parents, other_id)
+                if first != second:
+                    parents[second] = first
+                    scores[first] = max(scores[first], scores.pop(second, 0))
+                scores[first] = max(scores[first], score)
+
+        clusters = defaultdict(list)
+        for recipe_id in parents:
+            clusters[find(parents, recipe_id)].append(recipe_id)
+        for recipe_id in list(clusters):
+            clusters[recipe_id].append(recipe_id)
+        ordered = sorted(
+            clusters.items(), key=lambda item: (-len(item[1]), -scores[item[0]], item[0])
+        )
+
+        shown = ordered[:options["limit"]]
+        recipes = {
+            recipe_id: (author_id, name)
+            for recipe_id, author_id, name in Recipe.objects.filter(
+                id__in=[recipe_id for _, members in shown for recipe_id in members]
+            ).values_list("id", "author_id", "name")
+        }
+        for root, members in shown:
+            self.stdout.write(
+                f"Группа из {len(members)} рецептов, сходство до {scores[root]:.2f}:"
+            )
+            for recipe_id in sorted(members):
+                if recipe_id in recipes:
+                    author_id, name = recipes[recipe_id]
+                    self.stdout.write(f"  {recipe_id}\tавтор {author_id}\t{name}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Рецептов: {len(index.signatures)}, групп: {len(clusters)}, "
+            f"рецептов в группах: {sum(len(members) for members in clusters.values())}"
+        ))
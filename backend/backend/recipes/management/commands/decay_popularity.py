@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from recipes.popularity import decay_all, recount_all
+
+
+class Command(BaseCommand):
+    help = (
+        "Переносит точку отсчёта popularity_score на текущий момент, чтобы "
+        "значения не росли неограниченно; запускать редко (например, раз в месяц)."
+    )
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--recount",
+            action="store_true",
+            help="Сначала посчитать популярность заново по избранному и корзинам",
+        )
+
+    def handle(self, *args, **options):
+        if options["recount"]:
+            self.stdout.write(f"Пересчитано заново: {recount_all()}")
+        updated = decay_all()
+        self.stdout.write(self.style.SUCCESS(f"Пересчитано рецептов: {updated}"))
@@ -0,0 +1,114 @@
+import time
+from collections import Counter
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import models
+
+from backend.storage import BLOB_DIR
+
+
+def file_fields():
+    for model in apps.get_models():
+        for field in model._meta.get_fields():
+            if isinstance(field, models.FileField):
+                yield model, field
+
+
+def reference_counts():
+    """Сколько записей ссылается на каждый файл хранилища."""
+    counts = Counter()
+    for model, field in file_fields():
+        counts.update(
+            model._default_manager.exclude(**{field.name: ""})
+            .exclude(**{f"{field.name}__isnull": True})
+            .values_list(field.name, flat=True)
+            .iterator()
+        )
+    return counts
+
+
+def is_referenced(name):
+    return any(
+        model._default_manager.filter(**{field.name: name}).exists()
+        for model, field in file_fields()
+    )
+
+
+def modified_after(storage, name, deadline):
+    try:
+        return storage.get_modified_time(name).timestamp() > deadline
+    except FileNotFoundError:
+        return True
+
+
+def walk(storage, path):
+    directories, files = storage.listdir(path)
+    for name in files:
+        yield f"{path}/{name}"
+    for directory in directories:
+        yield from walk(storage, f"{path}/{directory}")
+
+
+class Command(BaseCommand):
+    help = (
+        "Удаляет из хранилища медиа файлы, на которые не ссылается ни одна "
+        "запись (картинки рецептов, аватары)."
+    )
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Только показать, что будет удалено",
+        )
+        parser.add_argument(
+            "--grace-seconds",
+            type=int,
+            default=settings.MEDIA_GC_GRACE_SECONDS,
+            help="Не удалять файлы моложе, с (по умолчанию: MEDIA_GC_GRACE_SECONDS)",
+        )
+
+    def handle(self, *args, **options):
+        storage = default_storage
+        if not hasattr(storage, "purge"):
+            raise CommandError(
+                "gc_media работает только с backend.storage.ContentAddressedStorage."
+            )
+        if not storage.exists(BLOB_DIR):
+            self.stdout.write("Хранилище пусто.")
+            return
+
+        # Сначала список файлов, потом ссылки: файл, сохранённый между
+        # этими шагами, защищён сроком grace-seconds.
+        blobs = list(walk(storage, BLOB_DIR))
+        counts = reference_counts()
+        deadline = time.time() - options["grace_seconds"]
+
+        removed = freed = 0
+        for name in blobs:
+            if counts[name] or modified_after(storage, name, deadline):
+                continue
+            if options["dry_run"]:
+                self.stdout.write(f"  {name}")
+            elif is_referenced(name) or modified_after(storage, name, deadline):
+                # Пока шёл подсчёт, файл загрузили снова (storage обновляет
+                # время изменения) или на него уже сослались.
+                continue
+            freed += storage.size(name)
+            removed += 1
+            if not options["dry_run"]:
+                storage.purge(name)
+
+        shared = sum(1 for name in blobs if counts[name] > 1)
+        self.stdout.write(
+            f"Файлов: {len(blobs)}, используются несколькими записями: {shared}, "
+            f"ссылок: {sum(counts.values())}"
+        )
+        action = "Будет удалено" if options["dry_run"] else "Удалено"
+        self.stdout.write(self.style.SUCCESS(
+            f"{action} файлов: {removed} ({freed / 1024:.1f} КиБ)"
+        ))
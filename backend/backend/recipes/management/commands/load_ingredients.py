@@ -3,10 +3,12 @@ import os
 
 from django.db import models
 from django.core.management.base import BaseCommand
+from recipes.catalog import rebuild_snapshot
 from recipes.models import Ingredient
 
 class Command(BaseCommand):
     help = "Загружает ингредиенты из файла JSON в базу данных."
+    requires_system_checks = []
 
     def add_arguments(self, parser):
         parser.add_argument(
@@ -91,7 +93,13 @@ class Command(BaseCommand):
                 self.stderr.write("\n" + self.style.ERROR(
                     f"Ошибка при массовом создании: {error}"
                 ))
+                return
         else:
             self.stdout.write("\n" + self.style.SUCCESS(
                 "Нет новых ингредиентов для добавления. Все данные уже существуют в базе."
             ))
+
+        snapshot = rebuild_snapshot()
+        self.stdout.write(self.style.SUCCESS(
+            f"Снимок справочника обновлён, версия {snapshot.version}."
+        ))
@@ -0,0 +1,62 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from recipes.partitioning import PARTITIONS, partition_count, rebuild, rebuild_statements, tables
+
+
+class Command(BaseCommand):
+    help = (
+        "Переводит таблицы избранного, корзины и подписок на hash-секционирование "
+        "по пользователю (или обратно, --partitions 0). Запускать после migrate."
+    )
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--partitions",
+            type=int,
+            default=PARTITIONS,
+            help=f"Количество секций, 0 — обычная таблица (по умолчанию: {PARTITIONS})",
+        )
+        parser.add_argument(
+            "--table",
+            action="append",
+            help="Только эта таблица (можно повторять)",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Показать SQL, ничего не меняя",
+        )
+
+    def handle(self, *args, **options):
+        partitions = options["partitions"]
+        if partitions < 0:
+            raise CommandError("--partitions не может быть отрицательным.")
+        selected = tables()
+        if options["table"]:
+            unknown = set(options["table"]) - {table for _, table, _ in selected}
+            if unknown:
+                raise CommandError(f"Неизвестные таблицы: {', '.join(sorted(unknown))}")
+            selected = [item for item in selected if item[1] in options["table"]]
+
+        for _, table, key in selected:
+            with connection.cursor() as cursor:
+                current = partition_count(cursor, table)
+                if current == partitions:
+                    self.stdout.write(f"{table}: уже {partitions} секций, пропущено")
+                    continue
+                if options["dry_run"]:
+                    statements, validation = rebuild_statements(
+                        cursor, table, key, partitions
+                    )
+                    self.stdout.write(f"-- {table}: {current} -> {partitions} секций")
+                    self.stdout.write(";\n".join(statements) + ";")
+                    if validation:
+                        self.stdout.write("-- после фиксации:")
+                        self.stdout.write(";\n".join(validation) + ";")
+                    continue
+            rebuild(table, key, partitions)
+            self.stdout.write(
+                self.style.SUCCESS(f"{table}: {current} -> {partitions} секций")
+            )
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+
+from recipes.documents import DOCUMENT_VERSION, rebuild_documents
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = "Пересобирает денормализованные документы рецептов (Recipe.document)."
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--stale",
+            action="store_true",
+            help="Только документы старой версии или ещё не построенные",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="Рецептов за один запрос (по умолчанию: 500)",
+        )
+
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.order_by("id")
+        if options["stale"]:
+            recipes = recipes.exclude(document__v=DOCUMENT_VERSION)
+        recipe_ids = list(recipes.values_list("id", flat=True))
+        rebuild_documents(recipe_ids, batch_size=options["batch_size"])
+        self.stdout.write(
+            self.style.SUCCESS(f"Пересобрано документов: {len(recipe_ids)}")
+        )
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from recipes.models import Recipe, Favorite
+
+
+class Command(BaseCommand):
+    help = "Пересчитывает счётчик favorites_count у рецептов по таблице избранного."
+    requires_system_checks = []
+
+    def handle(self, *args, **options):
+        counts = (
+            Favorite.objects.filter(recipe=OuterRef("pk"))
+            .order_by()
+            .values("recipe")
+            .annotate(total=Count("id"))
+            .values("total")
+        )
+        updated = Recipe.objects.update(
+            favorites_count=Coalesce(Subquery(counts), 0)
+        )
+        self.stdout.write(self.style.SUCCESS(f"Пересчитано рецептов: {updated}"))
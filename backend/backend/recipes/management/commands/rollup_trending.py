@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from recipes.trending import rollup
+
+
+class Command(BaseCommand):
+    help = (
+        "Сворачивает минутные корзины популярности в часовые и суточные, "
+        "удаляет устаревшие и пересчитывает рейтинги 1h/24h/7d; запускать "
+        "периодически (например, раз в минуту)."
+    )
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--top-k",
+            type=int,
+            help="Размер рейтинга (по умолчанию: TRENDING_TOP_K)",
+        )
+
+    def handle(self, *args, **options):
+        deleted, leaders = rollup(top_k=options["top_k"])
+        for window, entries in leaders.items():
+            self.stdout.write(f"  {window}: {len(entries)}")
+        self.stdout.write(self.style.SUCCESS(f"Удалено устаревших корзин: {deleted}"))
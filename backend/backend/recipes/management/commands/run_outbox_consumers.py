@@ -0,0 +1,74 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+
+from recipes.outbox import consumers, prune
+
+
+class Command(BaseCommand):
+    help = (
+        "Запускает потребителей outbox событий из settings.OUTBOX_CONSUMERS: "
+        "читает события пачками и сохраняет позицию каждого потребителя."
+    )
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--consumer",
+            action="append",
+            help="Запустить только этого потребителя (можно повторять)",
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Обработать накопившиеся события и завершиться",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            help="Размер пачки (по умолчанию: OUTBOX_BATCH_SIZE)",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=settings.OUTBOX_POLL_INTERVAL,
+            help="Пауза, когда новых событий нет, с (по умолчанию: OUTBOX_POLL_INTERVAL)",
+        )
+        parser.add_argument(
+            "--prune",
+            action="store_true",
+            help="Удалить события, прочитанные всеми потребителями и старше "
+                 "OUTBOX_RETENTION_HOURS",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            selected = consumers(options["consumer"], options["batch_size"])
+        except KeyError as error:
+            raise CommandError(f"Неизвестные потребители: {error.args[0]}")
+        if not selected:
+            self.stdout.write("Потребители не настроены (OUTBOX_CONSUMERS).")
+
+        processed = dict.fromkeys((consumer.name for consumer in selected), 0)
+        try:
+            while selected:
+                close_old_connections()
+                busy = False
+                for consumer in selected:
+                    count = consumer.run_once()
+                    processed[consumer.name] += count
+                    busy = busy or count == consumer.batch_size
+                if busy:
+                    continue
+                if options["once"]:
+                    break
+                time.sleep(options["interval"])
+        except KeyboardInterrupt:
+            pass
+
+        for name, count in processed.items():
+            self.stdout.write(f"  {name}: {count}")
+        if options["prune"]:
+            self.stdout.write(f"Удалено событий: {prune()}")
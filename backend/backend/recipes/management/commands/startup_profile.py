@@ -0,0 +1,198 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Выполняется в отдельном процессе: загружает WSGI-приложение так же, как
+# gunicorn, и отдаёт один запрос без django.test.
+FIRST_REQUEST_SCRIPT = """
+import io, json, os, sys, time
+started = time.perf_counter()
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+from django.core.wsgi import get_wsgi_application
+application = get_wsgi_application()
+loaded = time.perf_counter()
+path, _, query = sys.argv[1].partition('?')
+environ = {
+    'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'QUERY_STRING': query,
+    'SERVER_NAME': sys.argv[2], 'SERVER_PORT': '80', 'HTTP_HOST': sys.argv[2],
+    'SERVER_PROTOCOL': 'HTTP/1.1', 'wsgi.input': io.BytesIO(),
+    'wsgi.errors': sys.stderr, 'wsgi.url_scheme': 'http',
+    'wsgi.multithread': False, 'wsgi.multiprocess': True, 'wsgi.run_once': False,
+}
+statuses = []
+body = b''.join(application(environ, lambda status, headers: statuses.append(status)))
+finished = time.perf_counter()
+print(json.dumps({
+    'status': statuses[0],
+    'load': loaded - started,
+    'first_request': finished - loaded,
+    'modules': len(sys.modules),
+}))
+"""
+
+
+def parse_importtime(output):
+    """Строит дерево импортов из вывода python -X importtime."""
+    pending = {}
+    roots = []
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        node = {
+            "name": name.strip(),
+            "self": int(self_us) / 1000,
+            "cumulative": int(cumulative_us) / 1000,
+            "children": pending.pop(depth + 1, []),
+        }
+        if depth == 0:
+            roots.append(node)
+        else:
+            pending.setdefault(depth, []).append(node)
+    return roots
+
+
+def walk(nodes):
+    for node in nodes:
+        yield node
+        yield from walk(node["children"])
+
+
+class Command(BaseCommand):
+    help = (
+        "Профилирует запуск: время импорта модулей (дерево как у "
+        "python -X importtime) и время от старта процесса до первого ответа."
+    )
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--path",
+            default="/api/recipes/?limit=6",
+            help="Запрос для замера первого ответа (по умолчанию: /api/recipes/?limit=6)",
+        )
+        parser.add_argument(
+            "--repeat",
+            type=int,
+            default=5,
+            help="Количество холодных запусков (по умолчанию: 5)",
+        )
+        parser.add_argument(
+            "--depth",
+            type=int,
+            default=3,
+            help="Глубина дерева импортов (по умолчанию: 3)",
+        )
+        parser.add_argument(
+            "--min-ms",
+            type=float,
+            default=5,
+            help="Не показывать модули дешевле, мс (по умолчанию: 5)",
+        )
+        parser.add_argument(
+            "--max-cold-start",
+            type=float,
+            help="Завершиться ошибкой, если медиана до первого ответа больше, с",
+        )
+        parser.add_argument(
+            "--json",
+            action="store_true",
+            help="Вывести результаты бенчмарка одной строкой JSON",
+        )
+
+    def handle(self, *args, **options):
+        host = next(
+            (host for host in settings.ALLOWED_HOSTS if host and host != "*"
+             and not host.startswith(".")),
+            "localhost",
+        )
+        command = [sys.executable, "-c", FIRST_REQUEST_SCRIPT, options["path"], host]
+        env = {**os.environ, "DJANGO_SETTINGS_MODULE": settings.SETTINGS_MODULE}
+
+        profile = subprocess.run(
+            [sys.executable, "-X", "importtime", *command[1:]],
+            env=env, capture_output=True, text=True, check=False,
+        )
+        if profile.returncode:
+            raise CommandError(profile.stderr[-2000:])
+        roots = parse_importtime(profile.stderr)
+
+        runs = []
+        for _ in range(options["repeat"]):
+            started = time.perf_counter()
+            result = subprocess.run(
+                command, env=env, capture_output=True, text=True, check=False
+            )
+            wall = time.perf_counter() - started
+            if result.returncode:
+                raise CommandError(result.stderr[-2000:])
+            run = json.loads(result.stdout.strip().splitlines()[-1])
+            run["total"] = wall
+            runs.append(run)
+
+        summary = {
+            "path": options["path"],
+            "status": runs[0]["status"],
+            "modules": runs[0]["modules"],
+            "import_ms": round(sum(node["cumulative"] for node in roots), 1),
+            **{
+                f"{key}_ms": round(statistics.median(run[key] for run in runs) * 1000, 1)
+                for key in ("load", "first_request", "total")
+            },
+        }
+        if options["json"]:
+            self.stdout.write(json.dumps(summary))
+        else:
+            self.report(roots, summary, options)
+
+        limit = options["max_cold_start"]
+        if limit is not None and summary["total_ms"] > limit * 1000:
+            raise CommandError(
+                f"Холодный старт {summary['total_ms']} мс дольше {limit} с."
+            )
+
+    def report(self, roots, summary, options):
+        self.stdout.write(self.style.MIGRATE_HEADING("Импорты (мс, накопительно / собственное):"))
+        self.print_tree(
+            sorted(roots, key=lambda node: -node["cumulative"]),
+            0, options["depth"], options["min_ms"],
+        )
+
+        packages = {}
+        for node in walk(roots):
+            package = node["name"].split(".")[0]
+            packages[package] = packages.get(package, 0) + node["self"]
+        self.stdout.write(self.style.MIGRATE_HEADING("По пакетам (собственное время, мс):"))
+        for package, spent in sorted(packages.items(), key=lambda item: -item[1])[:15]:
+            self.stdout.write(f"  {spent:8.1f}  {package}")
+
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f"Холодный старт, медиана из {options['repeat']} ({summary['path']}):"
+        ))
+        self.stdout.write(
+            f"  модулей: {summary['modules']}, статус: {summary['status']}\n"
+            f"  загрузка приложения: {summary['load_ms']} мс\n"
+            f"  первый запрос: {summary['first_request_ms']} мс\n"
+            f"  от запуска процесса до ответа: {summary['total_ms']} мс"
+        )
+
+    def print_tree(self, nodes, depth, max_depth, min_ms):
+        for node in nodes:
+            if node["cumulative"] < min_ms:
+                continue
+            self.stdout.write(
+                f"{'  ' * depth}{node['cumulative']:8.1f} / {node['self']:6.1f}"
+                f"  {node['name']}"
+            )
+            if depth + 1 < max_depth:
+                self.print_tree(
+                    sorted(node["children"], key=lambda child: -child["cumulative"]),
+                    depth + 1, max_depth, min_ms,
+                )
@@ -1,10 +1,14 @@
 import shortuuid
 from django.contrib.auth.models import AbstractUser
+from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GinIndex, OpClass
 from django.core.validators import (
     MaxValueValidator,
     MinValueValidator,
 )
 from django.db import models
+from django.db.models.functions import Upper
+from django.utils import timezone
 
 from .constants import (
     USER_EMAIL_MAX_LENGTH,
@@ -16,6 +20,10 @@ from .constants import (
     RECIPE_COOKING_TIME_MAX,
     INGREDIENT_AMOUNT_MIN,
     INGREDIENT_AMOUNT_MAX,
+    TAG_NAME_MAX_LENGTH,
+    TAG_SLUG_MAX_LENGTH,
+    OUTBOX_EVENT_TYPE_MAX_LENGTH,
+    OUTBOX_CONSUMER_MAX_LENGTH,
 )
 
 
@@ -39,6 +47,16 @@ class User(AbstractUser):
     class Meta:
         verbose_name = 'Пользователь'
         verbose_name_plural = "Пользователи"
+        indexes = [
+            models.Index(
+                OpClass(Upper('username'), name='text_pattern_ops'),
+                name='user_username_prefix_idx',
+            ),
+            models.Index(
+                OpClass(Upper('email'), name='text_pattern_ops'),
+                name='user_email_prefix_idx',
+            ),
+        ]
 
     def __str__(self):
         return self.username
@@ -64,6 +82,35 @@ class Ingredient(models.Model):
                 name='unique_ingredient_name_unit'
             )
         ]
+        indexes = [
+            # istartswith в Postgres превращается в UPPER(name::text) LIKE ...
+            models.Index(
+                OpClass(Upper('name'), name='text_pattern_ops'),
+                name='ingredient_name_prefix_idx',
+            ),
+        ]
+
+    def __str__(self):
+        return self.name
+
+
+class Tag(models.Model):
+
+    name = models.CharField(
+        max_length=TAG_NAME_MAX_LENGTH,
+        unique=True,
+        verbose_name='Название',
+    )
+    slug = models.SlugField(
+        max_length=TAG_SLUG_MAX_LENGTH,
+        unique=True,
+        verbose_name='Слаг',
+    )
+
+    class Meta:
+        verbose_name = "Тег"
+        verbose_name_plural = "Теги"
+        ordering = ["name"]
 
     def __str__(self):
         return self.name
@@ -93,6 +140,23 @@ class Recipe(models.Model):
         verbose_name='Ингредиенты',
     )
 
+    tags = models.ManyToManyField(
+        Tag,
+        blank=True,
+        related_name='recipes',
+        verbose_name='Теги',
+    )
+
+    # Копия tags для фильтрации по нескольким тегам через GIN-индекс
+    # (&& и @> вместо JOIN и DISTINCT); обновляется сигналом m2m_changed.
+    tag_ids = ArrayField(
+        models.BigIntegerField(),
+        default=list,
+        blank=True,
+        editable=False,
+        verbose_name='id тегов',
+    )
+
     short_code = models.CharField(
         max_length=RECIPE_SHORT_CODE_MAX_LENGTH,
         unique=True,
@@ -102,6 +166,38 @@ class Recipe(models.Model):
 
     text = models.TextField(verbose_name='Описание')
 
+    favorites_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Добавлений в избранное',
+    )
+
+    # Прямое затухание: сумма весов, отнесённых к PopularityEpoch, см.
+    # recipes/popularity.py. Значения сравнимы между собой в любой момент.
+    popularity_score = models.FloatField(
+        default=0,
+        editable=False,
+        verbose_name='Популярность',
+    )
+
+    # MinHash текста и ингредиентов для поиска почти одинаковых рецептов,
+    # считается вместе с document, см. recipes/duplicates.py.
+    minhash = ArrayField(
+        models.BigIntegerField(),
+        default=list,
+        blank=True,
+        editable=False,
+        verbose_name='MinHash',
+    )
+
+    # Готовое представление рецепта без полей, зависящих от пользователя,
+    # собирается в recipes/documents.py.
+    document = models.JSONField(
+        default=dict,
+        editable=False,
+        verbose_name='Документ для чтения',
+    )
+
     cooking_time = models.PositiveSmallIntegerField(
         verbose_name='Время приготовления (мин)',
         validators=[
@@ -119,6 +215,18 @@ class Recipe(models.Model):
                 fields=["author", "name"], name="unique_recipe_author_name"
             )
         ]
+        indexes = [
+            models.Index(fields=['author', '-id'], name='recipe_author_id_idx'),
+            models.Index(fields=['-favorites_count'], name='recipe_favorites_count_idx'),
+            models.Index(
+                fields=['-popularity_score', '-id'], name='recipe_popularity_idx'
+            ),
+            GinIndex(fields=['tag_ids'], name='recipe_tag_ids_gin'),
+            models.Index(
+                OpClass(Upper('name'), name='text_pattern_ops'),
+                name='recipe_name_prefix_idx',
+            ),
+        ]
 
     def __str__(self):
         return self.name
@@ -153,6 +261,18 @@ class RecipeIngredient(models.Model):
                 name='unique_recipe_ingredient_pair'
             )
         ]
+        indexes = [
+            models.Index(
+                fields=['recipe'],
+                include=['ingredient', 'amount'],
+                name='recipeingredient_recipe_idx',
+            ),
+            models.Index(
+                fields=['ingredient'],
+                include=['recipe', 'amount'],
+                name='recipeingredient_ingr_idx',
+            ),
+        ]
 
     def __str__(self):
         return f'Количество {self.ingredient} в {self.recipe} составляет {self.amount}'
@@ -174,6 +294,8 @@ class ShoppingCart(models.Model):
         verbose_name="Рецепт в корзине"
     )
 
+    created_at = models.DateTimeField(default=timezone.now, verbose_name="Добавлено")
+
     class Meta:
         verbose_name = 'Список покупок'
         verbose_name_plural = 'Списки покупок'
@@ -183,6 +305,13 @@ class ShoppingCart(models.Model):
                 name='unique_user_recipe_shoppingcart'
             )
         ]
+        indexes = [
+            models.Index(
+                fields=['user', '-id'],
+                include=['recipe'],
+                name='shoppingcart_user_id_idx',
+            ),
+        ]
 
     def __str__(self):
         return f'У {self.user} Корзина {self.recipe}'
@@ -196,6 +325,7 @@ class Favorite(models.Model):
         verbose_name="Пользователь",
     )
     recipe = models.ForeignKey(Recipe, on_delete=models.CASCADE, verbose_name="Рецепт")
+    created_at = models.DateTimeField(default=timezone.now, verbose_name="Добавлено")
 
     class Meta:
         verbose_name = "Избранное"
@@ -203,6 +333,13 @@ class Favorite(models.Model):
         constraints = [
             models.UniqueConstraint(fields=["user", "recipe"], name="unique_favorite")
         ]
+        indexes = [
+            models.Index(
+                fields=['user', '-id'],
+                include=['recipe'],
+                name='favorite_user_id_idx',
+            ),
+        ]
         ordering = ["-id"]
 
     def __str__(self):
@@ -238,4 +375,145 @@ class Follow(models.Model):
         return f"{self.follower} follows {self.following}"
 
     def is_following(self, user1, user2):
-        return Follow.objects.filter(follower=user1, following=user2).exists()
\ No newline at end of file
+        return Follow.objects.filter(follower=user1, following=user2).exists()
+
+
+class OutboxEvent(models.Model):
+    """Событие взаимодействия, записанное в одной транзакции с изменением.
+
+    Таблица только дополняется; читать её нужно через recipes.outbox.
+    Ссылки хранятся числами без внешних ключей: событие переживает
+    удаление рецепта или пользователя.
+    """
+
+    class Type(models.TextChoices):
+        FAVORITE_ADDED = 'favorite.added', 'Добавлено в избранное'
+        FAVORITE_REMOVED = 'favorite.removed', 'Удалено из избранного'
+        SHOPPING_CART_ADDED = 'shopping_cart.added', 'Добавлено в корзину'
+        SHOPPING_CART_REMOVED = 'shopping_cart.removed', 'Удалено из корзины'
+        FOLLOW_ADDED = 'follow.added', 'Подписка'
+        FOLLOW_REMOVED = 'follow.removed', 'Отписка'
+        RECIPE_CREATED = 'recipe.created', 'Рецепт создан'
+        RECIPE_UPDATED = 'recipe.updated', 'Рецепт изменён'
+        RECIPE_DELETED = 'recipe.deleted', 'Рецепт удалён'
+
+    type = models.CharField('Тип', max_length=OUTBOX_EVENT_TYPE_MAX_LENGTH, choices=Type.choices)
+    user_id = models.BigIntegerField('Пользователь', null=True)
+    recipe_id = models.BigIntegerField('Рецепт', null=True)
+    author_id = models.BigIntegerField('Автор', null=True)
+    # txid_current() транзакции: по нему читатель отличает завершённые
+    # транзакции от ещё идущих (см. recipes/outbox.py).
+    txid = models.BigIntegerField(editable=False)
+    # txid_snapshot_xmin() в момент события: транзакции с меньшим txid
+    # закоммичены раньше этого события (позиция клиента в recipes/sync.py).
+    snapshot_xmin = models.BigIntegerField(editable=False)
+    created_at = models.DateTimeField('Время', default=timezone.now)
+
+    class Meta:
+        verbose_name = 'Событие'
+        verbose_name_plural = 'События'
+        indexes = [
+            models.Index(fields=['txid', 'id'], name='outbox_txid_id_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.type} #{self.id}'
+
+
+class OutboxCheckpoint(models.Model):
+    """Позиция потребителя outbox: последнее обработанное событие."""
+
+    consumer = models.CharField(
+        'Потребитель', max_length=OUTBOX_CONSUMER_MAX_LENGTH, primary_key=True
+    )
+    txid = models.BigIntegerField(default=0)
+    event_id = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField('Обновлено', auto_now=True)
+
+    class Meta:
+        verbose_name = 'Позиция потребителя'
+        verbose_name_plural = 'Позиции потребителей'
+
+    def __str__(self):
+        return f'{self.consumer}: {self.txid}/{self.event_id}'
+
+
+class PopularityEpoch(models.Model):
+    """Момент, к которому отнесены Recipe.popularity_score; одна строка.
+
+    Сдвигается командой decay_popularity, см. recipes/popularity.py.
+    """
+
+    started_at = models.DateTimeField('Точка отсчёта')
+
+    class Meta:
+        verbose_name = 'Точка отсчёта популярности'
+        verbose_name_plural = 'Точка отсчёта популярности'
+
+    def __str__(self):
+        return f'{self.started_at:%Y-%m-%d %H:%M}'
+
+
+class TrendingBucket(models.Model):
+    """Сумма весов взаимодействий с рецептом за минуту, час или сутки."""
+
+    class Resolution(models.TextChoices):
+        MINUTE = 'minute', 'Минута'
+        HOUR = 'hour', 'Час'
+        DAY = 'day', 'Сутки'
+
+    resolution = models.CharField(max_length=8, choices=Resolution.choices)
+    start = models.DateTimeField('Начало')
+    recipe_id = models.BigIntegerField('Рецепт')
+    score = models.FloatField('Вес', default=0)
+
+    class Meta:
+        verbose_name = 'Корзина популярности'
+        verbose_name_plural = 'Корзины популярности'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['resolution', 'start', 'recipe_id'],
+                name='unique_trending_bucket',
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.resolution} {self.start}: {self.recipe_id} = {self.score}'
+
+
+class TrendingRollup(models.Model):
+    """До какого момента корзины свёрнуты в часовые и суточные."""
+
+    resolution = models.CharField(
+        max_length=8, choices=TrendingBucket.Resolution.choices, primary_key=True
+    )
+    rolled_until = models.DateTimeField()
+
+    class Meta:
+        verbose_name = 'Свёртка популярности'
+        verbose_name_plural = 'Свёртки популярности'
+
+    def __str__(self):
+        return f'{self.resolution}: {self.rolled_until}'
+
+
+class TrendingEntry(models.Model):
+    """Место рецепта в готовом рейтинге за окно (1h, 24h, 7d)."""
+
+    window = models.CharField('Окно', max_length=8)
+    rank = models.PositiveSmallIntegerField('Место')
+    recipe_id = models.BigIntegerField('Рецепт')
+    score = models.FloatField('Вес')
+
+    class Meta:
+        verbose_name = 'Место в рейтинге'
+        verbose_name_plural = 'Рейтинг'
+        ordering = ['window', 'rank']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['window', 'rank'], name='unique_trending_rank'
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.window} #{self.rank}: {self.recipe_id}'
@@ -0,0 +1,152 @@
+"""Outbox событий взаимодействия и его потребители.
+
+emit() вызывается из сигналов (recipes/signals.py) и пишет событие в той же
+транзакции, что и само изменение: событие видно тогда и только тогда, когда
+закоммичено изменение.
+
+Порядок id не совпадает с порядком коммитов: транзакция, получившая id
+раньше, может закоммититься позже. Поэтому события читаются в порядке
+(txid, id) и только из транзакций старше txid_snapshot_xmin: все они уже
+завершены, и перед позицией потребителя новых событий не появится. Долгая
+транзакция в базе задерживает события, но не теряет их.
+
+Потребитель обрабатывает пачку и сдвигает позицию в одной транзакции,
+поэтому проекции в этой же базе применяют каждое событие ровно один раз.
+Потребители перечислены в settings.OUTBOX_CONSUMERS, запускает их
+manage.py run_outbox_consumers.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, connections, models, transaction
+from django.db.models import Min, Q
+from django.db.models.expressions import RawSQL
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import OutboxCheckpoint, OutboxEvent
+
+FINISHED_TXID = RawSQL(
+    'txid_snapshot_xmin(txid_current_snapshot())', [],
+    output_field=models.BigIntegerField(),
+)
+
+
+RECIPE_EVENTS = (
+    OutboxEvent.Type.RECIPE_CREATED,
+    OutboxEvent.Type.RECIPE_UPDATED,
+    OutboxEvent.Type.RECIPE_DELETED,
+)
+
+
+def emit(type, user_id=None, recipe_id=None, author_id=None):
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT txid_current(), txid_snapshot_xmin(txid_current_snapshot())')
+        txid, snapshot_xmin = cursor.fetchone()
+    OutboxEvent.objects.create(
+        type=type,
+        user_id=user_id,
+        recipe_id=recipe_id,
+        author_id=author_id,
+        txid=txid,
+        snapshot_xmin=snapshot_xmin,
+    )
+
+
+class Consumer:
+    """Читает outbox пачками и передаёт их handler(events).
+
+    Позиция хранится в OutboxCheckpoint под именем потребителя. Если пачку
+    того же потребителя уже обрабатывает другой процесс, run_once() ничего
+    не делает.
+    """
+
+    def __init__(self, name, handler, batch_size=None):
+        self.name = name
+        self.handler = handler
+        self.batch_size = batch_size or settings.OUTBOX_BATCH_SIZE
+
+    def pending(self, checkpoint):
+        return committed_events((checkpoint.txid, checkpoint.event_id))[:self.batch_size]
+
+    def run_once(self):
+        """Обрабатывает одну пачку; возвращает количество событий."""
+        OutboxCheckpoint.objects.get_or_create(consumer=self.name)
+        with transaction.atomic():
+            checkpoint = (
+                OutboxCheckpoint.objects.select_for_update(skip_locked=True)
+                .filter(consumer=self.name).first()
+            )
+            if checkpoint is None:
+                return 0
+            events = list(self.pending(checkpoint))
+            if events:
+                self.handler(events)
+                checkpoint.txid, checkpoint.event_id = events[-1].txid, events[-1].id
+                checkpoint.save(update_fields=['txid', 'event_id', 'updated_at'])
+            return len(events)
+
+
+def committed_events(position, types=None, using=None):
+    """События завершённых транзакций после position=(txid, id) в порядке (txid, id)."""
+    txid, event_id = position
+    events = OutboxEvent.objects.using(using).filter(
+        Q(txid__gt=txid) | Q(txid=txid, id__gt=event_id),
+        txid__lt=FINISHED_TXID,
+    )
+    if types:
+        events = events.filter(type__in=types)
+    return events.order_by('txid', 'id')
+
+
+def snapshot_position(using):
+    """Позиция для читателя, который сейчас прочитает данные целиком.
+
+    Транзакции до txid_snapshot_xmin завершены, и их изменения будут в
+    прочитанных данных; события остальных транзакций лежат после позиции.
+    """
+    with connections[using].cursor() as cursor:
+        cursor.execute('SELECT txid_snapshot_xmin(txid_current_snapshot())')
+        return cursor.fetchone()[0], 0
+
+
+def changed_recipes(position, using):
+    """(id рецептов, созданных, изменённых или удалённых после position, новая позиция).
+
+    Для индексов в памяти процесса: в отличие от max(id) строк, порядок
+    (txid, id) не пропускает транзакции, закоммиченные позже.
+    """
+    recipe_ids = set()
+    for txid, event_id, recipe_id in (
+        committed_events(position, RECIPE_EVENTS, using)
+        .values_list('txid', 'id', 'recipe_id')
+        .iterator()
+    ):
+        recipe_ids.add(recipe_id)
+        position = (txid, event_id)
+    return recipe_ids, position
+
+
+def consumers(names=None, batch_size=None):
+    configured = settings.OUTBOX_CONSUMERS
+    unknown = set(names or ()) - set(configured)
+    if unknown:
+        raise KeyError(', '.join(sorted(unknown)))
+    return [
+        Consumer(name, import_string(path), batch_size)
+        for name, path in configured.items()
+        if not names or name in names
+    ]
+
+
+def prune():
+    """Удаляет события, прочитанные всеми потребителями и старше срока хранения."""
+    events = OutboxEvent.objects.filter(
+        created_at__lt=timezone.now() - timedelta(hours=settings.OUTBOX_RETENTION_HOURS)
+    )
+    if settings.OUTBOX_CONSUMERS:
+        checkpoints = OutboxCheckpoint.objects.filter(consumer__in=settings.OUTBOX_CONSUMERS)
+        if checkpoints.count() < len(settings.OUTBOX_CONSUMERS):
+            return 0
+        events = events.filter(txid__lt=checkpoints.aggregate(value=Min('txid'))['value'])
+    return events.delete()[0]
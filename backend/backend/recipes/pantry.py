@@ -0,0 +1,133 @@
+"""Индекс «что приготовить из того, что есть».
+
+Для каждого рецепта хранится битовая маска ингредиентов (целое число
+Python, бит на ингредиент), для каждого ингредиента — множество рецептов
+с ним. Поиск берёт рецепты хотя бы с одним имеющимся ингредиентом и
+считает недостающие через popcount(маска рецепта & маска продуктов).
+
+Индекс живёт в памяти процесса (с preload_app строится в мастере до fork).
+Не чаще раза в PANTRY_INDEX_REFRESH_INTERVAL секунд процесс читает события
+рецептов из outbox после своей позиции (txid, id) и перечитывает ингредиенты
+созданных, изменённых и удалённых рецептов (recipes.outbox.changed_recipes).
+Раз в PANTRY_INDEX_TTL секунд индекс перезагружается целиком: так
+догоняются изменения без событий (seed, правки в обход моделей).
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.db import router
+
+from .models import RecipeIngredient
+from .outbox import changed_recipes, snapshot_position
+
+try:
+    popcount = int.bit_count
+except AttributeError:  # Python < 3.10
+    def popcount(value):
+        return bin(value).count('1')
+
+
+class PantryIndex:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.positions = {}
+        self.bitmaps = {}
+        self.sizes = {}
+        self.postings = {}
+        self.position = (0, 0)
+        self.loaded_at = None
+        self.checked_at = 0.0
+
+    def _position(self, ingredient_id):
+        position = self.positions.get(ingredient_id)
+        if position is None:
+            position = self.positions[ingredient_id] = len(self.positions)
+        return position
+
+    def _add(self, recipe_id, ingredient_id):
+        position = self._position(ingredient_id)
+        self.bitmaps[recipe_id] = self.bitmaps.get(recipe_id, 0) | (1 << position)
+        self.postings.setdefault(position, set()).add(recipe_id)
+
+    def _remove_recipe(self, recipe_id):
+        bitmap = self.bitmaps.pop(recipe_id, 0)
+        self.sizes.pop(recipe_id, None)
+        while bitmap:
+            lowest = bitmap & -bitmap
+            self.postings[lowest.bit_length() - 1].discard(recipe_id)
+            bitmap ^= lowest
+
+    def _load_rows(self, rows):
+        touched = set()
+        for recipe_id, ingredient_id in rows:
+            self._add(recipe_id, ingredient_id)
+            touched.add(recipe_id)
+        for recipe_id in touched:
+            self.sizes[recipe_id] = popcount(self.bitmaps[recipe_id])
+
+    def reload(self):
+        # Позиция и строки читаются из одной базы: реплики отстают по-разному.
+        using = router.db_for_read(RecipeIngredient)
+        position = snapshot_position(using)
+        rows = (
+            RecipeIngredient.objects.using(using).order_by()
+            .values_list('recipe_id', 'ingredient_id')
+            .iterator(chunk_size=10000)
+        )
+        with self.lock:
+            self.positions, self.bitmaps, self.sizes, self.postings = {}, {}, {}, {}
+            self._load_rows(rows)
+            self.position = position
+            self.loaded_at = self.checked_at = time.monotonic()
+
+    def refresh(self):
+        """Перечитывает рецепты, изменённые после позиции индекса."""
+        now = time.monotonic()
+        if self.loaded_at is None or now - self.loaded_at > settings.PANTRY_INDEX_TTL:
+            self.reload()
+            return
+        if now - self.checked_at < settings.PANTRY_INDEX_REFRESH_INTERVAL:
+            return
+        self.checked_at = now
+        using = router.db_for_read(RecipeIngredient)
+        touched, position = changed_recipes(self.position, using)
+        rows = list(
+            RecipeIngredient.objects.using(using).filter(recipe_id__in=touched)
+            .values_list('recipe_id', 'ingredient_id')
+        )
+        with self.lock:
+            for recipe_id in touched:
+                self._remove_recipe(recipe_id)
+            self._load_rows(rows)
+            self.position = position
+
+    def discard(self, recipe_id):
+        with self.lock:
+            self._remove_recipe(recipe_id)
+
+    def search(self, ingredient_ids):
+        """Рецепты хотя бы с одним ингредиентом: [(recipe_id, недостаёт, есть)].
+
+        Сначала те, что можно приготовить целиком, затем по числу
+        недостающих ингредиентов, при равенстве — новые выше.
+        """
+        self.refresh()
+        with self.lock:
+            have = 0
+            candidates = set()
+            for ingredient_id in ingredient_ids:
+                position = self.positions.get(ingredient_id)
+                if position is not None:
+                    have |= 1 << position
+                    candidates |= self.postings[position]
+            results = []
+            for recipe_id in candidates:
+                matched = popcount(self.bitmaps[recipe_id] & have)
+                results.append((recipe_id, self.sizes[recipe_id] - matched, matched))
+        results.sort(key=lambda item: (item[1], -item[2], -item[0]))
+        return results
+
+
+pantry_index = PantryIndex()
@@ -0,0 +1,164 @@
+"""Hash-секционирование таблиц связей по пользователю.
+
+Избранное, корзина и подписки растут как пользователи × рецепты, а почти
+все обращения к ним — по одному пользователю (списки, is_favorited,
+переключатели из recipes/toggles.py). Таблица, секционированная
+PARTITION BY HASH по пользователю, отвечает на такой запрос одной
+небольшой секцией, а autovacuum обрабатывает секции по отдельности.
+
+rebuild() пересоздаёт таблицу под тем же именем. Пока старая таблица
+открыта на чтение (запись ждёт), строки копируются в новую, на ней строятся
+первичный ключ (id, ключ секционирования), ограничения и индексы из каталога
+под временными именами и внешние ключи NOT VALID. Затем короткий шаг
+удаляет старую таблицу и переименовывает новую, а после фиксации внешние
+ключи проверяются без блокировки чтения и записи. Модели Django не
+меняются: ORM обращается к таблице по имени и ищет строку по id.
+partitions=0 возвращает обычную таблицу.
+"""
+import re
+
+from django.db import connection, transaction
+
+from .models import Favorite, Follow, ShoppingCart
+
+PARTITIONS = 16
+# Модель связи: поле пользователя, по которому она секционируется.
+PARTITION_KEYS = {
+    Favorite: 'user',
+    ShoppingCart: 'user',
+    Follow: 'follower',
+}
+# Определение индекса из pg_get_indexdef; у секционированной таблицы — ON ONLY.
+INDEX_DEFINITION = re.compile(r'CREATE (UNIQUE )?INDEX (\S+) ON (?:ONLY )?\S+ (USING .*)')
+
+
+def partition_count(cursor, table):
+    """Количество секций таблицы, 0 — обычная таблица."""
+    cursor.execute(
+        "SELECT c.relkind = 'p', count(i.inhrelid) FROM pg_class c "
+        "LEFT JOIN pg_inherits i ON i.inhparent = c.oid "
+        "WHERE c.oid = %s::regclass GROUP BY c.relkind",
+        [table],
+    )
+    partitioned, count = cursor.fetchone()
+    return count if partitioned else 0
+
+
+def rebuild_statements(cursor, table, key, partitions):
+    """SQL пересоздания table с partitions секциями по столбцу key.
+
+    Возвращает (statements, validation): statements выполняются в одной
+    транзакции, validation — после её фиксации.
+    """
+    cursor.execute(
+        "SELECT conname, contype, pg_get_constraintdef(oid) FROM pg_constraint "
+        "WHERE conrelid = %s::regclass AND contype <> 'p' ORDER BY conname",
+        [table],
+    )
+    constraints = cursor.fetchall()
+    cursor.execute(
+        "SELECT pg_get_indexdef(i.indexrelid) FROM pg_index i "
+        "WHERE i.indrelid = %s::regclass AND NOT EXISTS ("
+        "SELECT 1 FROM pg_constraint c WHERE c.conindid = i.indexrelid "
+        "AND c.conrelid = i.indrelid) ORDER BY i.indexrelid",
+        [table],
+    )
+    indexes = [INDEX_DEFINITION.match(row[0]).groups('') for row in cursor.fetchall()]
+
+    new = f'{table}__new'
+    # Имена индексов (и ограничений с индексом) общие на схему, поэтому на
+    # новой таблице они временные; у внешних ключей и CHECK — сразу свои.
+    renames = [(f'{new}_pkey', f'{table}_pkey')]
+    build, foreign_keys = [], []
+    for name, kind, definition in constraints:
+        if kind == 'f':
+            foreign_keys.append((name, definition))
+            continue
+        temporary = name
+        if kind in ('u', 'x'):
+            temporary = f'{new}_c{len(renames)}'
+            renames.append((temporary, name))
+        build.append(f'ALTER TABLE {new} ADD CONSTRAINT {temporary} {definition}')
+    for unique, name, rest in indexes:
+        temporary = f'{new}_i{len(renames)}'
+        renames.append((temporary, name))
+        build.append(f'CREATE {unique}INDEX {temporary} ON {new} {rest}')
+
+    # Внешний ключ NOT VALID нельзя добавить секционированной таблице:
+    # он добавляется секциям, а таблице — после проверки секций (тогда
+    # PostgreSQL присоединяет проверенные ключи секций, не читая строки).
+    holders = (
+        [f'{new}_p{remainder}' for remainder in range(partitions)]
+        if partitions else [new]
+    )
+    final_holders = [holder.replace(new, table, 1) for holder in holders]
+    statements = [
+        f'CREATE TABLE {new} (LIKE {table} INCLUDING DEFAULTS INCLUDING IDENTITY)'
+        + (f' PARTITION BY HASH ({key})' if partitions else ''),
+        *(
+            f'CREATE TABLE {new}_p{remainder} PARTITION OF {new} '
+            f'FOR VALUES WITH (MODULUS {partitions}, REMAINDER {remainder})'
+            for remainder in range(partitions)
+        ),
+        f'INSERT INTO {new} OVERRIDING SYSTEM VALUE SELECT * FROM {table}',
+        f"SELECT setval('{new}_id_seq', (SELECT max(id) FROM {new}))",
+        # Первичный ключ секционированной таблицы обязан включать ключ секций.
+        f'ALTER TABLE {new} ADD CONSTRAINT {new}_pkey PRIMARY KEY '
+        + (f'(id, {key})' if partitions else '(id)'),
+        *build,
+        f'ANALYZE {new}',
+        *(
+            f'ALTER TABLE {holder} ADD CONSTRAINT {name} {definition} NOT VALID'
+            for name, definition in foreign_keys
+            for holder in holders
+        ),
+        f'DROP TABLE {table}',
+        f'ALTER TABLE {new} RENAME TO {table}',
+        *(
+            f'ALTER TABLE {new}_p{remainder} RENAME TO {table}_p{remainder}'
+            for remainder in range(partitions)
+        ),
+        f'ALTER SEQUENCE {new}_id_seq RENAME TO {table}_id_seq',
+        *(
+            f'ALTER INDEX {temporary} RENAME TO {name}'
+            for temporary, name in renames
+        ),
+    ]
+    validation = [
+        *(
+            f'ALTER TABLE {holder} VALIDATE CONSTRAINT {name}'
+            for name, _ in foreign_keys
+            for holder in final_holders
+        ),
+        *(
+            f'ALTER TABLE {table} ADD CONSTRAINT {name} {definition}'
+            for name, definition in foreign_keys if partitions
+        ),
+    ]
+    return statements, validation
+
+
+def rebuild(table, key, partitions=PARTITIONS):
+    """Пересоздаёт table с partitions секциями; возвращает выполненный SQL.
+
+    Запись в таблицу ждёт до конца копирования и построения индексов, чтение
+    блокируется только на время замены таблицы. Внешние ключи проверяются
+    отдельными транзакциями после замены.
+    """
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f'LOCK TABLE {table} IN SHARE ROW EXCLUSIVE MODE')
+        statements, validation = rebuild_statements(cursor, table, key, partitions)
+        for statement in statements:
+            cursor.execute(statement)
+    with connection.cursor() as cursor:
+        for statement in validation:
+            cursor.execute(statement)
+    return statements + validation
+
+
+def tables():
+    """[(модель, таблица, столбец ключа секционирования)]."""
+    return [
+        (model, model._meta.db_table, model._meta.get_field(field).column)
+        for model, field in PARTITION_KEYS.items()
+    ]
@@ -0,0 +1,116 @@
+"""Популярность рецептов с экспоненциальным затуханием в прямой форме.
+
+Добавление в избранное или корзину в момент t сейчас весит
+weight * exp(-λ(now - t)). Множитель exp(-λ(now - t0)) общий для всех
+рецептов, поэтому popularity_score хранит сумму weight * exp(λ(t - t0))
+относительно общей точки отсчёта t0 (PopularityEpoch). Сортировка по индексу
+(-popularity_score, -id) верна в любой момент без пересчёта, а удаление
+вычитает ровно тот вклад, который внесло добавление (по created_at связи).
+
+Значения растут как exp(λ(now - t0)), поэтому команда decay_popularity
+изредка (например, раз в месяц) переносит t0 на текущий момент и делит все
+значения на общий множитель. На время переноса запись в таблицу рецептов
+заблокирована, изменения популярности ждут его окончания.
+"""
+import math
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import (DateTimeField, DurationField, ExpressionWrapper, F,
+                              FloatField, OuterRef, Subquery, Sum, Value)
+from django.db.models.functions import Coalesce, Exp, Extract, Greatest
+from django.utils import timezone
+
+from .models import Favorite, PopularityEpoch, Recipe, ShoppingCart
+
+# t0, пока decay_popularity ни разу не запускалась.
+DEFAULT_EPOCH = datetime(2025, 1, 1, tzinfo=dt_timezone.utc)
+RELATIONS = {'favorite': Favorite, 'shopping_cart': ShoppingCart}
+
+
+def decay_rate():
+    return math.log(2) / (settings.POPULARITY_HALF_LIFE_HOURS * 3600)
+
+
+def epoch():
+    """Выражение: текущая точка отсчёта t0."""
+    return Coalesce(
+        Subquery(PopularityEpoch.objects.values('started_at')[:1]),
+        Value(DEFAULT_EPOCH),
+        output_field=DateTimeField(),
+    )
+
+
+def contribution(event, added_at):
+    """Выражение: вклад связи, добавленной в added_at (datetime или выражение)."""
+    if isinstance(added_at, datetime):
+        added_at = Value(added_at, output_field=DateTimeField())
+    age = Extract(
+        ExpressionWrapper(added_at - epoch(), output_field=DurationField()), 'epoch'
+    )
+    return ExpressionWrapper(
+        settings.POPULARITY_WEIGHTS[event] * Exp(decay_rate() * age),
+        output_field=FloatField(),
+    )
+
+
+def bump(event, added_at, sign=1):
+    """Аргументы для update(): вклад связи, добавленной в added_at, со знаком sign."""
+    return {
+        'popularity_score': Greatest(
+            F('popularity_score') + sign * contribution(event, added_at), 0.0
+        ),
+    }
+
+
+def _lock_recipes():
+    # Изменения популярности ждут конца транзакции и видят новую t0.
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'LOCK TABLE {Recipe._meta.db_table} IN SHARE ROW EXCLUSIVE MODE'
+        )
+
+
+@transaction.atomic
+def decay_all():
+    """Переносит t0 на текущий момент; возвращает количество рецептов."""
+    _lock_recipes()
+    now = timezone.now()
+    current = PopularityEpoch.objects.select_for_update().first()
+    started_at = current.started_at if current else DEFAULT_EPOCH
+    factor = math.exp(-decay_rate() * (now - started_at).total_seconds())
+    updated = Recipe.objects.filter(popularity_score__gt=0).update(
+        popularity_score=F('popularity_score') * factor
+    )
+    Recipe.objects.filter(
+        popularity_score__gt=0,
+        popularity_score__lt=settings.POPULARITY_MIN_SCORE,
+    ).update(popularity_score=0)
+    if current is None:
+        PopularityEpoch.objects.create(started_at=now)
+    else:
+        current.started_at = now
+        current.save(update_fields=['started_at'])
+    return updated
+
+
+@transaction.atomic
+def recount_all():
+    """Считает популярность заново по избранному и корзинам."""
+    _lock_recipes()
+    totals = [
+        Coalesce(
+            Subquery(
+                model.objects.filter(recipe=OuterRef('pk'))
+                .order_by()
+                .values('recipe')
+                .annotate(total=Sum(contribution(event, F('created_at'))))
+                .values('total')
+            ),
+            0.0,
+            output_field=FloatField(),
+        )
+        for event, model in RELATIONS.items()
+    ]
+    return Recipe.objects.update(popularity_score=sum(totals[1:], totals[0]))
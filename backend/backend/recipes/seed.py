@@ -0,0 +1,94 @@
+"""Синтетические данные для проверки планов запросов и бенчмарков."""
+import random
+
+from .documents import rebuild_documents
+from .models import (User,
+                     Tag,
+                     Ingredient,
+                     Recipe,
+                     RecipeIngredient,
+                     ShoppingCart,
+                     Favorite,
+                     Follow)
+
+
+def seed_database(scale, stdout):
+    rnd = random.Random(0)
+    users_count = 500 * scale
+    recipes_count = 10000 * scale
+    stdout.write(f"Создание {users_count} пользователей и {recipes_count} рецептов...")
+
+    if Ingredient.objects.count() < 2000:
+        Ingredient.objects.bulk_create(
+            [Ingredient(name=f"seed ингредиент {i}", measurement_unit="г")
+             for i in range(2000)],
+            ignore_conflicts=True,
+        )
+    ingredient_ids = list(Ingredient.objects.values_list("id", flat=True))
+    Tag.objects.bulk_create(
+        [Tag(name=f"seed тег {i}", slug=f"seed-tag-{i}") for i in range(20)],
+        ignore_conflicts=True,
+    )
+    tag_ids = list(Tag.objects.values_list("id", flat=True))
+
+    users = User.objects.bulk_create(
+        User(
+            username=f"seed_user_{i}",
+            email=f"seed_user_{i}@example.com",
+            first_name="Seed",
+            last_name="User",
+            password="!",
+        )
+        for i in range(users_count)
+    )
+    recipes = Recipe.objects.bulk_create(
+        (
+            Recipe(
+                author=rnd.choice(users),
+                name=f"seed рецепт {i}",
+                image="recipes/images/seed.png",
+                text="seed",
+                cooking_time=rnd.randint(1, 120),
+                tag_ids=sorted(rnd.sample(tag_ids, 3)),
+            )
+            for i in range(recipes_count)
+        ),
+        batch_size=1000,
+    )
+    Recipe.tags.through.objects.bulk_create(
+        (
+            Recipe.tags.through(recipe_id=recipe.id, tag_id=tag_id)
+            for recipe in recipes
+            for tag_id in recipe.tag_ids
+        ),
+        batch_size=5000,
+    )
+    RecipeIngredient.objects.bulk_create(
+        (
+            RecipeIngredient(recipe=recipe, ingredient_id=ingredient_id,
+                             amount=rnd.randint(1, 500))
+            for recipe in recipes
+            for ingredient_id in rnd.sample(ingredient_ids, 5)
+        ),
+        batch_size=5000,
+    )
+    for model in (Favorite, ShoppingCart):
+        model.objects.bulk_create(
+            (
+                model(user=user, recipe=recipe)
+                for user in users
+                for recipe in rnd.sample(recipes, 20)
+            ),
+            batch_size=5000,
+        )
+    Follow.objects.bulk_create(
+        (
+            Follow(follower=user, following=author)
+            for user in users
+            for author in rnd.sample(users, 10)
+            if author != user
+        ),
+        batch_size=5000,
+    )
+    rebuild_documents([recipe.id for recipe in recipes])
+    return users, recipes
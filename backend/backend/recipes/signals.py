@@ -0,0 +1,174 @@
+from django.contrib.postgres.expressions import ArraySubquery
+from django.db import transaction
+from django.db.models import F, Func, OuterRef, Value
+from django.db.models.functions import Greatest
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from .documents import rebuild_documents, refresh_author
+from .duplicates import duplicate_index
+from .models import (
+    User, Tag, Ingredient, Recipe, ShoppingCart, Favorite, Follow, OutboxEvent,
+)
+from .outbox import emit
+from .pantry import pantry_index
+from .popularity import bump
+from .sync import publish
+
+
+@receiver(post_save, sender=Favorite)
+def favorite_added(sender, instance, created, **kwargs):
+    if created:
+        Recipe.objects.filter(pk=instance.recipe_id).update(
+            favorites_count=F('favorites_count') + 1, **bump('favorite', instance.created_at)
+        )
+        emit(OutboxEvent.Type.FAVORITE_ADDED, instance.user_id, instance.recipe_id)
+
+
+@receiver(post_delete, sender=Favorite)
+def favorite_removed(sender, instance, **kwargs):
+    Recipe.objects.filter(pk=instance.recipe_id).update(
+        favorites_count=Greatest(F('favorites_count') - 1, 0),
+        **bump('favorite', instance.created_at, sign=-1),
+    )
+    emit(OutboxEvent.Type.FAVORITE_REMOVED, instance.user_id, instance.recipe_id)
+
+
+@receiver(post_save, sender=ShoppingCart)
+def shopping_cart_added(sender, instance, created, **kwargs):
+    if created:
+        Recipe.objects.filter(pk=instance.recipe_id).update(**bump('shopping_cart', instance.created_at))
+        emit(
+            OutboxEvent.Type.SHOPPING_CART_ADDED, instance.user_id, instance.recipe_id
+        )
+
+
+@receiver(post_delete, sender=ShoppingCart)
+def shopping_cart_removed(sender, instance, **kwargs):
+    Recipe.objects.filter(pk=instance.recipe_id).update(
+        **bump('shopping_cart', instance.created_at, sign=-1)
+    )
+    emit(OutboxEvent.Type.SHOPPING_CART_REMOVED, instance.user_id, instance.recipe_id)
+
+
+@receiver(post_save, sender=Follow)
+def follow_added(sender, instance, created, **kwargs):
+    if created:
+        emit(
+            OutboxEvent.Type.FOLLOW_ADDED,
+            instance.follower_id,
+            author_id=instance.following_id,
+        )
+
+
+@receiver(post_delete, sender=Follow)
+def follow_removed(sender, instance, **kwargs):
+    emit(
+        OutboxEvent.Type.FOLLOW_REMOVED,
+        instance.follower_id,
+        author_id=instance.following_id,
+    )
+
+
+@receiver(post_save, sender=OutboxEvent)
+def outbox_event_created(sender, instance, created, **kwargs):
+    if created:
+        publish(instance)
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_saved(sender, instance, created, **kwargs):
+    emit(
+        OutboxEvent.Type.RECIPE_CREATED if created else OutboxEvent.Type.RECIPE_UPDATED,
+        instance.author_id,
+        instance.pk,
+        instance.author_id,
+    )
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def ingredient_changed(sender, **kwargs):
+    # Модуль справочника (orjson, gzip) нужен только при изменениях.
+    from .catalog import invalidate_snapshot
+
+    transaction.on_commit(invalidate_snapshot)
+
+
+@receiver(post_save, sender=User)
+def user_changed(sender, instance, created, update_fields=None, **kwargs):
+    if created or update_fields == frozenset({'last_login'}):
+        return
+    refresh_author(instance)
+
+
+@receiver(post_save, sender=Ingredient)
+def ingredient_renamed(sender, instance, created, **kwargs):
+    if not created:
+        rebuild_documents(
+            Recipe.objects.filter(ingredients=instance).values_list('id', flat=True)
+        )
+
+
+@receiver(pre_delete, sender=Ingredient)
+def ingredient_deleted(sender, instance, **kwargs):
+    # Строки RecipeIngredient удаляются каскадом, рецепты нужно найти заранее.
+    recipe_ids = list(
+        Recipe.objects.filter(ingredients=instance).values_list('id', flat=True)
+    )
+    if recipe_ids:
+        transaction.on_commit(lambda: rebuild_documents(recipe_ids))
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_deleted(sender, instance, **kwargs):
+    pantry_index.discard(instance.id)
+    duplicate_index.discard(instance.id)
+    emit(
+        OutboxEvent.Type.RECIPE_DELETED, instance.author_id, instance.pk, instance.author_id
+    )
+
+
+def sync_tag_ids(recipe_ids):
+    Recipe.objects.filter(id__in=recipe_ids).update(
+        tag_ids=ArraySubquery(
+            Recipe.tags.through.objects.filter(recipe_id=OuterRef('pk'))
+            .order_by('tag_id')
+            .values('tag_id')
+        )
+    )
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def recipe_tags_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        # Документ пересобирает вызывающий код вместе с остальными полями.
+        sync_tag_ids([instance.pk])
+        return
+    if action == 'post_clear':
+        recipe_ids = list(
+            Recipe.objects.filter(tag_ids__contains=[instance.pk])
+            .values_list('id', flat=True)
+        )
+    else:
+        recipe_ids = list(pk_set)
+    sync_tag_ids(recipe_ids)
+    rebuild_documents(recipe_ids)
+
+
+@receiver(post_save, sender=Tag)
+def tag_renamed(sender, instance, created, **kwargs):
+    if not created:
+        rebuild_documents(instance.recipes.values_list('id', flat=True))
+
+
+@receiver(post_delete, sender=Tag)
+def tag_deleted(sender, instance, **kwargs):
+    recipes = Recipe.objects.filter(tag_ids__contains=[instance.pk])
+    recipe_ids = list(recipes.values_list('id', flat=True))
+    recipes.update(
+        tag_ids=Func(F('tag_ids'), Value(instance.pk), function='array_remove')
+    )
+    rebuild_documents(recipe_ids)
@@ -0,0 +1,84 @@
+"""События для синхронизации избранного, корзины и подписок между устройствами.
+
+Сообщение строится из события outbox (recipes/outbox.py) и публикуется в
+канал пользователя после коммита (сигнал в recipes/signals.py). id
+сообщения — позиция '<xmin>-<id события>': переподключившийся клиент
+передаёт её в Last-Event-ID, и пропущенное за время обрыва читается из
+outbox (replay). Если события уже удалены (OUTBOX_RETENTION_HOURS) или их
+слишком много, клиент получает resync и перечитывает состояние целиком.
+
+Порядок id событий не совпадает с порядком коммитов, поэтому replay
+начинает не с id, а с xmin последнего полученного события: транзакции
+с меньшим txid закоммичены раньше него, и их события клиент уже получил.
+Остальные события пользователя отправляются заново в порядке (txid, id);
+часть из них клиент уже видел, но сообщение описывает состояние связи,
+и повтор в том же порядке его не портит.
+"""
+from django.db import transaction
+
+from backend.pubsub import get_pubsub
+from .models import OutboxEvent
+
+# Тип события outbox: (событие SSE, поле объекта, связь появилась).
+SYNC_EVENTS = {
+    OutboxEvent.Type.FAVORITE_ADDED: ('favorite', 'recipe_id', True),
+    OutboxEvent.Type.FAVORITE_REMOVED: ('favorite', 'recipe_id', False),
+    OutboxEvent.Type.SHOPPING_CART_ADDED: ('shopping_cart', 'recipe_id', True),
+    OutboxEvent.Type.SHOPPING_CART_REMOVED: ('shopping_cart', 'recipe_id', False),
+    OutboxEvent.Type.FOLLOW_ADDED: ('subscribe', 'author_id', True),
+    OutboxEvent.Type.FOLLOW_REMOVED: ('subscribe', 'author_id', False),
+}
+RESYNC = {'type': 'resync'}
+
+
+def user_channel(user_id):
+    return f'user:{user_id}'
+
+
+def message(event):
+    """{'id', 'type', 'recipe_id' | 'author_id', 'active'} для события outbox."""
+    name, field, active = SYNC_EVENTS[event.type]
+    return {
+        'id': f'{event.snapshot_xmin}-{event.id}',
+        'type': name,
+        field: getattr(event, field),
+        'active': active,
+    }
+
+
+def parse_position(value):
+    """(xmin, id события) из id сообщения или None."""
+    try:
+        xmin, event_id = map(int, value.split('-'))
+    except ValueError:
+        return None
+    return xmin, event_id
+
+
+def publish(event):
+    """Публикует событие outbox в канал пользователя после коммита."""
+    if event.type not in SYNC_EVENTS or event.user_id is None:
+        return
+    data = message(event)
+    channel = user_channel(event.user_id)
+    transaction.on_commit(lambda: get_pubsub().publish(channel, data))
+
+
+def replay(user_id, last_event_id, limit):
+    """Сообщения, которые клиент мог пропустить после last_event_id.
+
+    [RESYNC], если их не восстановить: позиция не разбирается (в том числе
+    старый формат id) или последнее полученное событие уже удалено.
+    """
+    position = parse_position(last_event_id)
+    if position is None or not OutboxEvent.objects.filter(id=position[1]).exists():
+        return [RESYNC]
+    xmin, last_id = position
+    events = list(
+        OutboxEvent.objects.filter(
+            user_id=user_id, txid__gte=xmin, type__in=list(SYNC_EVENTS)
+        ).exclude(id=last_id).order_by('txid', 'id')[:limit + 1]
+    )
+    if len(events) > limit:
+        return [RESYNC]
+    return [message(event) for event in events]
@@ -0,0 +1,99 @@
+"""Добавление и удаление связей (избранное, корзина, подписка) одним запросом.
+
+INSERT ... ON CONFLICT DO NOTHING и DELETE ... RETURNING сразу отвечают,
+существует ли цель и изменилось ли что-нибудь, поэтому повторный или
+одновременный запрос получает 400, а не IntegrityError. Сигналы post_save
+и post_delete отправляются вручную: счётчики, популярность и outbox
+(recipes/signals.py) обновляются так же, как при save() и delete().
+"""
+from django.db import DEFAULT_DB_ALIAS, connection
+from django.db.models.signals import post_delete, post_save
+
+from .models import Favorite, Follow, ShoppingCart
+
+# Модель связи: (поле владельца, поле цели, поле времени добавления).
+RELATIONS = {
+    Favorite: ('user', 'recipe', 'created_at'),
+    ShoppingCart: ('user', 'recipe', 'created_at'),
+    Follow: ('follower', 'following', None),
+}
+
+
+def _columns(model):
+    owner, target, added_at = (
+        model._meta.get_field(name) if name else None for name in RELATIONS[model]
+    )
+    return owner, target, added_at, target.related_model
+
+
+def _instance(model, link_id, owner, owner_id, target, target_id, added_at, added_value):
+    values = {owner.attname: owner_id, target.attname: target_id}
+    if added_at is not None:
+        values[added_at.attname] = added_value
+    return model(id=link_id, **values)
+
+
+def link(model, owner_id, target_id, target_values=('id',)):
+    """Создаёт связь.
+
+    Возвращает (target_row, created): target_row — словарь target_values
+    цели или None, если цели нет; created — была ли связь создана сейчас.
+    """
+    owner, target, added_at, target_model = _columns(model)
+    target_table = target_model._meta.db_table
+    values = ', '.join(f'target.{name}' for name in target_values)
+    # Время добавления — now() транзакции, оно же попадает в популярность.
+    added_column = f', {added_at.column}' if added_at else ''
+    added_value = ', now()' if added_at else ''
+    returned = f'inserted.{added_at.column}' if added_at else 'NULL'
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'WITH target AS (SELECT * FROM {target_table} WHERE id = %s), '
+            f'inserted AS (INSERT INTO {model._meta.db_table} '
+            f'({owner.column}, {target.column}{added_column}) '
+            f'SELECT %s, id{added_value} FROM target '
+            'ON CONFLICT DO NOTHING RETURNING *) '
+            f'SELECT inserted.id, {returned}, {values} FROM target LEFT JOIN inserted ON TRUE',
+            [target_id, owner_id],
+        )
+        row = cursor.fetchone()
+    if row is None:
+        return None, False
+    link_id, added, *target_row = row
+    if link_id is not None:
+        post_save.send(
+            sender=model,
+            instance=_instance(
+                model, link_id, owner, owner_id, target, target_id, added_at, added
+            ),
+            created=True,
+            update_fields=None,
+            raw=False,
+            using=DEFAULT_DB_ALIAS,
+        )
+    return dict(zip(target_values, target_row)), link_id is not None
+
+
+def unlink(model, owner_id, target_id):
+    """Удаляет связь. Возвращает (цель существует, связь была удалена)."""
+    owner, target, added_at, target_model = _columns(model)
+    returned = f'deleted.{added_at.column}' if added_at else 'NULL'
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'WITH deleted AS (DELETE FROM {model._meta.db_table} '
+            f'WHERE {owner.column} = %s AND {target.column} = %s RETURNING *) '
+            f'SELECT EXISTS (SELECT 1 FROM {target_model._meta.db_table} WHERE id = %s), '
+            f'deleted.id, {returned} FROM (SELECT 1) AS one LEFT JOIN deleted ON TRUE',
+            [owner_id, target_id, target_id],
+        )
+        exists, link_id, added = cursor.fetchone()
+    if link_id is not None:
+        post_delete.send(
+            sender=model,
+            instance=_instance(
+                model, link_id, owner, owner_id, target, target_id, added_at, added
+            ),
+            using=DEFAULT_DB_ALIAS,
+            origin=None,
+        )
+    return exists, link_id is not None
@@ -0,0 +1,201 @@
+"""Рейтинг популярных рецептов за окно: 1h, 24h, 7d.
+
+Потребитель outbox (consume) складывает веса взаимодействий в минутные
+корзины TrendingBucket. rollup() сворачивает закрытые часы минутных корзин
+в часовые, закрытые сутки часовых — в суточные и удаляет корзины, которые
+больше не нужны. Граница свёртки каждого уровня хранится в TrendingRollup,
+поэтому окно складывается из неперекрывающихся частей, например для 7d:
+суточные корзины до границы суток, часовые до границы часов и минутные
+после неё. Событие, пришедшее после свёртки своего часа, добавляется сразу
+и в часовую (и суточную) корзину.
+
+Рейтинг каждого окна (TOP_K рецептов, отбор кучей по потоку сумм из базы)
+пересчитывается в rollup() и хранится в TrendingEntry: чтение — это K строк
+по индексу, а в процессе список ещё и кешируется на TRENDING_CACHE_SECONDS.
+Всё состояние в базе, перезапуск процессов ничего не теряет.
+"""
+import heapq
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Q, Sum
+from django.utils import timezone
+
+from .models import (
+    OutboxEvent, Recipe, TrendingBucket, TrendingEntry, TrendingRollup,
+)
+
+MINUTE = TrendingBucket.Resolution.MINUTE
+HOUR = TrendingBucket.Resolution.HOUR
+DAY = TrendingBucket.Resolution.DAY
+STEPS = {
+    MINUTE: timedelta(minutes=1),
+    HOUR: timedelta(hours=1),
+    DAY: timedelta(days=1),
+}
+# Окно: длина и самая крупная корзина, из которой его можно собрать.
+WINDOWS = {
+    '1h': (timedelta(hours=1), MINUTE),
+    '24h': (timedelta(hours=24), HOUR),
+    '7d': (timedelta(days=7), DAY),
+}
+EVENT_WEIGHTS = {
+    OutboxEvent.Type.FAVORITE_ADDED: ('favorite', 1),
+    OutboxEvent.Type.FAVORITE_REMOVED: ('favorite', -1),
+    OutboxEvent.Type.SHOPPING_CART_ADDED: ('shopping_cart', 1),
+    OutboxEvent.Type.SHOPPING_CART_REMOVED: ('shopping_cart', -1),
+}
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+_cache = {}
+
+
+def floor(moment, resolution):
+    moment = moment.astimezone(dt_timezone.utc)
+    if resolution == MINUTE:
+        return moment.replace(second=0, microsecond=0)
+    if resolution == HOUR:
+        return moment.replace(minute=0, second=0, microsecond=0)
+    return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def locked_state():
+    """Границы свёртки {HOUR: ..., DAY: ...}; блокирует их до конца транзакции."""
+    for resolution in (HOUR, DAY):
+        TrendingRollup.objects.get_or_create(
+            resolution=resolution, defaults={'rolled_until': EPOCH}
+        )
+    return {
+        state.resolution: state.rolled_until
+        for state in TrendingRollup.objects.select_for_update().order_by('resolution')
+    }
+
+
+def add_scores(increments):
+    """Прибавляет {(resolution, start, recipe_id): вес} к корзинам одним запросом."""
+    if not increments:
+        return
+    table = TrendingBucket._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {table} (resolution, start, recipe_id, score) VALUES "
+            + ", ".join(["(%s, %s, %s, %s)"] * len(increments))
+            + " ON CONFLICT (resolution, start, recipe_id) DO UPDATE "
+            f"SET score = {table}.score + EXCLUDED.score",
+            [value for key, score in increments.items() for value in (*key, score)],
+        )
+
+
+def consume(events):
+    """Обработчик outbox: добавляет избранное и корзину в минутные корзины."""
+    weights = settings.POPULARITY_WEIGHTS
+    increments = Counter()
+    with transaction.atomic():
+        state = locked_state()
+        for event in events:
+            if event.type not in EVENT_WEIGHTS:
+                continue
+            kind, sign = EVENT_WEIGHTS[event.type]
+            weight = sign * weights[kind]
+            minute = floor(event.created_at, MINUTE)
+            increments[(MINUTE, minute, event.recipe_id)] += weight
+            if minute < state[HOUR]:
+                increments[(HOUR, floor(minute, HOUR), event.recipe_id)] += weight
+            if minute < state[DAY]:
+                increments[(DAY, floor(minute, DAY), event.recipe_id)] += weight
+        add_scores(increments)
+
+
+def roll(source, target, since, until):
+    """Сворачивает корзины source из [since, until) в корзины target."""
+    if since >= until:
+        return
+    table = TrendingBucket._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {table} (resolution, start, recipe_id, score) "
+            f"SELECT %s, date_trunc(%s, start), recipe_id, SUM(score) FROM {table} "
+            "WHERE resolution = %s AND start >= %s AND start < %s "
+            "GROUP BY 2, 3 "
+            "ON CONFLICT (resolution, start, recipe_id) DO UPDATE "
+            f"SET score = {table}.score + EXCLUDED.score",
+            [target, target, source, since, until],
+        )
+
+
+def window_buckets(window, state, now):
+    """Корзины, из которых складывается окно, без пересечений по времени."""
+    length, resolution = WINDOWS[window]
+    start = floor(now, resolution) - length + STEPS[resolution]
+    hours_until, days_until = state[HOUR], state[DAY]
+    parts = Q(resolution=MINUTE, start__gte=start)
+    if resolution in (HOUR, DAY):
+        parts = Q(resolution=MINUTE, start__gte=max(start, hours_until))
+        hours_since = start if resolution == HOUR else max(start, days_until)
+        parts |= Q(resolution=HOUR, start__gte=hours_since, start__lt=hours_until)
+    if resolution == DAY:
+        parts |= Q(resolution=DAY, start__gte=start, start__lt=days_until)
+    return TrendingBucket.objects.filter(parts)
+
+
+def rollup(now=None, top_k=None):
+    """Сворачивает корзины, удаляет устаревшие и пересчитывает рейтинги."""
+    now = now or timezone.now()
+    top_k = top_k or settings.TRENDING_TOP_K
+    with transaction.atomic():
+        state = locked_state()
+        hours_until = max(state[HOUR], floor(now, HOUR))
+        roll(MINUTE, HOUR, state[HOUR], hours_until)
+        days_until = max(state[DAY], floor(hours_until, DAY))
+        roll(HOUR, DAY, state[DAY], days_until)
+        TrendingRollup.objects.filter(resolution=HOUR).update(rolled_until=hours_until)
+        TrendingRollup.objects.filter(resolution=DAY).update(rolled_until=days_until)
+        state = {HOUR: hours_until, DAY: days_until}
+
+        # Корзина нужна, пока она не свёрнута или попадает в своё окно.
+        deleted = TrendingBucket.objects.filter(
+            Q(resolution=MINUTE,
+              start__lt=min(hours_until, floor(now, MINUTE) - timedelta(minutes=59)))
+            | Q(resolution=HOUR,
+                start__lt=min(days_until, floor(now, HOUR) - timedelta(hours=23)))
+            | Q(resolution=DAY, start__lt=floor(now, DAY) - timedelta(days=6))
+        ).delete()[0]
+
+        leaders = {}
+        for window in WINDOWS:
+            totals = (
+                window_buckets(window, state, now)
+                .filter(recipe_id__in=Recipe.objects.values('id'))
+                .values_list('recipe_id')
+                .annotate(total=Sum('score'))
+                .filter(total__gt=0)
+                .order_by()
+                .iterator(chunk_size=2000)
+            )
+            leaders[window] = heapq.nlargest(
+                top_k, totals, key=lambda row: (row[1], row[0])
+            )
+            TrendingEntry.objects.filter(window=window).delete()
+            TrendingEntry.objects.bulk_create([
+                TrendingEntry(window=window, rank=rank, recipe_id=recipe_id, score=score)
+                for rank, (recipe_id, score) in enumerate(leaders[window], 1)
+            ])
+    return deleted, leaders
+
+
+def leaderboard(window):
+    """[(recipe_id, score)] рейтинга окна, с кешем в памяти процесса."""
+    cached = _cache.get(window)
+    now = time.monotonic()
+    if cached and cached[0] > now:
+        return cached[1]
+    entries = list(
+        TrendingEntry.objects.filter(window=window)
+        .order_by('rank')
+        .values_list('recipe_id', 'score')
+    )
+    _cache[window] = (now + settings.TRENDING_CACHE_SECONDS, entries)
+    return entries